@@ -0,0 +1,62 @@
+# Benchmark of the artist matching: the former per-file loop over re.match against the precompiled ArtistMatcher
+# Usage: python benchmarks/bench_artist.py --names 1000000
+import argparse
+import random
+import re
+import time
+
+from criteriaSorter.modules.fileops import ArtistHandler, _guess_artist_regex
+
+
+def make_names(count, seed=0):
+    """
+    Make a synthetic corpus of file names, a third "artist - title", a third "title by artist", a third without artist
+    :param count: the number of names
+    :param seed: the random seed, for a reproducible corpus
+    :return: list of file names
+    """
+    rand = random.Random(seed)
+    names = []
+    for i in range(count):
+        pattern = rand.randrange(3)
+        if pattern == 0:
+            names.append("Artist{} - picture {}.jpg".format(rand.randrange(5000), i))
+        elif pattern == 1:
+            names.append("picture {} by Artist{}.png".format(i, rand.randrange(5000)))
+        else:
+            names.append("IMG_{:08d}.jpg".format(i))
+    return names
+
+
+def legacy_match(file_name, regex_list):
+    """The matching as it was done before ArtistMatcher: a copy of the regexes per file, and re.match on each"""
+    regex_list = regex_list.copy()
+    for r in regex_list:
+        m = re.match(r, file_name)
+        if m:
+            return m.group("artist").strip(" "), m.group("file_name").strip(" ")
+    return None
+
+
+def bench(name, names, function):
+    start = time.perf_counter()
+    matched = sum(1 for file_name in names if function(file_name) is not None)
+    elapsed = time.perf_counter() - start
+    print("{:<10} {:>9} matched {:>8.2f}s {:>12.0f} names/s".format(name, matched, elapsed, len(names) / elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the artist matching")
+    parser.add_argument("--names", type=int, default=1000000)
+    args = parser.parse_args()
+
+    names = make_names(args.names)
+    regex_list = [regex for regex, literal in _guess_artist_regex]
+    legacy = bench("legacy", names, lambda file_name: legacy_match(file_name, regex_list))
+    matcher = bench("matcher", names, ArtistHandler.matcher.match)
+    print("speedup: {:.2f}x".format(legacy / matcher))
+
+
+if __name__ == "__main__":
+    main()
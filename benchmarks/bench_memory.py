@@ -0,0 +1,77 @@
+# Benchmark of the memory used per handler, against the former handlers storing every path component in a __dict__
+# The handlers are built from a scan of a generated tree, like a sort builds them, so what they keep of the DirEntry is counted
+# Usage: python benchmarks/bench_memory.py --files 1000000
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from criteriaSorter.modules.fileops import DirectoryHandler, FileHandler, ArtistHandler, TYPE_BY_EXTENTION
+
+
+class DictFileHandler:
+    """The attributes the handlers had before they used __slots__"""
+
+    def __init__(self, file_path, entry=None):
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.dir_path = os.path.dirname(file_path)
+        self.name = self.file_name
+        self.base_name, self.extension = os.path.splitext(self.file_name)
+        self.type = TYPE_BY_EXTENTION.get(self.extension[1:])
+        self.future_name = None
+
+
+def make_tree(root, count):
+    """
+    Create empty files in root, in 100 folders
+    :param root: the directory of the tree
+    :param count: the number of files
+    :return: None
+    """
+    for i in range(count):
+        folder = os.path.join(root, "folder{}".format(i % 100))
+        if i < 100:
+            os.mkdir(folder)
+        open(os.path.join(folder, "Artist{} - picture {}.jpg".format(i % 5000, i)), "w").close()
+
+
+def measure(name, root, Handler=None):
+    """
+    Measure the memory kept by the handlers of the files of a tree, built from a recursive scan
+    :param name: the name of the measure
+    :param root: the directory of the tree
+    :param Handler: the handler class, or None to only keep the paths of the files
+    :return: the number of bytes per file
+    """
+    gc.collect()
+    tracemalloc.start()
+    entries = DirectoryHandler(root).scan(recursive=True)
+    if Handler is None:
+        handlers = [entry.path for entry in entries]
+    else:
+        handlers = [Handler(entry.path, entry=entry) for entry in entries]
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_handler = current / len(handlers)
+    print("{:<16} {:>10.1f} MB {:>8.0f} bytes/file (peak {:.1f} MB)".format(name, current / 2 ** 20, per_handler, peak / 2 ** 20))
+    return per_handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory used per handler")
+    parser.add_argument("--files", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, args.files)
+        paths = measure("paths only", root)
+        for name, Handler in [("dict handler", DictFileHandler), ("FileHandler", FileHandler), ("ArtistHandler", ArtistHandler)]:
+            per_handler = measure(name, root, Handler)
+            print("{:<16} {:>22.0f} bytes/file more than the paths".format("", per_handler - paths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Benchmark of the sorting engines: serial sort_handlers against sort_in_processes with N workers
+# Usage: python benchmarks/bench_sorting.py --files 100000 --workers 2 4 8
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from criteriaSorter.modules import criteriaSorter
+from criteriaSorter.modules.fileops import ArtistHandler
+
+_EXTENSIONS = ["jpg", "png", "mp4", "mkv", "mp3", "flac", "pdf", "txt", "zip", "unknown"]
+_CONFIG = os.path.join(os.path.dirname(__file__), os.pardir, "config.yaml")
+
+
+def make_files(directory, count, seed=0):
+    """
+    Create empty files with a mix of artist patterns and extensions
+    :param directory: the directory to create the files in
+    :param count: the number of files
+    :param seed: the random seed, for reproducible names
+    :return: list of the file paths
+    """
+    rand = random.Random(seed)
+    file_paths = []
+    for i in range(count):
+        extension = rand.choice(_EXTENSIONS)
+        pattern = rand.randrange(3)
+        if pattern == 0:
+            name = "Artist{} - picture {}.{}".format(rand.randrange(500), i, extension)
+        elif pattern == 1:
+            name = "picture {} by Artist{}.{}".format(i, rand.randrange(500), extension)
+        else:
+            name = "file_{}.{}".format(i, extension)
+        file_path = os.path.join(directory, name)
+        open(file_path, "w").close()
+        file_paths.append(file_path)
+    return file_paths
+
+
+def bench(name, count, function):
+    start = time.perf_counter()
+    sorted_count = sum(1 for handler in function() if handler.future_name is not None)
+    elapsed = time.perf_counter() - start
+    print("{:<12} {:>8} files to move {:>8.2f}s {:>12.0f} files/s".format(name, sorted_count, elapsed, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the serial and multiprocess sorting engines")
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    config = criteriaSorter.load_config(_CONFIG)
+    operations_config = criteriaSorter.load_operations("default_operations", config)
+    operation_list = criteriaSorter.create_operation_list(operations_config, ArtistHandler)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = make_files(directory, args.files)
+        bench("serial", args.files, lambda: criteriaSorter.sort_handlers(
+            criteriaSorter.generate_handlers_from_paths(file_paths, ArtistHandler), operation_list, None))
+        for workers in args.workers:
+            bench("{} workers".format(workers), args.files, lambda: criteriaSorter.sort_in_processes(
+                file_paths, ArtistHandler, operation_list, None, workers, chunk_size=args.chunk_size))
+
+
+if __name__ == "__main__":
+    main()
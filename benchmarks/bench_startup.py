@@ -0,0 +1,73 @@
+# Benchmark of the startup of the CLI: the time to import it, and to run the quick commands spawned by scripts,
+# with the config cache cold (the YAML is parsed) and warm (it is read from the cache)
+# Usage: python benchmarks/bench_startup.py --runs 20
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "config.yaml")
+_IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def run(command, environment, runs):
+    """
+    Run a command again and again
+    :param command: the command line
+    :param environment: the environment of the command
+    :param runs: the number of runs
+    :return: the median time of a run, in seconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def import_times(environment, top=10):
+    """
+    The slowest imports of the CLI module, from python -X importtime
+    :param environment: the environment of the command
+    :param top: the number of imports shown
+    :return: list of (cumulative microseconds, module), the slowest first
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import criteriaSorter.modules.criteriaSorter"],
+                            env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = [(int(match.group(2)), match.group(3)[1:] + match.group(4)) for match in map(_IMPORT_TIME.match, result.stderr.splitlines()) if match]
+    return sorted(times, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup of the CLI")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--config", default=_CONFIG)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        environment = dict(os.environ, CRITERIASORTER_CACHE_DIR=cache_directory)
+        no_cache = dict(os.environ, CRITERIASORTER_CACHE_DIR="")
+        cli = [sys.executable, "-m", "criteriaSorter"]
+        commands = [
+            ("python", [sys.executable, "-c", "pass"], environment),
+            ("import", [sys.executable, "-c", "import criteriaSorter.modules.criteriaSorter"], environment),
+            ("--version", cli + ["--version"], environment),
+            ("list (no cache)", cli + ["--config", args.config, "list"], no_cache),
+            ("list (cached)", cli + ["--config", args.config, "list"], environment),
+        ]
+        subprocess.run(cli + ["--config", args.config, "list"], env=environment, stdout=subprocess.DEVNULL, check=True)  # Fill the cache
+        for name, command, command_environment in commands:
+            print("{:<16} {:>8.1f} ms".format(name, 1000 * run(command, command_environment, args.runs)))
+
+        print("\nSlowest imports (cumulative):")
+        for microseconds, module in import_times(environment):
+            print("{:>8.1f} ms  {}".format(microseconds / 1000, module))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# Benchmark suite of the hot paths, on a reproducible synthetic tree: each phase is timed separately, and can be
+# compared against a baseline to catch the regressions
+# Usage: python benchmarks/suite.py --files 100000 --depth 3 --save-baseline baseline.json
+#        python benchmarks/suite.py --files 100000 --depth 3 --baseline baseline.json --tolerance 0.15
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from argparse import Namespace
+
+from criteriaSorter.modules import criteriaSorter
+from criteriaSorter.modules.fileops import DirectoryHandler, ArtistHandler
+
+_CONFIG = os.path.join(os.path.dirname(__file__), os.pardir, "config.yaml")
+_DEFAULT_EXTENSIONS = "jpg=4,png=2,mp4=2,mkv=1,mp3=2,flac=1,pdf=1,txt=1,zip=1,unknown=1"
+_TMPFS = "/dev/shm"
+
+
+def parse_mix(mix):
+    """
+    Parse an extension mix
+    :param mix: "jpg=4,mp4=1", the weight of each extension
+    :return: (extensions, weights)
+    """
+    extensions, weights = [], []
+    for item in mix.split(","):
+        extension, _, weight = item.partition("=")
+        extensions.append(extension.strip())
+        weights.append(float(weight or 1))
+    return extensions, weights
+
+
+def make_name(rand, i, extension, artists, artist_ratio):
+    """A file name, with an artist in one of the patterns the ArtistHandler knows for artist_ratio of them"""
+    if rand.random() >= artist_ratio:
+        return "IMG_{:08d}.{}".format(i, extension)
+    artist = "Artist{}".format(rand.randrange(artists))
+    if rand.randrange(2):
+        return "{} - picture {}.{}".format(artist, i, extension)
+    return "picture {} by {}.{}".format(i, artist, extension)
+
+
+def make_tree(root, files, depth=0, fanout=4, extensions=_DEFAULT_EXTENSIONS, artists=500, artist_ratio=0.66,
+              min_size=0, max_size=0, seed=0):
+    """
+    Create a reproducible synthetic tree
+    :param root: the directory to create the tree in
+    :param files: the number of files
+    :param depth: the number of levels of subdirectories
+    :param fanout: the number of subdirectories per directory
+    :param extensions: the extension mix, see parse_mix
+    :param artists: the number of distinct artists
+    :param artist_ratio: the share of the files with an artist in their name
+    :param min_size: the minimum size of the files, in bytes
+    :param max_size: the maximum size of the files, in bytes
+    :param seed: the random seed
+    :return: list of the directories of the tree
+    """
+    rand = random.Random(seed)
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, "dir{}".format(i)) for parent in level for i in range(fanout)]
+        directories.extend(level)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    extension_list, weights = parse_mix(extensions)
+    for i in range(files):
+        extension = rand.choices(extension_list, weights)[0]
+        file_path = os.path.join(rand.choice(directories), make_name(rand, i, extension, artists, artist_ratio))
+        with open(file_path, "wb") as f:
+            size = rand.randint(min_size, max_size) if max_size else 0
+            if size:
+                f.truncate(size)  # Sparse, the size is what matters to the conditions
+    return directories
+
+
+def measure(function, trace):
+    """
+    Run a phase
+    :param function: the phase, returns its number of items
+    :param trace: measure the peak memory with tracemalloc (slower, so not done on the timed run)
+    :return: (result, seconds, peak memory in bytes or None)
+    """
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_phases(root, output, operation_list, jobs, trace):
+    """
+    Run every phase on the tree, the moves last as they empty it
+    :return: dict of phase -> {"files", "seconds", "peak"}
+    """
+    state = {}
+
+    def scan():
+        state["entries"] = list(DirectoryHandler(root).scan(recursive=True))
+        return len(state["entries"])
+
+    def create_handlers():
+        state["handlers"] = list(criteriaSorter.generate_handlers(state["entries"], ArtistHandler))
+        return len(state["handlers"])
+
+    def guess_artists():
+        return len([handler.guess_artist_and_file_name() for handler in state["handlers"]])
+
+    def sort():
+        state["sorted"] = [handler for handler in criteriaSorter.sort_handlers(state["handlers"], operation_list, None) if handler.future_name]
+        return len(state["handlers"])
+
+    def move():
+        return len(criteriaSorter.execute_moves(state["sorted"], Namespace(dry_run=False, jobs=jobs), output))
+
+    phases = [("get_files", scan), ("create_handler_list", create_handlers), ("guess_artist", guess_artists), ("sort", sort),
+              ("execute_moves", move)]
+    results = {}
+    for name, function in phases:
+        files, seconds, peak = measure(function, trace)
+        results[name] = {"files": files, "seconds": seconds, "peak": peak}
+    return results
+
+
+def run_suite(args, operation_list, trace):
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        root, output = os.path.join(directory, "inbox"), os.path.join(directory, "sorted")
+        make_tree(root, args.files, args.depth, args.fanout, args.extensions, args.artists, args.artist_ratio,
+                  args.min_size, args.max_size, args.seed)
+        return run_phases(root, output, operation_list, args.jobs, trace)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare the results with a baseline
+    :param results: the results of the suite
+    :param baseline: the results of a previous run
+    :param tolerance: the relative slowdown (or memory increase) allowed
+    :return: list of the regressions, as messages
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        rate, reference_rate = result["files"] / result["seconds"], reference["files"] / reference["seconds"]
+        if rate < reference_rate * (1 - tolerance):
+            regressions.append("{}: {:.0f} files/s, baseline {:.0f} files/s".format(name, rate, reference_rate))
+        if result.get("peak") and reference.get("peak") and result["peak"] > reference["peak"] * (1 + tolerance):
+            regressions.append("{}: peak {:.1f} MB, baseline {:.1f} MB".format(name, result["peak"] / 2 ** 20, reference["peak"] / 2 ** 20))
+    return regressions
+
+
+def report(results):
+    print("{:<20} {:>9} {:>10} {:>14} {:>10}".format("phase", "files", "seconds", "files/s", "peak MB"))
+    for name, result in results.items():
+        peak = "{:.1f}".format(result["peak"] / 2 ** 20) if result.get("peak") is not None else "-"
+        print("{:<20} {:>9} {:>10.3f} {:>14.0f} {:>10}".format(name, result["files"], result["seconds"],
+                                                               result["files"] / result["seconds"], peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths on a synthetic tree")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--depth", type=int, default=2, help="Levels of subdirectories")
+    parser.add_argument("--fanout", type=int, default=4, help="Subdirectories per directory")
+    parser.add_argument("--extensions", default=_DEFAULT_EXTENSIONS, help="Extension mix, as ext=weight,...")
+    parser.add_argument("--artists", type=int, default=500, help="Number of distinct artists")
+    parser.add_argument("--artist-ratio", type=float, default=0.66, help="Share of the names with an artist")
+    parser.add_argument("--min-size", type=int, default=0)
+    parser.add_argument("--max-size", type=int, default=0, help="Maximum file size in bytes (files are sparse)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=1, help="Threads moving the files")
+    parser.add_argument("--dir", default=None, help="Where to create the tree (default: the temp dir)")
+    parser.add_argument("--tmpfs", action="store_true", help="Create the tree in " + _TMPFS)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory run")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write the results as the baseline JSON file")
+    parser.add_argument("--baseline", help="Compare against this baseline JSON file, exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative regression allowed")
+    args = parser.parse_args()
+    if args.tmpfs:
+        args.dir = _TMPFS
+    logging.basicConfig(level=logging.ERROR)
+
+    config = criteriaSorter.load_config(_CONFIG)
+    operation_list = criteriaSorter.create_operation_list(criteriaSorter.load_operations("default_operations", config), ArtistHandler)
+
+    results = run_suite(args, operation_list, trace=False)
+    if not args.no_memory:  # Same tree again, traced
+        for name, result in run_suite(args, operation_list, trace=True).items():
+            results[name]["peak"] = result["peak"]
+    report(results)
+
+    document = {"parameters": {key: value for key, value in vars(args).items() if key not in ("output", "save_baseline", "baseline")},
+                "results": results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(document, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regression against {}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
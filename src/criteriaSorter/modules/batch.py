@@ -0,0 +1,220 @@
+# Batch classification: a directory listing is loaded into columns, and each operation is evaluated column by column
+# instead of through a chain of method calls per file. The destinations are the same as with FileHandler.sort
+import logging
+import os
+
+from array import array
+from os import stat_result
+from typing import Optional, Tuple
+
+from criteriaSorter.modules.fileops import FileHandler, ArtistHandler, TYPE_BY_EXTENTION
+
+_TYPE_CONDITIONS = {
+    "is_image": "image",
+    "is_picture": "image",
+    "is_video": "video",
+    "is_music": "music",
+    "is_audio": "music",
+    "is_document": "document",
+    "is_unknown": None,
+}
+
+_SIZE_CONDITIONS = {
+    "is_bigger_than": (1, False),
+    "is_smaller_than": (1, True),
+    "is_bigger_than_mb": (1024 * 1024, False),
+    "is_smaller_than_mb": (1024 * 1024, True),
+}
+
+
+_NO_STAT = stat_result((0,) * 10)
+_UNTYPED = object()
+
+
+class FileTable:
+    """
+    A directory listing as columns: paths and names, and the extensions, types, sizes, mtimes and artists
+    computed at once for the rows a condition is evaluated on, so the files already classified are never stat'ed
+    """
+
+    def __init__(self, paths, Handler=FileHandler, entries=None):
+        """
+        :param paths: the paths of the files
+        :param Handler: the handler the operations were compiled for
+        :param entries: the os.DirEntry of the files, if they come from a scan, to reuse their stat
+        """
+        self.paths = list(paths)
+        self.names = [os.path.basename(path) for path in self.paths]
+        self.Handler = Handler
+        self._entries = entries
+        self._types = None
+        self._stats: Optional[Tuple["array[int]", "array[float]", bytearray]] = None  # sizes, mtimes, and the rows stat'ed
+        self._artists = None
+        self._handlers = {}
+        self.errors = set()  # The rows that could not be sorted, they are skipped like with sort_handlers
+
+    @classmethod
+    def from_entries(cls, entries, Handler=FileHandler):
+        entries = list(entries)
+        return cls([entry.path for entry in entries], Handler, entries)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _stat(self, i):
+        try:
+            return self._entries[i].stat() if self._entries is not None else os.stat(self.paths[i])
+        except OSError as e:
+            self.error(i, e)
+            return _NO_STAT
+
+    def error(self, i, e):
+        logging.error("[File sorting] Could not sort {}".format(self.names[i]))
+        logging.error(e)
+        logging.debug(e, exc_info=True)
+        self.errors.add(i)
+
+    def types(self, rows):
+        """
+        :param rows: the indices of the rows whose type is needed
+        :return: the column of the types, only filled for the rows asked so far
+        """
+        if self._types is None:
+            self._types = [_UNTYPED] * len(self)
+        types, sniff = self._types, self.Handler.sniff is not None  # The content of some files is needed, see FileHandler.type
+        for i in rows:
+            if types[i] is _UNTYPED:
+                types[i] = self.handler(i).type if sniff else TYPE_BY_EXTENTION.get(os.path.splitext(self.names[i])[1][1:].lower())
+        return types
+
+    def stat_rows(self, rows):
+        """
+        Stat the files of the rows not stat'ed yet, the errors are only reported for these rows
+        :param rows: the indices of the rows
+        :return: (sizes, mtimes) columns, only filled for the rows stat'ed so far
+        """
+        if self._stats is None:
+            self._stats = array("q", bytes(8 * len(self))), array("d", bytes(8 * len(self))), bytearray(len(self))
+        sizes, mtimes, stated = self._stats
+        for i in rows:
+            if not stated[i]:
+                stat = self._stat(i)
+                sizes[i], mtimes[i], stated[i] = stat.st_size, stat.st_mtime, 1
+        return sizes, mtimes
+
+    def sizes(self, rows):
+        """
+        :param rows: the indices of the rows whose size is needed
+        :return: the column of the sizes, only filled for the rows asked so far
+        """
+        return self.stat_rows(rows)[0]
+
+    def mtimes(self, rows):
+        """
+        :param rows: the indices of the rows whose mtime is needed
+        :return: the column of the mtimes, only filled for the rows asked so far
+        """
+        return self.stat_rows(rows)[1]
+
+    @property
+    def artists(self):
+        if self._artists is None:
+            match = self.Handler.matcher.match
+            self._artists = [match(name) is not None for name in self.names]
+        return self._artists
+
+    def handler(self, i):
+        """The handler of a file, created only for the conditions that can't be evaluated on the columns"""
+        handler = self._handlers.get(i)
+        if handler is None:
+            entry = self._entries[i] if self._entries is not None else None
+            handler = self._handlers[i] = self.Handler(self.paths[i], entry=entry)
+        return handler
+
+
+def is_builtin(condition, Handler):
+    """Whether a condition is the FileHandler (or ArtistHandler) one, and not overridden by the Handler"""
+    builtin = getattr(ArtistHandler if issubclass(Handler, ArtistHandler) else FileHandler, condition.name, None)
+    return builtin is not None and condition.function is builtin
+
+
+def filter_rows(table, rows, condition):
+    """
+    Keep the rows that fill a condition
+    :param table: the FileTable
+    :param rows: the indices of the rows still to classify
+    :param condition: the compiled Condition
+    :return: the indices of the rows that fill the condition
+    """
+    name, args = condition.name, condition.args
+    if is_builtin(condition, table.Handler):
+        if name in _TYPE_CONDITIONS or name == "is_type":
+            file_type = args[0] if name == "is_type" else _TYPE_CONDITIONS[name]
+            types = table.types(rows)
+            return [i for i in rows if types[i] == file_type]
+        if name in _SIZE_CONDITIONS:
+            unit, smaller = _SIZE_CONDITIONS[name]
+            limit, sizes = int(args[0]) * unit, table.sizes(rows)
+            if smaller:
+                return [i for i in rows if sizes[i] < limit]
+            return [i for i in rows if sizes[i] > limit]
+        if name == "has_artist" and issubclass(table.Handler, ArtistHandler):
+            artists = table.artists
+            return [i for i in rows if artists[i]]
+    kept = []
+    for i in rows:  # No column for this condition, evaluated on the handler of each file
+        try:
+            if condition(table.handler(i)):
+                kept.append(i)
+        except Exception as e:
+            table.error(i, e)
+    return kept
+
+
+def classify(table, operation_list, default_destination=None):
+    """
+    Find the destination of every file of the table, the first operation matching a file wins
+    :param table: the FileTable
+    :param operation_list: the list of compiled operations
+    :param default_destination: the destination of the files no operation matched
+    :return: list of (file_path, future_name), without the files that could not be sorted
+    """
+    future_names = [default_destination] * len(table)
+    remaining = list(range(len(table)))
+    errors = table.errors
+    for operation in operation_list:
+        rows = remaining
+        for condition in operation.conditions:
+            if not rows:
+                break
+            rows = filter_rows(table, rows, condition)
+            if errors:
+                rows = [i for i in rows if i not in errors]
+        for i in rows:
+            future_names[i] = operation.destination
+        matched = set(rows)
+        remaining = [i for i in remaining if i not in matched and i not in errors]
+    if logging.getLogger().isEnabledFor(logging.WARNING):
+        for i in remaining:
+            logging.warning("The file {} doesn't meet any criteria, reverting to default".format(table.names[i]))
+    return [(table.paths[i], future_names[i]) for i in range(len(table)) if i not in errors]
+
+
+def sort_in_batches(entries, Handler, operation_list, default_destination=None, batch_size=100000):
+    """
+    Classify a directory scan batch by batch
+    :param entries: an iterable of os.DirEntry (can be a generator)
+    :param Handler: the handler the operations were compiled for
+    :param operation_list: the list of compiled operations
+    :param default_destination: the destination of the files no operation matched
+    :param batch_size: the number of files loaded in a table at once
+    :return: generator of (file_path, future_name)
+    """
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield from classify(FileTable.from_entries(batch, Handler), operation_list, default_destination)
+            batch = []
+    if batch:
+        yield from classify(FileTable.from_entries(batch, Handler), operation_list, default_destination)
@@ -0,0 +1,79 @@
+# Cache of the parsed config files, so the CLI started again and again with the same config doesn't parse its YAML
+# (nor import yaml) every time. An entry is only used while the config file keeps its path, size, mtime and inode
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import time
+
+_CACHE_FORMAT = 1
+_RACY_SECONDS = 2  # A config changed this recently could change again within the same mtime, it is not cached yet
+
+
+def default_cache_directory():
+    """
+    The directory of the config cache: $CRITERIASORTER_CACHE_DIR, or criteriaSorter in $XDG_CACHE_HOME (~/.cache)
+    :return: the path of the directory, or None if the cache is disabled (CRITERIASORTER_CACHE_DIR set but empty)
+    """
+    directory = os.environ.get("CRITERIASORTER_CACHE_DIR")
+    if directory is not None:
+        return directory or None
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "criteriaSorter")
+
+
+def config_key(config_file):
+    """
+    The key of a config file in the cache
+    :param config_file: the path of the config file
+    :return: (absolute path, size, mtime_ns, inode)
+    :raises OSError: if the config file can't be found
+    """
+    stat_result = os.stat(config_file)
+    return os.path.abspath(config_file), stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino
+
+
+def cache_path(key, cache_directory):
+    name = hashlib.sha1(key[0].encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(cache_directory, name + ".marshal")
+
+
+def read_config_cache(key, cache_directory):
+    """
+    Read a parsed config from the cache
+    :param key: the config_key of the config file
+    :param cache_directory: the directory of the cache, or None
+    :return: the config, or None if it is not in the cache or the config file changed since
+    """
+    if cache_directory is None:
+        return None
+    try:
+        with open(cache_path(key, cache_directory), "rb") as f:
+            cache_format, version, cached_key, config = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if (cache_format, version, cached_key) != (_CACHE_FORMAT, sys.version_info[:2], list(key)):
+        return None
+    return config
+
+
+def write_config_cache(key, config, cache_directory):
+    """
+    Write a parsed config to the cache, unless it can't be (a config with dates, a read only cache directory...)
+    :param key: the config_key of the config file, taken before it was read
+    :param config: the parsed config
+    :param cache_directory: the directory of the cache, or None
+    :return: None
+    """
+    if cache_directory is None or time.time() - key[2] / 1e9 < _RACY_SECONDS:
+        return
+    path = cache_path(key, cache_directory)
+    try:
+        data = marshal.dumps((_CACHE_FORMAT, sys.version_info[:2], list(key), config))
+        os.makedirs(cache_directory, exist_ok=True)
+        temporary_path = "{}.{}.tmp".format(path, os.getpid())  # Other runs can write the same entry at the same time
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+    except (OSError, ValueError) as e:
+        logging.debug("Config {} not cached : {}".format(key[0], e))
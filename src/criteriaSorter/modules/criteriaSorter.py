@@ -1,27 +1,67 @@
 import sys
 
-import rich.pretty
-import yaml
 import argparse
 import logging
 import os
 import time
 
-from rich.logging import RichHandler
-from criteriaSorter.modules.fileops import DirectoryHandler, FileHandler, ArtistHandler
-
-
-def load_config(config_file):
+from collections import deque
+from contextlib import nullcontext
+from functools import partial
+from itertools import islice
+from typing import Any, Deque, Dict, List, Tuple
+# rich, yaml, asyncio... are only imported by the actions needing them, the CLI is started often and should start fast
+from criteriaSorter.modules.configcache import config_key, default_cache_directory, read_config_cache, write_config_cache
+from criteriaSorter.modules.planner import COLLISION_POLICIES, MovePlanner
+from criteriaSorter.modules.journal import CancelJournal
+from criteriaSorter.modules.index import DEFAULT_INDEX_FILE
+from criteriaSorter.modules.fileops import DirectoryHandler, FileHandler, ArtistHandler, SortedFile, Operation, DestinationDirectories, DestinationTemplate
+from criteriaSorter.modules.fileops import TYPE_BY_EXTENTION, register_types
+
+_HANDLER_SETTINGS = ("sniff", "artist_regex", "artist_normalise", "artist_fuzzy")
+_PENDING_MOVES_PER_JOB = 16
+_PENDING_CHUNKS_PER_WORKER = 2
+_WATCH_LISTED_BATCH = 256  # The destination directories of bigger batches of the watch are listed, see MovePlanner
+_COPY_JOBS_HELP = 'Number of files copied at the same time when the output is on another filesystem.'
+_COLLISION_HELP = 'When a destination is taken: leave the file in place (skip), add a number to its name (suffix), ' \
+                  'or leave it in place only if it is a duplicate (hash).'
+_SORTING_WORKER: Dict[str, Any] = {}  # The Handler, operations and default destination of a sorting worker process
+
+
+def load_config(config_file, cache_directory=None):
     """
-    Load the config file
+    Load the config file, from the config cache if it didn't change since it was last parsed
     :param config_file: path to the config file
+    :param cache_directory: the directory of the config cache, see configcache.default_cache_directory by default
     :return: config (the loaded config)
     """
-    with open(config_file, 'r') as stream:
-        config = yaml.safe_load(stream)
+    if cache_directory is None:
+        cache_directory = default_cache_directory()
+    key = config_key(config_file)
+    config = read_config_cache(key, cache_directory)
+    if config is None:
+        import yaml
+        with open(config_file, 'r') as stream:
+            config = yaml.load(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))  # The C loader when libyaml is there
+        write_config_cache(key, config, cache_directory)
     return config
 
 
+class LazyRichHandler(logging.Handler):
+    """A RichHandler, only created (and rich imported) when the first record is logged"""
+
+    def __init__(self):
+        super().__init__()
+        self.handler = None
+
+    def emit(self, record):
+        if self.handler is None:
+            from rich.logging import RichHandler
+            self.handler = RichHandler()
+            self.handler.setFormatter(self.formatter)
+        self.handler.emit(record)
+
+
 def load_operations(operation_to_load, config):
     """
     Load the operations from the config file
@@ -60,65 +100,71 @@ def load_handler(handler_name):
     return Handler
 
 
-def create_handler_list(directory_handler, Handler, config):
+def generate_handlers(entries, Handler):
     """
-    Create a list of handlers for every file in the directory, recursively or not
-    :param directory_handler: The directory handler
+    Lazily create a handler for every file of a directory scan, reusing the DirEntry
+    :param entries: An iterable of os.DirEntry, from DirectoryHandler.scan
     :param Handler: The handler to use
-    :param config: The config file
-    :return: list of handlers for every file in the directory(ies)
+    :return: generator of handlers, one for every file in the directory(ies)
     """
-    handler_list = []
-    for file in directory_handler.get_files():
+    for entry in entries:
         try:
-            logging.debug("[Handler list] Processing {}".format(file))
-            file_handler = Handler(file)
-            handler_list.append(file_handler)
+            logging.debug("[Handler list] Processing {}".format(entry.path))
+            yield Handler(entry.path, entry=entry)
         except Exception as e:
-            logging.error("[Handler list] Could not load file {}".format(file))
+            logging.error("[Handler list] Could not load file {}".format(entry.path))
             logging.error(e)
             logging.debug(e, exc_info=True)
             # sys.exit(1)  # Unsure if this is the right thing to do
-    if config["general"]["recursive"]:
-        # for directory in directory_handler.get_directories():
-        #     logging.debug("[Handler list] Processing directory {}".format(directory))
-        #     directory_handler = DirectoryHandler(directory)
-        #     handler_list.extend(create_handler_list(directory_handler, Handler, operations_config, config))
-        pass
-    return handler_list
 
 
-def create_operation_list(operations_config, config):
+def create_handler_list(directory_handler, Handler, config):
+    """
+    Create a list of handlers for every file in the directory, recursively or not
+    :param directory_handler: The directory handler
+    :param Handler: The handler to use
+    :param config: The config file
+    :return: list of handlers for every file in the directory(ies)
+    """
+    return list(generate_handlers(directory_handler.scan(recursive=config["general"].get("recursive", False)), Handler))
+
+
+def create_operation_list(operations_config, Handler):
     """
-    Create a list of operations to perform on the files
+    Create the list of operations to perform on the files, compiled once for the given Handler
+    Conditions are split, resolved to Handler methods and their arguments converted here,
+    so that sorting a file doesn't do any string work
     :param operations_config: The config file for the operations
-    :param config: The general config file
-    :return: list of operations to perform on the files
+    :param Handler: The handler the operations will be evaluated on
+    :return: list of compiled operations (Operation) to perform on the files
     """
     operation_list = []
     for operation in operations_config["operation_order"].split("\n")[:-1]:
         try:
             logging.debug("[Operation list] Processing operation {}".format(operation))
-            operation_list.append(operations_config[operation])
+            operation_config = operations_config[operation]
         except Exception as e:
             logging.error("[Operation list] Could not load operation {} : {}".format(operation, e))
             logging.debug(e, exc_info=True)
-            # sys.exit(1)  # Unsure if this is the right thing to do
+            continue
+        try:
+            operation_list.append(Operation.compile(operation, operation_config, Handler))
+        except ValueError as e:
+            logging.critical("[Operation list] Invalid operation {} : {}".format(operation, e))
+            sys.exit(1)
     return operation_list
 
 
-def execute_sorting(handler_list, operation_list, default_destination, argsp):
+def sort_handlers(handlers, operation_list, default_destination):
     """
-    Execute the sorting process on all files
-    :param handler_list: The list of handlers to use
+    Sort the handlers one by one, as they come
+    :param handlers: An iterable of handlers (can be a generator)
     :param operation_list: The list of operations to perform (according to criteria)
     :param default_destination: The default destination for the files (if no operation found)
-    :param argsp: The arguments passed to the program
-    :return: None
+    :return: generator of the sorted handlers
     """
-    for handler in handler_list:
+    for handler in handlers:
         try:
-            # rich.inspect(operation_list)
             logging.debug("[File sorting] Processing {}".format(handler.file_name))
             destination = handler.sort(operation_list, default=default_destination)
             logging.debug("[File sorting] {} -> {}".format(handler.file_name, destination))
@@ -126,21 +172,267 @@ def execute_sorting(handler_list, operation_list, default_destination, argsp):
             logging.error("[File sorting] Could not sort {}".format(handler.file_name))
             logging.error(e)
             logging.debug(e, exc_info=True)
+            continue
+        yield handler
 
 
-def execute_moves(handler_list, argsp, output_directory):
-    list_of_moves = []
-    for handler in handler_list:
+def configure_handler(Handler, config):
+    """
+    Configure the Handler from the general section of the config, or exit if the settings are invalid
+    :param Handler: The handler to configure
+    :param config: The config file
+    :return: the settings applied (dict), to configure the worker processes the same way
+    """
+    settings = {key: config["general"].get(key) for key in _HANDLER_SETTINGS}
+    try:
+        Handler.configure(**settings)
+    except ValueError as e:
+        logging.critical("Could not configure handler {} : {}".format(Handler.__name__, e))
+        sys.exit(1)
+    return settings
+
+
+def init_sorting_worker(Handler, operation_list, default_destination, log_level=logging.WARNING, type_by_extension=None,
+                        handler_settings=None):
+    """
+    Initialize a sorting worker process, the operations are only sent once per worker
+    :param Handler: The handler to use
+    :param operation_list: The list of operations to perform (according to criteria)
+    :param default_destination: The default destination for the files (if no operation found)
+    :param log_level: The logging level of the main process (spawned workers don't inherit it)
+    :param type_by_extension: The extensions known by the main process, including the ones from the config
+    :param handler_settings: The settings the Handler was configured with in the main process
+    :return: None
+    """
+    logging.getLogger().setLevel(log_level)
+    TYPE_BY_EXTENTION.update(type_by_extension or {})
+    Handler.configure(**(handler_settings or {}))
+    _SORTING_WORKER.update(Handler=Handler, operation_list=operation_list, default_destination=default_destination)
+
+
+def sort_chunk(file_paths):
+    """
+    Sort a chunk of files in a worker process, and render their destination there too
+    Only the (file_path, future_name, destination) are sent back, not the handlers
+    When the artists are normalised, the destinations are rendered by the main process: each worker has its own
+    ArtistRegistry, only the one of the main process sees all the spellings of an artist
+    :param file_paths: The paths of the files to sort
+    :return: list of (file_path, future_name, destination relative to the output, None if it can't be rendered),
+             or of (file_path, future_name) when the artists are normalised
+    """
+    Handler = _SORTING_WORKER["Handler"]
+    handlers = generate_handlers_from_paths(file_paths, Handler)
+    if getattr(Handler, "registry", None) is not None:
+        return [(handler.file_path, handler.future_name)
+                for handler in sort_handlers(handlers, _SORTING_WORKER["operation_list"], _SORTING_WORKER["default_destination"])]
+    results = []
+    for handler in sort_handlers(handlers, _SORTING_WORKER["operation_list"], _SORTING_WORKER["default_destination"]):
+        rendered = None
+        if handler.future_name is not None:
+            try:
+                rendered = handler.destination_path("")
+            except Exception as e:
+                logging.error("[Move planning] Could not plan the move of {}".format(handler.file_name))
+                logging.error(e)
+                logging.debug(e, exc_info=True)
+        results.append((handler.file_path, handler.future_name, rendered))
+    return results
+
+
+def generate_handlers_from_paths(file_paths, Handler):
+    """
+    Lazily create a handler for every path
+    :param file_paths: An iterable of file paths
+    :param Handler: The handler to use
+    :return: generator of handlers
+    """
+    for file_path in file_paths:
         try:
-            logging.debug("[File moving] Processing {}".format(handler.file_name))
-            operation = handler.move(destination=output_directory, dry_run=argsp.dry_run)
-            if operation:
-                list_of_moves.append(operation)
+            yield Handler(file_path)
+        except Exception as e:
+            logging.error("[Handler list] Could not load file {}".format(file_path))
+            logging.error(e)
+            logging.debug(e, exc_info=True)
+
+
+def generate_sorted_handlers(results, Handler, index=None):
+    """
+    Rebuild the handlers of the files to move, from the results of a sorting done without handlers
+    The files sorted by the worker processes come with their destination, they get a SortedFile instead of a Handler
+    :param results: An iterable of (file_path, future_name), or of (file_path, future_name, destination) from sort_chunk
+    :param Handler: The handler to use
+    :param index: The ClassificationIndex recording the files that stay in place, if any
+    :return: generator of the sorted handlers to move
+    """
+    for file_path, future_name, *rendered in results:
+        if future_name is None:
+            if index is not None:
+                try:
+                    index.record(file_path, os.stat(file_path))
+                except OSError as e:
+                    logging.debug(e, exc_info=True)
+            continue  # Nothing to move
+        if rendered:
+            if rendered[0] is not None:
+                yield SortedFile(file_path, future_name, rendered[0])
+            continue
+        for handler in generate_handlers_from_paths((file_path,), Handler):
+            handler.future_name = future_name
+            yield handler
+
+
+def sort_in_processes(file_paths, Handler, operation_list, default_destination, workers, chunk_size=1000, index=None,
+                      handler_settings=None):
+    """
+    Sort the files on a pool of worker processes, chunk by chunk
+    The results are merged back in the order of the files, with the destinations rendered by the workers (see sort_chunk),
+    so execute_moves sees the same outcome as with sort_handlers without classifying the files again
+    :param file_paths: An iterable of file paths (can be a generator)
+    :param Handler: The handler to use
+    :param operation_list: The list of operations to perform (according to criteria)
+    :param default_destination: The default destination for the files (if no operation found)
+    :param workers: The number of worker processes
+    :param chunk_size: The number of files sent to a worker at once
+    :param index: The ClassificationIndex recording the files that stay in place, if any
+    :param handler_settings: The settings the Handler was configured with, see configure_handler
+    :return: generator of the sorted handlers to move
+    """
+    from concurrent.futures import Future, ProcessPoolExecutor
+    file_paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_sorting_worker,
+                             initargs=(Handler, operation_list, default_destination, logging.getLogger().getEffectiveLevel(),
+                                       TYPE_BY_EXTENTION, handler_settings)) as executor:
+        pending: Deque[Future[List[Tuple[Any, ...]]]] = deque()
+        for chunk in iter(lambda: list(islice(file_paths, chunk_size)), []):
+            pending.append(executor.submit(sort_chunk, chunk))
+            if len(pending) >= workers * _PENDING_CHUNKS_PER_WORKER:
+                yield from generate_sorted_handlers(pending.popleft().result(), Handler, index)
+        while pending:
+            yield from generate_sorted_handlers(pending.popleft().result(), Handler, index)
+
+
+def sort_entries(entries, Handler, operation_list, default_destination):
+    """
+    Sort a batch of files of a directory scan at once
+    :param entries: A list of os.DirEntry
+    :param Handler: The handler to use
+    :param operation_list: The list of operations to perform (according to criteria)
+    :param default_destination: The default destination for the files (if no operation found)
+    :return: list of the sorted handlers
+    """
+    return list(sort_handlers(generate_handlers(entries, Handler), operation_list, default_destination))
+
+
+def execute_sorting(handler_list, operation_list, default_destination, argsp):
+    """
+    Execute the sorting process on all files
+    :param handler_list: The list of handlers to use
+    :param operation_list: The list of operations to perform (according to criteria)
+    :param default_destination: The default destination for the files (if no operation found)
+    :param argsp: The arguments passed to the program
+    :return: None
+    """
+    for _ in sort_handlers(handler_list, operation_list, default_destination):
+        pass
+
+
+def move_handler(handler, argsp, output_directory, directories, target=None, mover=None):
+    """
+    Move a single sorted file, logging the errors
+    :param handler: The handler to move
+    :param argsp: The arguments passed to the program
+    :param output_directory: The directory the destinations are relative to
+    :param directories: The DestinationDirectories of the run
+    :param target: The path planned for the file, if any
+    :param mover: The Mover of the run, moving the files across filesystems, if any
+    :return: the move done as (origin, destination), or None
+    """
+    try:
+        logging.debug("[File moving] Processing {}".format(handler.file_name))
+        options = {name: value for name, value in (("target", target), ("mover", mover)) if value is not None}
+        return handler.move(destination=output_directory, dry_run=argsp.dry_run, directories=directories, **options)
+    except Exception as e:
+        logging.error("[File moving] Could not move {}".format(handler.file_name))
+        logging.error(e)
+        logging.debug(e, exc_info=True)
+
+
+def move_and_record(handler, argsp, output_directory, directories, cancel_journal, planner=None, mover=None):
+    """
+    Move a single sorted file and append the move to the cancel journal
+    :param handler: The handler to move
+    :param argsp: The arguments passed to the program
+    :param output_directory: The directory the destinations are relative to
+    :param directories: The DestinationDirectories of the run
+    :param cancel_journal: The CancelJournal of the run
+    :param planner: The MovePlanner claiming the destination of the file just before it is moved, if any
+    :param mover: The Mover of the run, if any
+    :return: the move done as (origin, destination), or None
+    """
+    target = None
+    if planner is not None:
+        try:
+            target = planner.plan(handler)
         except Exception as e:
-            logging.error("[File moving] Could not move {}".format(handler.file_name))
+            logging.error("[Move planning] Could not plan the move of {}".format(handler.file_name))
             logging.error(e)
             logging.debug(e, exc_info=True)
-    return list_of_moves
+            return None
+        if target is None:
+            return None
+    operation = move_handler(handler, argsp, output_directory, directories, target, mover)
+    if operation:
+        cancel_journal.write(*operation)
+    return operation
+
+
+def generate_moves(handler_list, argsp, output_directory, directories=None, planned=False, mover=None):
+    """
+    Move every sorted file to its destination, on a pool of argsp.jobs threads if there is more than one
+    The moves are yielded in the order of the handlers, whatever the number of threads
+    :param handler_list: The handlers to move (can be a generator), or (handler, target) pairs if planned
+    :param argsp: The arguments passed to the program
+    :param output_directory: The directory the destinations are relative to
+    :param directories: The DestinationDirectories of the run, if it is shared
+    :param planned: Whether the handlers come with their planned target, see MovePlanner.plan_moves
+    :param mover: The Mover of the run, if any; a file is only recorded once it is completely moved, even across filesystems
+    :return: generator of the moves done, as (origin, destination)
+    """
+    if directories is None:
+        directories = DestinationDirectories()
+    moves = handler_list if planned else ((handler, None) for handler in handler_list)
+    jobs = getattr(argsp, "jobs", 1)
+    if jobs <= 1:
+        for handler, target in moves:
+            operation = move_handler(handler, argsp, output_directory, directories, target, mover)
+            if operation:
+                yield operation
+        return
+
+    from concurrent.futures import Future, ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending: Deque[Future[Any]] = deque()
+        for handler, target in moves:
+            pending.append(executor.submit(move_handler, handler, argsp, output_directory, directories, target, mover))
+            if len(pending) >= jobs * _PENDING_MOVES_PER_JOB:  # Bounded, to keep streaming the handlers
+                operation = pending.popleft().result()
+                if operation:
+                    yield operation
+        while pending:
+            operation = pending.popleft().result()
+            if operation:
+                yield operation
+
+
+def execute_moves(handler_list, argsp, output_directory):
+    """
+    Move every sorted file to its destination
+    :param handler_list: The handlers to move (can be a generator)
+    :param argsp: The arguments passed to the program
+    :param output_directory: The directory the destinations are relative to
+    :return: list of the moves done, as (origin, destination)
+    """
+    return list(generate_moves(handler_list, argsp, output_directory))
 
 
 def write_cancel_file(list_of_operations, output, verbose, dry_run):
@@ -153,18 +445,16 @@ def write_cancel_file(list_of_operations, output, verbose, dry_run):
     :return: None
     """
     if not dry_run and len(list_of_operations) > 0 or verbose > 3:
-        logging.info("Writing cancel file...")
-        with open(output, "w", encoding="utf-8") as f:
-            for origin, destination in list_of_operations:
-                f.write("{} : {}\n".format(origin, destination))
-            logging.info("Written " + output)
+        with CancelJournal(output) as cancel_journal:
+            cancel_journal.open()
+            cancel_journal.write_all(list_of_operations)
 
 
-def action_sort(argsp):
+def load_sorting(argsp):
     """
-    Sort the files
+    Load the config, the handler and the operations of a sort
     :param argsp: the arguments passed to the program
-    :return: None
+    :return: (config, Handler, operation_list, default_destination, handler_settings)
     """
     # Load the config file
     config = load_config(argsp.config)
@@ -175,31 +465,217 @@ def action_sort(argsp):
     # Pick the right handler
     Handler = load_handler(config["general"]["handler"])
 
-    # Create the DirectorySorter
-    directory_handler = DirectoryHandler(argsp.folder)
-
-    # Get the list of Handler from the directory
-    handler_list = create_handler_list(directory_handler, Handler, config)
+    # Add the custom file types
+    register_types(config.get("types"))
+    handler_settings = configure_handler(Handler, config)
 
     # Get the action to perform on each file from the handler and the operations
-    operation_list = create_operation_list(operations_config, handler_list)
+    operation_list = create_operation_list(operations_config, Handler)
 
     # Find the default destination
+    default_destination = None
     if "default_destination" in operations_config:
-        default_destination = operations_config["default_destination"]["destination"]
-    else:
-        default_destination = None
+        try:
+            default_destination = DestinationTemplate.compile(operations_config["default_destination"]["destination"], Handler)
+        except ValueError as e:
+            logging.critical("[Operation list] Invalid default destination : {}".format(e))
+            sys.exit(1)
 
-    # Sort the files
-    execute_sorting(handler_list, operation_list, default_destination, argsp)
+    # The duplicates found by the dedupe stage go to their own destination, before any other operation
+    if "duplicate_destination" in operations_config:
+        try:
+            operation_list.insert(0, Operation.compile("duplicate_destination", {
+                "conditions": "is_duplicate", "destination": operations_config["duplicate_destination"]["destination"]}, Handler))
+        except ValueError as e:
+            logging.critical("[Operation list] Invalid duplicate destination : {}".format(e))
+            sys.exit(1)
+    return config, Handler, operation_list, default_destination, handler_settings
 
-    # Move the files
-    list_of_moves = execute_moves(handler_list, argsp, default_destination)
 
-    # Write a cancel file
-    write_cancel_file(list_of_moves, os.path.join(argsp.output, argsp.cancel_file), argsp.verbose, argsp.dry_run)
+def action_sort(argsp):
+    """
+    Sort the files, and show the statistics of the run with --stats
+    :param argsp: the arguments passed to the program
+    :return: None
+    """
+    if not getattr(argsp, "stats", None):
+        sort_folder(argsp)
+        return
+    from criteriaSorter.modules.stats import RunStats
+    with RunStats() as stats:
+        sort_folder(argsp, stats)
+    stats.report(argsp.stats)
+
+
+def sort_folder(argsp, stats=None):
+    """
+    Sort the files of the folder
+    :param argsp: the arguments passed to the program
+    :param stats: the RunStats collecting the timings and counters, or None
+    :return: None
+    """
+    from criteriaSorter.modules.transfer import Mover  # The other stages are imported by the branches using them
+    with stats.phase("config") if stats is not None else nullcontext():
+        config, Handler, operation_list, default_destination, handler_settings = load_sorting(argsp)
+
+    # Profile the conditions, one handler at a time in this process
+    profile = getattr(argsp, "profile", False)
+    if profile:
+        from criteriaSorter.modules.profiling import profile_operations
+        operation_list = profile_operations(operation_list)
+        if argsp.engine == "batch" or argsp.workers > 1:
+            logging.warning("Profiling the conditions, the files are sorted one handler at a time in this process")
+            argsp.engine, argsp.workers = "handlers", 1
+
+    # Find the duplicates among all the files before sorting them, when asked or when an operation needs them
+    dedupe = getattr(argsp, "dedupe", False) or any(condition.name == "is_duplicate" for operation in operation_list
+                                                    for condition in operation.conditions)
+    if dedupe and (argsp.engine != "handlers" or argsp.workers > 1):
+        logging.warning("Finding the duplicates, the files are sorted one handler at a time in this process")
+        argsp.engine, argsp.workers = "handlers", 1
+    duplicate_finder = None
+    if dedupe:
+        from criteriaSorter.modules.dedupe import DuplicateFinder
+        duplicate_finder = DuplicateFinder(jobs=argsp.jobs)
+
+    # Create the DirectorySorter
+    directory_handler = DirectoryHandler(argsp.folder)
+
+    # Don't sort the output again when it lives inside the sorted folder
+    recursive = argsp.recursive or config["general"].get("recursive", False)
+    exclude = {os.path.abspath(argsp.output)} - {os.path.abspath(argsp.folder)}
+
+    # Skip the files already classified by a previous run with the same config
+    index = None
+    if argsp.index:
+        from criteriaSorter.modules.index import ClassificationIndex, config_hash
+        index_path = os.path.join(argsp.output, argsp.index)
+        if not argsp.dry_run:
+            os.makedirs(argsp.output, exist_ok=True)
+        if not argsp.dry_run or os.path.exists(index_path):
+            index = ClassificationIndex(index_path, config_hash(config, argsp.operations), read_only=argsp.dry_run)
+
+    # The moves are written to the cancel file as they are done
+    cancel_journal = CancelJournal(os.path.join(argsp.output, argsp.cancel_file), enabled=not argsp.dry_run or argsp.verbose > 3)
+    on_create = cancel_journal.write_directories if stats is None else stats.count_directories(cancel_journal.write_directories)
+    planner = MovePlanner(argsp.output, getattr(argsp, "on_collision", "suffix"))
+    mover = Mover(copy_jobs=getattr(argsp, "copy_jobs", 2))
+
+    try:
+        # Stream the handlers from the directory, through the sorting, to the moves
+        # The cancel file is skipped, it can be created in the sorted folder while it is still scanned
+        journal_name, journal_path = os.path.basename(cancel_journal.path), os.path.abspath(cancel_journal.path)
+        entries = (entry for entry in directory_handler.scan(recursive=recursive, exclude=exclude)
+                   if entry.name != journal_name or os.path.abspath(entry.path) != journal_path)
+        if stats is not None:
+            entries = stats.timed("scan", entries, counter="files scanned")
+        directories = DestinationDirectories(on_create=on_create)
+        if argsp.engine == "pipeline":
+            from criteriaSorter.modules.pipeline import run_pipeline
+            sort_batch = partial(sort_entries, Handler=Handler, operation_list=operation_list, default_destination=default_destination)
+            move = partial(move_and_record, argsp=argsp, output_directory=argsp.output, directories=directories,
+                           cancel_journal=cancel_journal, planner=planner, mover=mover)  # Planned as the files arrive
+            if stats is not None:
+                move = stats.counted(move, "dry run moves" if argsp.dry_run else "rename")
+            with stats.phase("pipeline") if stats is not None else nullcontext():
+                run_pipeline(entries, sort_batch, move, index=index, jobs=argsp.jobs)
+        else:
+            if index is not None:
+                entries = index.filter_unchanged(entries)
+                if stats is not None:
+                    entries = stats.timed("index", entries)
+            if argsp.engine == "batch":
+                from criteriaSorter.modules.batch import sort_in_batches
+                results = sort_in_batches(entries, Handler, operation_list, default_destination)
+                sorted_handlers = generate_sorted_handlers(results, Handler, index)
+            elif argsp.workers > 1:
+                file_paths = (entry.path for entry in entries)
+                sorted_handlers = sort_in_processes(file_paths, Handler, operation_list, default_destination, argsp.workers, index=index,
+                                                    handler_settings=handler_settings)
+            else:
+                handlers = generate_handlers(entries, Handler)
+                if stats is not None:
+                    handlers = stats.timed("handlers", handlers, counter="handlers")
+                if duplicate_finder is not None:
+                    with stats.phase("dedupe") if stats is not None else nullcontext():
+                        handlers = duplicate_finder.mark(handlers)
+                sorted_handlers = sort_handlers(handlers, operation_list, default_destination)
+                if index is not None:
+                    sorted_handlers = index.record_unmoved(sorted_handlers)
+            if stats is not None:
+                sorted_handlers = stats.timed("sort", sorted_handlers)
+                sorted_handlers = stats.count_matches(sorted_handlers, operation_list, default_destination)
+            # Every destination is claimed before the first rename, grouped by directory
+            with stats.phase("plan") if stats is not None else nullcontext():
+                plan = planner.plan_moves(sorted_handlers)
+            moves = generate_moves(plan, argsp, argsp.output, directories, planned=True, mover=mover)
+            if stats is not None:
+                moves = stats.count_moves(stats.timed("moves", moves), argsp.dry_run)
+            cancel_journal.write_all(moves)
+    finally:
+        cancel_journal.close()
+        if index is not None:
+            logging.info("Skipped {} files unchanged since the last run".format(index.skipped))
+            if stats is not None:
+                stats.counters["skipped unchanged"] = index.skipped
+            index.close()
+        if stats is not None:
+            collisions = {"collisions skipped": planner.skipped, "collisions renamed": planner.renamed, "duplicates left": planner.duplicates}
+            stats.counters.update({name: number for name, number in collisions.items() if number})
+            if duplicate_finder is not None:
+                stats.counters.update({"hashed partially": duplicate_finder.partially_hashed, "hashed fully": duplicate_finder.fully_hashed,
+                                       "duplicates found": duplicate_finder.duplicates})
+            if mover.copied:
+                stats.counters["cross-device copies"] = mover.copied
 
     logging.info("All operations done")
+    if profile:
+        from criteriaSorter.modules.profiling import report_profile
+        report_profile(operation_list)
+
+
+def action_watch(argsp, stop=None):
+    """
+    Sort the files already in the folder, then the new ones as they arrive
+    :param argsp: the arguments passed to the program
+    :param stop: a threading.Event stopping the watch, or None to watch until interrupted
+    :return: None
+    """
+    from criteriaSorter.modules.transfer import Mover
+    from criteriaSorter.modules.watch import is_watched, watch
+    config, Handler, operation_list, default_destination, handler_settings = load_sorting(argsp)
+    recursive = argsp.recursive or config["general"].get("recursive", False)
+    exclude = {os.path.abspath(argsp.output)} - {os.path.abspath(argsp.folder)}
+    cancel_journal = CancelJournal(os.path.join(argsp.output, argsp.cancel_file), enabled=not argsp.dry_run or argsp.verbose > 3)
+    ignored = {os.path.abspath(cancel_journal.path)}
+    moved = set()  # The files just moved into a watched subfolder, not to sort again when they show up there
+    mover = Mover(copy_jobs=argsp.copy_jobs)
+
+    def sort_files(file_paths):
+        new_paths = []
+        for path in file_paths:
+            absolute_path = os.path.abspath(path)
+            if absolute_path in moved:
+                moved.discard(absolute_path)
+            elif absolute_path not in ignored:
+                new_paths.append(path)
+        handlers = sort_handlers(generate_handlers_from_paths(new_paths, Handler), operation_list, default_destination)
+        planner = MovePlanner(argsp.output, argsp.on_collision, list_directories=len(new_paths) > _WATCH_LISTED_BATCH)
+        plan = planner.plan_moves(handlers)
+        directories = DestinationDirectories(on_create=cancel_journal.write_directories)  # Checked again, they can be removed while watching
+        for origin, destination in generate_moves(plan, argsp, argsp.output, directories, planned=True, mover=mover):
+            cancel_journal.write(origin, destination)
+            if recursive and is_watched(destination, argsp.folder, exclude):  # No event comes for the others
+                moved.add(os.path.abspath(destination))
+        cancel_journal.flush()
+
+    try:
+        watch(argsp.folder, sort_files, recursive=recursive, exclude=exclude, settle=argsp.settle, polling=argsp.polling,
+              interval=argsp.interval, stop=stop, existing=True)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching {}".format(argsp.folder))
+    finally:
+        cancel_journal.close()
 
 
 def action_list(argsp):
@@ -208,10 +684,10 @@ def action_list(argsp):
     :param argsp: the arguments passed to the program
     :return: None
     """
+    import rich
     try:
         logging.info("Listing operations")
-        with open(argsp.config, 'r') as stream:
-            config = yaml.safe_load(stream)
+        config = load_config(argsp.config)
         if argsp.verbose:
             rich.print(config["operations"])
         else:
@@ -232,18 +708,16 @@ def action_list(argsp):
 def action_cancel(argsp):
     """
     Cancel the operations done by the program, given a cancel file
+    The moves are undone from the last to the first, and an interrupted cancel resumes where it stopped
     :param argsp: The arguments passed to the program
     :return: None
     """
-    with open(os.path.join(argsp.cancel_file), "r") as f:
-        for line in f:
-            try:
-                origin, destination = line.split(" : ")
-                os.rename(destination, origin)
-            except Exception as e:
-                logging.error("Could not cancel {}".format(line))
-                logging.error(e)
-                logging.debug(e, exc_info=True)
+    from criteriaSorter.modules.journal import replay, undo_move
+    from criteriaSorter.modules.transfer import Mover
+    undo = partial(undo_move, mover=Mover(copy_jobs=getattr(argsp, "copy_jobs", 2)))  # The output can be on another filesystem
+    errors = replay(os.path.join(argsp.cancel_file), jobs=getattr(argsp, "jobs", 1), undo=undo)
+    if errors:
+        logging.warning("{} moves could not be cancelled".format(errors))
 
 
 _LIST_ACTIONS = {
@@ -251,6 +725,7 @@ _LIST_ACTIONS = {
     # "help": action_help,
     "list": action_list,
     "cancel": action_cancel,
+    "watch": action_watch,
 }
 
 
@@ -266,13 +741,13 @@ def config_log(argsp):
     if argsp.silent:
         logging.basicConfig(level=logging.CRITICAL, format=_LOG_FORMAT)
     elif argsp.verbose == 0:
-        logging.basicConfig(level=logging.ERROR, format=_LOG_FORMAT, handlers=[RichHandler()])
+        logging.basicConfig(level=logging.ERROR, format=_LOG_FORMAT, handlers=[LazyRichHandler()])
     elif argsp.verbose == 1:
-        logging.basicConfig(level=logging.WARNING, format=_LOG_FORMAT, handlers=[RichHandler()])
+        logging.basicConfig(level=logging.WARNING, format=_LOG_FORMAT, handlers=[LazyRichHandler()])
     elif argsp.verbose == 2:
-        logging.basicConfig(level=logging.INFO, format=_LOG_FORMAT, handlers=[RichHandler()])
+        logging.basicConfig(level=logging.INFO, format=_LOG_FORMAT, handlers=[LazyRichHandler()])
     else:
-        logging.basicConfig(level=logging.DEBUG, format=_LOG_FORMAT, handlers=[RichHandler()])
+        logging.basicConfig(level=logging.DEBUG, format=_LOG_FORMAT, handlers=[LazyRichHandler()])
 
 
 def parse_args(argvp):
@@ -301,12 +776,46 @@ def parse_args(argvp):
     parser_sort = subparsers.add_parser('sort', help='Sort files according to criteria')
     subparsers.add_parser('list', help='List criteria')  # parser_list
     # parser_help = subparsers.add_parser('help', help='Show help')
-    subparsers.add_parser('cancel', help='Cancel')  # parser_cancel
+    parser_cancel = subparsers.add_parser('cancel', help='Cancel')
+    parser_cancel.add_argument('-j', '--jobs', help='Number of files moved back at the same time.', type=int, default=1)
+    parser_cancel.add_argument('--copy-jobs', help=_COPY_JOBS_HELP, type=int, default=2)
     parser_sort.add_argument('folder', help='The folder to sort.')
     parser_sort.add_argument("-o", '--output', help='The output folder.', default=".")
     parser_sort.add_argument('-c', '--operations', help='The specific batch of operations to draw from.',
                              default='default_operations')
     parser_sort.add_argument('--dry-run', help='Dry run.', action='store_true')
+    parser_sort.add_argument('-r', '--recursive', help='Also sort the subfolders.', action='store_true')
+    parser_sort.add_argument('-j', '--jobs', help='Number of files moved at the same time.', type=int, default=1)
+    parser_sort.add_argument('--copy-jobs', help=_COPY_JOBS_HELP, type=int, default=2)
+    parser_sort.add_argument('-w', '--workers', help='Number of processes sorting the files.', type=int, default=1)
+    parser_sort.add_argument('--engine', help='Sort the files one handler at a time, in batches of columns, '
+                                              'or as a pipeline moving the files while the folder is still scanned.',
+                             choices=['handlers', 'batch', 'pipeline'], default='handlers')
+    parser_sort.add_argument('--on-collision', help=_COLLISION_HELP,
+                             choices=COLLISION_POLICIES, default='suffix')
+    parser_sort.add_argument('--stats', help='Show the time spent in each phase and the counters of the run, as tables or JSON.',
+                             nargs='?', const='table', choices=['table', 'json'], default=None)
+    parser_sort.add_argument('--profile', help='Profile the conditions of the operations and suggest a cheaper order.',
+                             action='store_true')
+    parser_sort.add_argument('--dedupe', help='Find the files with the same content before sorting, for the is_duplicate condition '
+                                              'and the duplicate_destination of the operations.', action='store_true')
+    parser_sort.add_argument('--index', help='Skip the files unchanged since the last run, using an index in the output folder.',
+                             nargs='?', const=DEFAULT_INDEX_FILE, default=None)
+
+    parser_watch = subparsers.add_parser('watch', help='Sort the files as they arrive in a folder')
+    parser_watch.add_argument('folder', help='The folder to watch.')
+    parser_watch.add_argument("-o", '--output', help='The output folder.', default=".")
+    parser_watch.add_argument('-c', '--operations', help='The specific batch of operations to draw from.',
+                              default='default_operations')
+    parser_watch.add_argument('--dry-run', help='Dry run.', action='store_true')
+    parser_watch.add_argument('-r', '--recursive', help='Also watch the subfolders.', action='store_true')
+    parser_watch.add_argument('-j', '--jobs', help='Number of files moved at the same time.', type=int, default=1)
+    parser_watch.add_argument('--copy-jobs', help=_COPY_JOBS_HELP, type=int, default=2)
+    parser_watch.add_argument('--on-collision', help=_COLLISION_HELP,
+                              choices=COLLISION_POLICIES, default='suffix')
+    parser_watch.add_argument('--settle', help='Seconds a file must stay unchanged before it is sorted.', type=float, default=0.5)
+    parser_watch.add_argument('--polling', help='Poll the folder instead of using inotify.', action='store_true')
+    parser_watch.add_argument('--interval', help='Seconds between two scans when polling.', type=float, default=1.0)
 
     args = parser.parse_args(argvp)
     return args
@@ -0,0 +1,132 @@
+# Deduplication of the files of a sort, enabled with sort --dedupe or by the is_duplicate condition:
+# the files are grouped by size, and only the files sharing a size are read, first their first and last blocks,
+# then their whole content if these match. The copies are flagged on their handler, the first path of each group is kept
+import hashlib
+import logging
+import mmap
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from criteriaSorter.modules.planner import file_digest
+
+PARTIAL_SIZE = 64 * 1024
+
+
+def partial_digest(file_path, size, block_size=PARTIAL_SIZE):
+    """
+    Hash the first and last blocks of a file, or all of it if it is not bigger than two blocks
+    :param file_path: the path of the file
+    :param size: the size of the file
+    :param block_size: the size of the blocks read
+    :return: the digest (bytes)
+    """
+    digest = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        if size <= 2 * block_size:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(block_size))
+            f.seek(-block_size, os.SEEK_END)
+            digest.update(f.read(block_size))
+    return digest.digest()
+
+
+def full_digest(file_path):
+    """
+    Hash the whole content of a file, mapped in memory so it is hashed without copies (and without the GIL)
+    :param file_path: the path of the file
+    :return: the digest (bytes)
+    """
+    with open(file_path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return hashlib.blake2b(view).digest()
+        except (ValueError, OSError):  # Empty, or on a filesystem that can't be mapped
+            pass
+    return file_digest(file_path)
+
+
+class DuplicateFinder:
+    """
+    Find the files of a run with the same content
+    """
+
+    def __init__(self, jobs=1, block_size=PARTIAL_SIZE):
+        """
+        :param jobs: the number of files hashed at the same time
+        :param block_size: the size of the blocks hashed before the whole files
+        """
+        self.jobs = max(jobs, 1)
+        self.block_size = block_size
+        self.partially_hashed = 0
+        self.fully_hashed = 0
+        self.duplicates = 0
+
+    def digest(self, function, *args):
+        try:
+            return function(*args)
+        except OSError as e:
+            logging.error("[Dedupe] Could not read {}".format(args[0]))
+            logging.error(e)
+            logging.debug(e, exc_info=True)
+            return None
+
+    def group(self, groups, function, map_function):
+        """
+        Split groups of handlers by a digest of their files
+        :param groups: dict of key -> list of handlers
+        :param function: function of a handler returning the digest of its file (None if it can't be read)
+        :param map_function: map or the map of a thread pool
+        :return: dict of (key, digest) -> list of handlers, only the groups of more than one handler
+        """
+        handlers = [handler for group in groups.values() for handler in group]
+        keys = [key for key, group in groups.items() for _ in group]
+        split: Dict[Tuple[Any, bytes], List[Any]] = {}
+        for key, handler, digest in zip(keys, handlers, map_function(function, handlers)):
+            if digest is not None:
+                split.setdefault((key, digest), []).append(handler)
+        return {key: group for key, group in split.items() if len(group) > 1}
+
+    def mark(self, handlers):
+        """
+        Flag the duplicates among handlers, setting their duplicate_of to the path of the file they are a copy of
+        Empty files are never flagged, they have no content to compare
+        :param handlers: the handlers (can be a generator)
+        :return: list of the same handlers, in the same order
+        """
+        handlers = list(handlers)
+        by_size: Dict[int, List[Any]] = {}
+        for handler in handlers:
+            try:
+                size = handler.get_file_size()  # From the stat of the directory listing when there is one
+            except OSError as e:
+                logging.error("[Dedupe] Could not stat {}".format(handler.file_path))
+                logging.error(e)
+                continue
+            if size:
+                by_size.setdefault(size, []).append(handler)
+        by_size = {size: group for size, group in by_size.items() if len(group) > 1}
+
+        executor = ThreadPoolExecutor(max_workers=self.jobs) if self.jobs > 1 else None
+        map_function = map if executor is None else executor.map
+        try:
+            self.partially_hashed += sum(len(group) for group in by_size.values())
+            partial_groups = self.group(by_size, lambda handler: self.digest(
+                partial_digest, handler.file_path, handler.get_file_size(), self.block_size), map_function)
+            identical = [group for (size, _), group in partial_groups.items() if size <= 2 * self.block_size]
+            to_hash = {key: group for key, group in partial_groups.items() if key[0] > 2 * self.block_size}
+            self.fully_hashed += sum(len(group) for group in to_hash.values())
+            identical.extend(self.group(to_hash, lambda handler: self.digest(full_digest, handler.file_path), map_function).values())
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        for group in identical:
+            original, *copies = sorted(group, key=lambda handler: handler.file_path)
+            for handler in copies:
+                logging.info("[Dedupe] {} is a duplicate of {}".format(handler.file_path, original.file_path))
+                handler.duplicate_of = original.file_path
+            self.duplicates += len(copies)
+        return handlers
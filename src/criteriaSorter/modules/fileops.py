@@ -1,7 +1,16 @@
 # All operation related to file and directory
+import difflib
+import functools
 import logging
 import os
 import re
+import string
+import threading
+
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from criteriaSorter.modules import sniffing
 
 EXTENTION_BY_TYPE = {
     'image': ["jpg", "jpeg", "png", "gif", "bmp", "tiff", "tif"],
@@ -14,18 +23,239 @@ EXTENTION_BY_TYPE = {
                  "tex", "latex", "bib", "bibtex"]
 }
 
+# (regex, literal the file name must contain for the regex to be tried)
 _guess_artist_regex = [
-    re.compile(r"(?P<file_name>.+)\s+by\s+(?P<artist>[^.]+)\s*\..*$"),
-    re.compile(r"(?P<artist>[^-]+)\s*-\s*(?P<file_name>[^.]+)\s*\..*"),
-    # re.compile(r"(?P<artist>.+)_(?P<file_name>.+)$"),
+    (re.compile(r"(?P<file_name>.+)\s+by\s+(?P<artist>[^.]+)\s*\..*$"), "by"),
+    (re.compile(r"(?P<artist>[^-]+)\s*-\s*(?P<file_name>[^.]+)\s*\..*"), "-"),
+    # (re.compile(r"(?P<artist>.+)_(?P<file_name>.+)$"), "_"),
 ]
 
+_ARTIST_SEPARATORS = re.compile(r"[\W_]+")
+
+_PATH_SEPARATORS = tuple({"/", os.sep, os.altsep or "/", "\0"})
+
+_CONVERSIONS: Dict[Optional[str], Callable[[Any], Any]] = {None: lambda value: value, "s": str, "r": repr, "a": ascii}
+
+_PREDICATE_PREFIXES = ("is_", "has_")  # The methods of the handlers usable as conditions
+_INTEGER_CONDITIONS = ("is_bigger_than", "is_smaller_than", "is_bigger_than_mb", "is_smaller_than_mb")
+
+_SNIFF_MODES = (None, "unknown", "always")
+_UNTYPED = object()
+_STAT_IN_LISTING = os.name == "nt"  # The stat of a DirEntry comes with the listing on Windows, it is a syscall elsewhere
+
 TYPE_BY_EXTENTION = {}
 for i, j in EXTENTION_BY_TYPE.items():
     for k in j:
         TYPE_BY_EXTENTION[k] = i
 
 
+def register_types(types):
+    """
+    Add type groups and extensions, from the "types" section of the config
+    Extensions are case insensitive, and an extension moved to another type is removed from its previous one
+    :param types: dict of type name -> list of extensions (with or without the dot)
+    :return: None
+    """
+    for file_type, extensions in (types or {}).items():
+        for extension in extensions:
+            extension = str(extension).lstrip('.').lower()
+            previous_type = TYPE_BY_EXTENTION.get(extension)
+            if previous_type is not None and previous_type != file_type:
+                EXTENTION_BY_TYPE[previous_type].remove(extension)
+            if previous_type != file_type:
+                EXTENTION_BY_TYPE.setdefault(file_type, []).append(extension)
+            TYPE_BY_EXTENTION[extension] = file_type
+
+
+def convert_condition_argument(argument):
+    """
+    Convert a condition argument from the config to its python value, once
+    :param argument: the raw argument (string)
+    :return: the argument as an int if possible, the stripped string otherwise
+    """
+    argument = argument.strip()
+    try:
+        return int(argument)
+    except ValueError:
+        return argument
+
+
+class Condition:
+    """A single condition of an operation, with its function resolved and its arguments converted"""
+    __slots__ = ("name", "function", "args")
+
+    def __init__(self, name, function, args=()):
+        self.name = name
+        self.function = function
+        self.args = tuple(args)
+
+    @classmethod
+    def compile(cls, condition_str, Handler):
+        """
+        Compile a "name,arg1,arg2" condition string against a Handler class
+        :param condition_str: the condition, as written in the config
+        :param Handler: the Handler class the condition will be evaluated on
+        :return: Condition
+        :raises ValueError: if the condition does not exist on the Handler, or its arguments don't fit it
+        """
+        import inspect  # Only needed when compiling, not to slow down the startup of the CLI
+        condition_split = condition_str.strip().split(',')
+        name = condition_split[0].strip()
+        function = getattr(Handler, name, None)
+        if not name.startswith(_PREDICATE_PREFIXES) or not callable(function):
+            raise ValueError("Unknown condition '{}' for {}".format(name, Handler.__name__))
+        args = [convert_condition_argument(arg) for arg in condition_split[1:]]
+        try:
+            inspect.signature(function).bind(None, *args)  # None for the handler
+        except TypeError as e:
+            raise ValueError("Invalid arguments for the condition '{}' : {}".format(condition_str.strip(), e))
+        if name in _INTEGER_CONDITIONS and not all(isinstance(arg, int) for arg in args):
+            raise ValueError("The condition '{}' needs an integer".format(condition_str.strip()))
+        return cls(name, function, args)
+
+    def __call__(self, handler):
+        return self.function(handler, *self.args)
+
+    def __repr__(self):
+        return "Condition({}{})".format(self.name, "".join("," + str(arg) for arg in self.args))
+
+
+def sanitise_path_component(value):
+    """
+    Make a value safe to use as a single path component: no separator, and not "." or ".."
+    :param value: the value of a destination field (e.g. an artist name), as a string
+    :return: the sanitised value
+    """
+    for separator in _PATH_SEPARATORS:
+        if separator in value:
+            value = value.replace(separator, "_")
+    return "_" if value in (".", "..") or not value.strip() else value
+
+
+class DestinationTemplate:
+    """
+    A destination from the config, like "Artists/{obj.artist}/{obj.name}", compiled once:
+    the literal parts become a format string with positional fields, and each field an accessor of the handler
+    The values of the fields are sanitised, so a destination can't leave the output directory
+    """
+    __slots__ = ("template", "Handler", "format_string", "accessors")
+    _cache: Dict[Tuple[str, Any], "DestinationTemplate"] = {}
+
+    def __init__(self, template, Handler, format_string, accessors):
+        self.template = template
+        self.Handler = Handler
+        self.format_string = format_string
+        self.accessors = tuple(accessors)  # (getter, conversion, format_spec) of each field
+
+    @classmethod
+    def compile(cls, template, Handler):
+        """
+        Compile a destination template against a Handler class
+        :param template: the destination, as written in the config
+        :param Handler: the Handler class the destination will be rendered for
+        :return: DestinationTemplate
+        :raises ValueError: if the template is malformed, uses unknown fields or leaves the output directory
+        """
+        if not isinstance(template, str) or not template:
+            raise ValueError("Destination {!r} is not a path".format(template))
+        try:
+            parsed = list(string.Formatter().parse(template))
+        except ValueError as e:
+            raise ValueError("Invalid destination '{}' : {}".format(template, e))
+        literal_path = "{}".join(literal for literal, _, _, _ in parsed)
+        if os.path.isabs(literal_path) or ".." in re.split(r"[\\/]", literal_path):
+            raise ValueError("Destination '{}' leaves the output directory".format(template))
+        format_string, accessors = [], []
+        for literal, field, format_spec, conversion in parsed:
+            format_string.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            if not field.startswith("obj.") or not field[4:]:
+                raise ValueError("Unknown field '{{{}}}' in destination '{}', fields are obj.<attribute>".format(field, template))
+            attribute = field[4:]
+            if "[" in attribute or not hasattr(Handler, attribute.split(".")[0]):
+                raise ValueError("Unknown field '{{{}}}' in destination '{}' for {}".format(field, template, Handler.__name__))
+            format_string.append("{}")
+            accessors.append((attrgetter(attribute), conversion, format_spec))
+        return cls(template, Handler, "".join(format_string), accessors)
+
+    @classmethod
+    def cached(cls, template, Handler):
+        """Get a compiled template, compiled only once per run (for the destinations set outside of the operations)"""
+        key = (template, Handler)
+        compiled = cls._cache.get(key)
+        if compiled is None:
+            compiled = cls._cache[key] = cls.compile(template, Handler)
+        return compiled
+
+    def render(self, handler):
+        """
+        :param handler: the handler of the file
+        :return: the destination of the file, relative to the output directory
+        """
+        values = []
+        for getter, conversion, format_spec in self.accessors:
+            value = getter(handler)
+            if conversion or format_spec:
+                value = format(_CONVERSIONS[conversion](value), format_spec)
+            elif value.__class__ is not str:
+                value = str(value)
+            values.append(sanitise_path_component(value))
+        return self.format_string.format(*values)
+
+    def __reduce__(self):  # Sent to the worker processes as the template, compiled again there
+        return DestinationTemplate.cached, (self.template, self.Handler)
+
+    def __eq__(self, other):  # Equal to the destination string of the config too, like future_name was before
+        if isinstance(other, str):
+            return other == self.template
+        return isinstance(other, DestinationTemplate) and other.template == self.template and other.Handler is self.Handler
+
+    def __hash__(self):
+        return hash(self.template)
+
+    def __str__(self):
+        return self.template
+
+    def __repr__(self):
+        return "DestinationTemplate({!r})".format(self.template)
+
+
+class Operation:
+    """An operation from the config: a list of compiled conditions and a destination"""
+    __slots__ = ("name", "conditions", "destination")
+
+    def __init__(self, name, conditions, destination):
+        self.name = name
+        self.conditions = tuple(conditions)
+        self.destination = destination
+
+    @classmethod
+    def compile(cls, name, operation_config, Handler):
+        """
+        Compile an operation from the config
+        :param name: the name of the operation
+        :param operation_config: the operation dict (conditions and destination)
+        :param Handler: the Handler class the conditions will be evaluated on
+        :return: Operation
+        :raises ValueError: if the operation is malformed or uses unknown conditions
+        """
+        if not isinstance(operation_config, dict) or "conditions" not in operation_config or "destination" not in operation_config:
+            raise ValueError("Operation '{}' needs both conditions and a destination".format(name))
+        conditions = [Condition.compile(condition_str, Handler)
+                      for condition_str in operation_config["conditions"].split('\n') if condition_str.strip()]
+        return cls(name, conditions, DestinationTemplate.compile(operation_config["destination"], Handler))
+
+    def matches(self, handler):
+        for condition in self.conditions:
+            if not condition(handler):
+                return False
+        return True
+
+    def __repr__(self):
+        return "Operation({}, {!r} -> {})".format(self.name, list(self.conditions), self.destination)
+
+
 class DirectoryHandler:
     def __init__(self, dir_path):
         self.dir_path = dir_path
@@ -48,19 +278,38 @@ class DirectoryHandler:
     def get_full_list(self):
         return os.listdir(self.dir_path)
 
+    def scan(self, recursive=False, exclude=()):
+        """
+        Walk the directory with os.scandir, reusing the type information of each DirEntry (no extra stat)
+        Subdirectories are walked depth first, one open directory at a time, so memory stays flat
+        :param recursive: also walk the subdirectories
+        :param exclude: absolute paths of directories not to walk into (e.g. the output directory)
+        :return: generator of os.DirEntry, one for every file
+        """
+        directories = [self.dir_path]
+        while directories:
+            subdirectories = []
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        yield entry
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        if os.path.abspath(entry.path) not in exclude:
+                            subdirectories.append(entry.path)
+            directories.extend(reversed(subdirectories))
+
     def get_files(self):
-        for file in self.get_full_list():
-            fullname = os.path.join(self.dir_path, file)
-            if os.path.isfile(fullname):
-                yield fullname
+        for entry in self.scan():
+            yield entry.path
 
     def get_file_list(self):
         return list(self.get_files())
 
     def get_directories(self):
-        for file in self.get_full_list():
-            if os.path.isdir(os.path.join(self.dir_path, file)):
-                yield file
+        with os.scandir(self.dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    yield entry.name
 
     def get_directory_list(self):
         return list(self.get_directories())
@@ -74,15 +323,138 @@ class DirectoryHandler:
         return file_list_with_size
 
 
+class DestinationDirectories:
+    """
+    The destination directories of a run
+    Each directory is checked and created at most once per run (in dry run, it is only remembered),
+    under a lock per directory so moves can run in threads
+    """
+
+    def __init__(self, on_create=None):
+        self.on_create = on_create  # Called with the directories created (parents first), e.g. to journal them
+        self._known = set()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def get_lock(self, directory):
+        with self._locks_lock:
+            lock = self._locks.get(directory)
+            if lock is None:
+                lock = self._locks[directory] = threading.Lock()
+            return lock
+
+    def ensure(self, directory, dry_run=False):
+        """
+        Make sure a destination directory exists, creating it if needed
+        :param directory: the directory
+        :param dry_run: only log the creation
+        :return: None
+        """
+        if directory in self._known:
+            return
+        with self.get_lock(directory):
+            if directory not in self._known:
+                created = self.create(directory, dry_run, list_created=self.on_create is not None)
+                if created:
+                    self.on_create(created)
+                self._known.add(directory)
+
+    def __contains__(self, directory):
+        return directory in self._known
+
+    @staticmethod
+    def create(directory, dry_run=False, list_created=False):
+        """
+        Create a directory and its parents if they don't exist
+        :param directory: the directory
+        :param dry_run: only log the creation
+        :param list_created: find which of the parents are created too
+        :return: the directories created, parents first (only if list_created)
+        """
+        created: List[str] = []
+        if not os.path.exists(directory):
+            logging.info('{}Creating directory: {}'.format(' > [dry] ' if dry_run else '', directory))
+            if not dry_run:
+                if list_created:
+                    parent = directory
+                    while parent and parent != os.path.dirname(parent) and not os.path.exists(parent):
+                        created.insert(0, parent)
+                        parent = os.path.dirname(parent)
+                try:
+                    os.makedirs(directory)
+                except FileExistsError:  # Created in the meantime, by another thread or process
+                    pass
+        return created
+
+
 class FileHandler:
-    def __init__(self, file_path):
+    """
+    A file to sort, kept small for runs over millions of files:
+    only the path is stored, its components (name, extension...) and its type are derived when needed
+    """
+    __slots__ = ("file_path", "future_name", "duplicate_of", "_file_name", "_stat", "_type")
+    sniff = None  # When to read the content of the file to find its type: None (never), "unknown" or "always"
+
+    def __init__(self, file_path, *, entry=None):
         self.file_path = file_path
-        self.file_name = os.path.basename(file_path)
-        self.dir_path = os.path.dirname(file_path)
-        self.name = self.file_name
-        self.base_name, self.extension = os.path.splitext(self.file_name)
-        self.type = self.guess_file_type()
         self.future_name = None  # Do a no operation
+        self.duplicate_of = None  # The path of the file this one is a copy of, set by the dedupe stage
+        self._file_name = None  # Only set when it differs from the name
+        self._stat = None
+        self._type = _UNTYPED
+        if entry is not None and _STAT_IN_LISTING:  # The entry itself is not kept, it holds the whole listing record
+            try:
+                self._stat = entry.stat()
+            except OSError:
+                pass
+
+    @classmethod
+    def configure(cls, **settings):
+        """
+        Configure the handlers of a run, from the general section of the config
+        :param settings: the settings, sniff is used: when to read the content of the files to find their type,
+                         None (never), "unknown" or "always". The settings of the other handlers are ignored
+        :return: None
+        :raises ValueError: if a setting is invalid
+        """
+        sniff = settings.get("sniff")
+        if sniff not in _SNIFF_MODES:
+            raise ValueError("Invalid sniff mode {}, expected one of {}".format(sniff, _SNIFF_MODES))
+        cls.sniff = sniff
+
+    @property
+    def name(self):
+        return os.path.basename(self.file_path)
+
+    @property
+    def file_name(self):
+        return self.name if self._file_name is None else self._file_name
+
+    @file_name.setter
+    def file_name(self, file_name):
+        self._file_name = file_name
+
+    @property
+    def dir_path(self):
+        return os.path.dirname(self.file_path)
+
+    @property
+    def base_name(self):
+        return os.path.splitext(self.name)[0]
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.name)[1]
+
+    @property
+    def type(self):
+        """The type of the file, computed once, the content of the file is only read when it is needed"""
+        if self._type is _UNTYPED:
+            file_type = self.guess_file_type()
+            if self.sniff == "always" or self.sniff == "unknown" and file_type is None:
+                file_type = sniffing.sniff_type(self.file_path) or file_type
+            self._type = file_type
+        return self._type
 
     def get_file_path(self):
         return self.file_path
@@ -90,8 +462,31 @@ class FileHandler:
     def get_file_name(self):
         return self.file_name
 
+    def stat(self):
+        """
+        Get the stat of the file, done at most once per handler
+        On Windows, the stat of the DirEntry the handler was created from is reused
+        :return: os.stat_result
+        """
+        if self._stat is None:
+            self._stat = os.stat(self.file_path)
+        return self._stat
+
+    @property
+    def stat_cached(self):
+        """Whether the file was already stat'ed by this handler"""
+        return self._stat is not None
+
+    def refresh_stat(self):
+        """
+        Forget the cached stat and stat the file again, for long running sessions
+        :return: os.stat_result
+        """
+        self._stat = None
+        return self.stat()
+
     def get_file_size(self):
-        return os.path.getsize(self.file_path)
+        return self.stat().st_size
 
     def get_file_size_in_mb(self):
         return self.get_file_size() / (1024 * 1024)
@@ -99,35 +494,47 @@ class FileHandler:
     def get_file_size_in_gb(self):
         return self.get_file_size() / (1024 * 1024 * 1024)
 
+    def get_mtime(self):
+        return self.stat().st_mtime
+
+    def get_ctime(self):
+        return self.stat().st_ctime
+
+    def get_mode(self):
+        return self.stat().st_mode
+
     def get_extension(self):
         return os.path.splitext(self.file_name)[1]
 
     def guess_file_type(self):
-        try:
-            return TYPE_BY_EXTENTION[self.extension[1:]]
-        except KeyError:
-            return None
+        return TYPE_BY_EXTENTION.get(self.extension[1:].lower())
+
+    def is_type(self, file_type):
+        return self.type == file_type
 
     def is_image(self):
-        return self.guess_file_type() == 'image'
+        return self.type == 'image'
 
     def is_picture(self):
         return self.is_image()
 
     def is_video(self):
-        return self.guess_file_type() == 'video'
+        return self.type == 'video'
 
     def is_music(self):
-        return self.guess_file_type() == 'music'
+        return self.type == 'music'
 
     def is_audio(self):
         return self.is_music()
 
     def is_document(self):
-        return self.guess_file_type() == 'document'
+        return self.type == 'document'
 
     def is_unknown(self):
-        return self.guess_file_type() is None
+        return self.type is None
+
+    def is_duplicate(self):
+        return self.duplicate_of is not None
 
     def is_bigger_than(self, size):
         return self.get_file_size() > int(size)
@@ -152,6 +559,11 @@ class FileHandler:
 
     def sort(self, list_of_condition_dicts, default=None):
         for condition in list_of_condition_dicts:
+            if isinstance(condition, Operation):
+                if condition.matches(self):
+                    self.future_name = condition.destination
+                    return self.future_name
+                continue
             try:
                 if not condition:
                     raise KeyError
@@ -170,7 +582,28 @@ class FileHandler:
         self.future_name = default
         return default
 
-    def move(self, destination=".", dry_run=False):
+    def destination_path(self, destination="."):
+        """
+        :param destination: the output directory
+        :return: the path the file goes to, or None if it stays where it is
+        """
+        if self.future_name is None:
+            return None
+        template = self.future_name
+        if template.__class__ is not DestinationTemplate:
+            template = DestinationTemplate.cached(template, self.__class__)
+        return os.path.join(destination, template.render(self))
+
+    def move(self, destination=".", dry_run=False, directories=None, target=None, mover=None):
+        """
+        Move the file to its destination
+        :param destination: the output directory
+        :param dry_run: only log the move
+        :param directories: the DestinationDirectories of the run, if it is shared
+        :param target: the path to move the file to, when it was planned (see MovePlanner), instead of its destination_path
+        :param mover: the function moving the file (see transfer.Mover, copying it across filesystems), os.rename by default
+        :return: the move done as (origin, destination), or None
+        """
         if dry_run:
             dry_run_message = ' > [dry] '
         else:
@@ -179,35 +612,176 @@ class FileHandler:
         if self.future_name is None:
             logging.debug('No future_name found for file: ' + self.file_name)  # This is a no-op
             return
-        destination = os.path.join(destination, self.future_name.format(obj=self))
+        destination = target if target is not None else self.destination_path(destination)
+        if os.path.abspath(destination) == os.path.abspath(self.file_path):
+            logging.debug('File already sorted: ' + self.file_name)  # Happens when walking the output recursively
+            return
         destination_dir = os.path.dirname(destination)
-        if not os.path.exists(destination_dir):
-            logging.info('{}Creating directory: {}'.format(dry_run_message, destination_dir))
-            if not dry_run:
-                os.makedirs(destination_dir)
+        if directories is None:
+            DestinationDirectories.create(destination_dir, dry_run)
+        else:
+            directories.ensure(destination_dir, dry_run)
 
         logging.info('{}Moving file: {} to {}'.format(dry_run_message, self.name, destination))
         if not dry_run:
-            os.rename(self.file_path, destination)
+            (mover or os.rename)(self.file_path, destination)
         return self.file_path, destination
 
 
-class ArtistHandler(FileHandler):
-    def __init__(self, file_path, regex=None):
+class SortedFile(FileHandler):
+    """
+    A file sorted in a worker process, with its destination already rendered there
+    Only what its move needs is kept, the file is not classified again
+    """
+    __slots__ = ("rendered",)
+
+    def __init__(self, file_path, future_name, rendered):
         super().__init__(file_path)
-        if regex is None:
-            regex = _guess_artist_regex.copy()
-        self.regex_list = regex
+        self.future_name = future_name
+        self.rendered = rendered  # The destination, relative to the output directory
+
+    def destination_path(self, destination="."):
+        return os.path.join(destination, self.rendered)
+
+
+class ArtistMatcher:
+    """
+    The artist regexes, compiled once and tried in order
+    A regex can require a literal, and is then only tried on the file names containing it (e.g. "by" for "... by artist")
+    """
+    _cache: Dict[Tuple[Any, ...], "ArtistMatcher"] = {}
+
+    def __init__(self, patterns):
+        """
+        :param patterns: list of regexes (str or compiled), (regex, literal) tuples or {"regex", "requires"} dicts,
+                         each regex with an artist and a file_name group
+        :raises re.error: if a regex is invalid
+        :raises ValueError: if a regex is missing a group
+        """
+        self.patterns = []
+        for pattern in patterns:
+            literal = None
+            if isinstance(pattern, dict):
+                pattern, literal = pattern["regex"], pattern.get("requires")
+            elif isinstance(pattern, (tuple, list)):
+                pattern, literal = pattern
+            regex = re.compile(pattern)
+            if "artist" not in regex.groupindex or "file_name" not in regex.groupindex:
+                raise ValueError("The artist regex {} needs an artist and a file_name group".format(regex.pattern))
+            self.patterns.append((regex.match, literal))
+
+    @classmethod
+    def cached(cls, patterns):
+        """Get the matcher of a list of regexes, compiled only once per run"""
+        key = tuple(tuple(sorted(pattern.items())) if isinstance(pattern, dict) else tuple(pattern) if isinstance(pattern, list) else pattern
+                    for pattern in patterns)
+        matcher = cls._cache.get(key)
+        if matcher is None:
+            matcher = cls._cache[key] = cls(patterns)
+        return matcher
+
+    def match(self, file_name):
+        """
+        :param file_name: the file name
+        :return: (artist, file name without the artist) or None if no regex matches
+        """
+        for match, literal in self.patterns:
+            if literal is not None and literal not in file_name:
+                continue
+            m = match(file_name)
+            if m:
+                return m.group("artist").strip(" "), m.group("file_name").strip(" ")
+        return None
+
+
+class ArtistRegistry:
+    """
+    The artists met during a run, so that "Foo", "foo ", "FOO" and "Foo_Bar"/"foo bar" end up in the same folder
+    Names are normalised (case folding, whitespace and punctuation collapsed) and resolved to the first spelling seen,
+    identical raw names are resolved from an LRU cache
+    With fuzzy matching, a new name is compared only to the known names starting with the same two characters
+    """
+
+    def __init__(self, fuzzy=None, cache_size=1 << 16):
+        """
+        :param fuzzy: the similarity ratio (0 to 1) above which two normalised names are the same artist, None to disable
+        :param cache_size: the number of raw names kept in the LRU cache
+        """
+        if fuzzy is not None and not 0 < fuzzy <= 1:
+            raise ValueError("The artist fuzzy ratio must be between 0 and 1, not {}".format(fuzzy))
+        self.fuzzy = fuzzy
+        self._artists = {}  # normalised name -> canonical name
+        self._buckets = {}  # first two characters -> normalised names, the fuzzy matching candidates
+        self._lock = threading.Lock()
+        self.resolve = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    @staticmethod
+    def normalise(name):
+        return _ARTIST_SEPARATORS.sub(" ", name.casefold()).strip()
+
+    def _resolve(self, name):
+        """
+        :param name: the artist name, as found in the file name
+        :return: the canonical name of the artist
+        """
+        key = self.normalise(name)
+        if not key:
+            return name
+        with self._lock:
+            canonical = self._artists.get(key)
+            if canonical is None:
+                bucket = self._buckets.setdefault(key[:2], [])
+                if self.fuzzy is not None:
+                    close = difflib.get_close_matches(key, bucket, n=1, cutoff=self.fuzzy)
+                    if close:
+                        canonical = self._artists[close[0]]
+                if canonical is None:
+                    canonical = name.strip()
+                    bucket.append(key)
+                self._artists[key] = canonical
+            return canonical
+
+    def __len__(self):
+        return len(set(self._artists.values()))
+
+
+class ArtistHandler(FileHandler):
+    __slots__ = ("artist", "regex_list")
+    matcher = ArtistMatcher(_guess_artist_regex)
+    registry: Optional[ArtistRegistry] = None  # The ArtistRegistry of the run, if artist names are normalised
+
+    def __init__(self, file_path, regex=None, *, entry=None):
+        super().__init__(file_path, entry=entry)
+        self.regex_list = regex  # Specific regexes for this handler, the shared matcher is used otherwise
         self.artist, self.file_name = self.guess_artist_and_file_name()
+        if self.artist is not None and self.registry is not None:
+            self.artist = self.registry.resolve(self.artist)
+
+    @classmethod
+    def configure(cls, **settings):
+        """
+        Configure the handlers of a run, from the general section of the config
+        :param settings: the settings of FileHandler, and:
+                         artist_regex: the artist regexes of the config, tried before the default ones (see ArtistMatcher)
+                         artist_normalise: merge the different spellings of an artist, with a new ArtistRegistry for the run
+                         artist_fuzzy: also merge the artists whose normalised names are this similar (0 to 1)
+        :return: None
+        :raises ValueError: if a setting is invalid
+        """
+        super().configure(**settings)
+        artist_regex, artist_fuzzy = settings.get("artist_regex"), settings.get("artist_fuzzy")
+        artist_normalise = settings.get("artist_normalise", False)
+        cls.registry = ArtistRegistry(artist_fuzzy) if artist_normalise or artist_fuzzy is not None else None
+        try:
+            cls.matcher = ArtistMatcher.cached(list(artist_regex or []) + _guess_artist_regex)
+        except re.error as e:
+            raise ValueError("Invalid artist regex {!r} : {}".format(e.pattern, e))
 
     def guess_artist_and_file_name(self):
         """Try to guess artist from file name"""
         try:
-            for r in self.regex_list:
-                m = re.match(r, self.file_name)
-                if m:
-                    return m.group("artist").strip(" "), m.group("file_name").strip(" ")
-            return None, self.base_name
+            matcher = self.matcher if self.regex_list is None else ArtistMatcher.cached(self.regex_list)
+            return matcher.match(self.file_name) or (None, self.base_name)
         except re.error as e:
             logging.error("An error occured while processing regex on " + self.file_name)
             logging.error(e)
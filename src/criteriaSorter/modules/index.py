@@ -0,0 +1,122 @@
+# Persistent index of the files already classified, so that re-runs only sort the new or changed files
+import hashlib
+import json
+import logging
+import os
+
+DEFAULT_INDEX_FILE = ".criteriaSorter.index"
+
+_COMMIT_EVERY = 10000
+
+
+def config_hash(config, operations):
+    """
+    Hash the config, the index is only valid for the config it was built with
+    :param config: the loaded config
+    :param operations: the batch of operations used
+    :return: the hash (hex string)
+    """
+    dump = json.dumps([config, operations], sort_keys=True, default=str)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+class ClassificationIndex:
+    """
+    The files classified by a previous run that stayed where they were (no operation matched them),
+    keyed by path, size and mtime, for a given config hash
+    """
+
+    def __init__(self, index_path, config_hash, read_only=False):
+        self.index_path = os.path.abspath(index_path)
+        self.read_only = read_only
+        self.stale = False
+        self.skipped = 0
+        self.closed = False
+        self._pending = 0
+        self._ignored = {self.index_path, self.index_path + "-journal"}
+        import sqlite3  # Only when the index is used, the CLI starts faster without it
+        self.connection = sqlite3.connect(self.index_path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'config_hash'").fetchone()
+            if row is None or row[0] != config_hash:
+                if read_only:
+                    self.stale = True  # Ignore the index, without clearing it
+                    return
+                if row is not None:
+                    logging.info("Config changed since the last run, clearing the index {}".format(self.index_path))
+                self.connection.execute("DELETE FROM files")
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('config_hash', ?)", (config_hash,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def is_unchanged(self, file_path, stat_result):
+        """
+        Whether the file was already classified, and hasn't changed since
+        :param file_path: the path of the file
+        :param stat_result: the current stat of the file
+        :return: bool
+        """
+        if self.stale:
+            return False
+        row = self.connection.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (os.path.abspath(file_path),)).fetchone()
+        return row is not None and row[0] == stat_result.st_size and row[1] == stat_result.st_mtime_ns
+
+    def filter_unchanged(self, entries):
+        """
+        Skip the files that are unchanged since they were indexed (and the index itself)
+        :param entries: an iterable of os.DirEntry
+        :return: generator of the os.DirEntry to sort
+        """
+        for entry in entries:
+            if os.path.abspath(entry.path) in self._ignored:
+                continue
+            try:
+                if self.is_unchanged(entry.path, entry.stat()):
+                    self.skipped += 1
+                    continue
+            except OSError as e:
+                logging.debug(e, exc_info=True)
+            yield entry
+
+    def record(self, file_path, stat_result):
+        """
+        Record a file that stays in place with the current config
+        :param file_path: the path of the file
+        :param stat_result: the stat of the file
+        :return: None
+        """
+        if self.read_only:
+            return
+        self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                                (os.path.abspath(file_path), stat_result.st_size, stat_result.st_mtime_ns))
+        self._pending += 1
+        if self._pending >= _COMMIT_EVERY:
+            self.connection.commit()
+            self._pending = 0
+
+    def record_unmoved(self, handlers):
+        """
+        Record the handlers that have nowhere to go, passing all the handlers through
+        :param handlers: an iterable of sorted handlers
+        :return: generator of the same handlers
+        """
+        for handler in handlers:
+            if handler.future_name is None:
+                try:
+                    self.record(handler.file_path, handler.stat())
+                except OSError as e:
+                    logging.debug(e, exc_info=True)
+            yield handler
+
+    def close(self):
+        if not self.closed:
+            self.connection.commit()
+            self.connection.close()
+            self.closed = True
@@ -0,0 +1,256 @@
+# The cancel journal: every move is appended to it as it is done, so that a sort can be undone even if it was interrupted
+# It is written as JSON Lines, one {"origin", "destination"} record per move and one {"mkdir"} record per directory created
+# The older "origin : destination" lines can still be replayed
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+from typing import Any, Deque, Optional, TextIO
+
+_PENDING_UNDOS_PER_JOB = 16
+
+
+class CancelJournal:
+    """
+    Append-only, buffered writer of the cancel file
+    Lines are flushed to the OS in batches (or after flush_interval seconds), and synced to the disk every fsync_every lines
+    The file is only created on the first move
+    """
+
+    def __init__(self, path, enabled=True, flush_every=256, fsync_every=4096, flush_interval=1.0):
+        self.path = path
+        self.enabled = enabled
+        self.flush_every = flush_every
+        self.fsync_every = fsync_every
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._file: Optional[TextIO] = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()  # Directories are recorded from the moving threads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logging.info("Writing cancel file...")
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1 << 16)
+        return self._file
+
+    def write(self, origin, destination):
+        """
+        Append a move to the journal
+        :param origin: the path the file was moved from
+        :param destination: the path the file was moved to
+        :return: None
+        """
+        self.write_record({"origin": origin, "destination": destination})
+
+    def write_directories(self, directories):
+        """
+        Append the directories created by the sort to the journal, parents first, so the cancel can remove them
+        :param directories: the paths of the directories created
+        :return: None
+        """
+        for directory in directories:
+            self.write_record({"mkdir": directory})
+
+    def write_record(self, record):
+        if not self.enabled:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=os.fspath) + "\n"
+        with self._lock:
+            file = self._file if self._file is not None else self.open()
+            file.write(line)
+            self.count += 1
+            if self.count % self.fsync_every == 0:
+                self.sync()
+            elif self.count % self.flush_every == 0 or time.monotonic() - self._last_flush > self.flush_interval:
+                self.flush()
+
+    def write_all(self, moves):
+        """
+        Append the moves to the journal as they are done
+        :param moves: an iterable of (origin, destination), can be a generator
+        :return: None
+        """
+        for origin, destination in moves:
+            self.write(origin, destination)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._last_flush = time.monotonic()
+
+    def sync(self):
+        if self._file is not None:
+            self.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+            logging.info("Written " + self.path)
+
+
+def parse_record(line):
+    """
+    Parse a line of a cancel journal
+    :param line: the line, JSON or the older "origin : destination"
+    :return: the record, a dict with either "origin" and "destination" or "mkdir"
+    :raises ValueError: if the line is not a valid record
+    """
+    line = line.rstrip("\r\n")
+    if line.startswith("{"):
+        record = json.loads(line)
+        if not isinstance(record, dict) or not ("mkdir" in record or "origin" in record and "destination" in record):
+            raise ValueError("Not a cancel record")
+        return record
+    origin, destination = line.split(" : ")
+    return {"origin": origin, "destination": destination}
+
+
+def read_lines_reversed(path, block_size=1 << 16):
+    """
+    Read the lines of a file from the last to the first, block by block
+    :param path: the path of the file
+    :param block_size: the size of the blocks read
+    :return: generator of the lines (str, without the line ending)
+    """
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode("utf-8")
+        yield remainder.decode("utf-8")
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def write_checkpoint(path, done):
+    with open(path + ".tmp", "w") as f:
+        f.write(str(done))
+    os.replace(path + ".tmp", path)
+
+
+def undo_move(record, mover=None):
+    """
+    Move a file back to where it was
+    :param record: the move record
+    :param mover: the function moving the file (see transfer.Mover), os.rename by default
+    :return: None
+    """
+    (mover or os.rename)(record["destination"], record["origin"])
+
+
+def remove_directories(directories):
+    """
+    Remove the directories created by a sort, the deepest first, if they are empty
+    :param directories: the paths of the directories
+    :return: None
+    """
+    for directory in sorted(set(directories), key=lambda d: d.count(os.sep), reverse=True):
+        try:
+            os.rmdir(directory)
+            logging.info("Removed directory {}".format(directory))
+        except OSError as e:
+            logging.debug("Directory {} not removed : {}".format(directory, e))
+
+
+def replay(path, jobs=1, checkpoint_every=1000, undo=undo_move):
+    """
+    Undo the moves of a cancel journal, from the last to the first, on a pool of threads
+    The progress is checkpointed in a path + ".progress" file, so an interrupted cancel resumes where it stopped,
+    and the directories created by the sort are removed once they are empty again
+    A move already undone after the last checkpoint (its destination gone and its origin back) is skipped on resume
+    :param path: the path of the cancel journal
+    :param jobs: the number of moves undone at the same time
+    :param checkpoint_every: the number of records between checkpoints
+    :param undo: the function undoing a move record
+    :return: the number of moves that could not be undone
+    """
+    checkpoint_path = path + ".progress"
+    done = read_checkpoint(checkpoint_path)
+    if done:
+        logging.info("Resuming the cancel of {} after {} records".format(path, done))
+    errors = 0
+    directories = []
+
+    def undo_line(line):
+        try:
+            record = parse_record(line)
+            if "mkdir" in record:
+                return record["mkdir"]
+            if not os.path.lexists(record["destination"]) and os.path.lexists(record["origin"]):
+                logging.debug("Already moved back {}".format(record["origin"]))
+                return None
+            undo(record)
+            logging.debug("Moved back {}".format(record["origin"]))
+        except Exception as e:
+            logging.error("Could not cancel {}".format(line))
+            logging.error(e)
+            logging.debug(e, exc_info=True)
+            return False
+
+    def collect(result):
+        nonlocal done, errors
+        if result is False:
+            errors += 1
+        elif result is not None:
+            directories.append(result)
+        done += 1
+        if done % checkpoint_every == 0:
+            write_checkpoint(checkpoint_path, done)
+
+    lines = (line for line in read_lines_reversed(path) if line.strip())
+    for _, line in zip(range(done), lines):  # Skip the records already undone, but still remove their directories
+        try:
+            record = parse_record(line)
+        except ValueError:
+            continue
+        if "mkdir" in record:
+            directories.append(record["mkdir"])
+    try:
+        if jobs <= 1:
+            for line in lines:
+                collect(undo_line(line))
+        else:
+            from concurrent.futures import Future, ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                pending: Deque[Future[Any]] = deque()
+                for line in lines:
+                    pending.append(executor.submit(undo_line, line))
+                    if len(pending) >= jobs * _PENDING_UNDOS_PER_JOB:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    except BaseException:
+        write_checkpoint(checkpoint_path, done)
+        raise
+    remove_directories(directories)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return errors
@@ -0,0 +1,122 @@
+# Pipeline mode of the sort: the scan, the sorting and the moves run as concurrent asyncio stages connected by
+# bounded queues, so the first files are moved while the tree is still being scanned
+# The blocking calls (scandir, stat, sniffing, rename) run on a thread pool, the index is only used from the event loop
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, List, Optional
+
+_BATCH_SIZE = 64  # Files per call to the thread pool, small so the first moves start early
+_QUEUE_BATCHES = 8  # Batches waiting between two stages
+_PENDING_MOVES_PER_JOB = 16
+
+_DONE = None
+
+
+def next_batch(entries, batch_size):
+    return list(islice(entries, batch_size))
+
+
+async def scan_stage(loop, executor, entries, queue, index, batch_size):
+    """
+    Read the directory scan batch by batch, skipping the files unchanged since the last run
+    :param loop: the event loop
+    :param executor: the thread pool the scan runs on
+    :param entries: an iterator of os.DirEntry, from DirectoryHandler.scan
+    :param queue: the queue of the batches to sort
+    :param index: the ClassificationIndex, if any
+    :param batch_size: the number of entries per batch
+    :return: None
+    """
+    try:
+        while True:
+            batch = await loop.run_in_executor(executor, next_batch, entries, batch_size)
+            if not batch:
+                break
+            if index is not None:
+                batch = list(index.filter_unchanged(batch))
+            if batch:
+                await queue.put(batch)
+    finally:
+        await queue.put(_DONE)
+
+
+async def sort_stage(loop, executor, sort_batch, in_queue, out_queue, index, jobs):
+    """
+    Sort the batches of entries, and pass on the handlers that have somewhere to go
+    :param loop: the event loop
+    :param executor: the thread pool the sorting runs on
+    :param sort_batch: function sorting a list of os.DirEntry, returning the sorted handlers
+    :param in_queue: the queue of the batches to sort
+    :param out_queue: the queue of the handlers to move
+    :param index: the ClassificationIndex recording the files that stay in place, if any
+    :param jobs: the number of move stages to stop at the end
+    :return: None
+    """
+    try:
+        while True:
+            batch = await in_queue.get()
+            if batch is _DONE:
+                break
+            handlers = await loop.run_in_executor(executor, sort_batch, batch)
+            if index is not None:
+                handlers = index.record_unmoved(handlers)
+            for handler in handlers:
+                if handler.future_name is not None:
+                    await out_queue.put(handler)
+    finally:
+        for _ in range(jobs):
+            await out_queue.put(_DONE)
+
+
+async def move_stage(loop, executor, move, queue):
+    """
+    Move the sorted handlers as they come
+    :param loop: the event loop
+    :param executor: the thread pool the moves run on
+    :param move: function moving a handler (and recording the move), run on the thread pool
+    :param queue: the queue of the handlers to move
+    :return: the number of handlers processed
+    """
+    count = 0
+    while True:
+        handler = await queue.get()
+        if handler is _DONE:
+            return count
+        await loop.run_in_executor(executor, move, handler)
+        count += 1
+
+
+async def run_stages(entries, sort_batch, move, index, jobs, batch_size):
+    loop = asyncio.get_event_loop()
+    batches: asyncio.Queue[Optional[List[Any]]] = asyncio.Queue(maxsize=_QUEUE_BATCHES)
+    handlers: asyncio.Queue[Any] = asyncio.Queue(maxsize=jobs * _PENDING_MOVES_PER_JOB)
+    with ThreadPoolExecutor(max_workers=jobs + 2) as executor:  # One thread for the scan, one for the sorting
+        tasks = [loop.create_task(scan_stage(loop, executor, entries, batches, index, batch_size)),
+                 loop.create_task(sort_stage(loop, executor, sort_batch, batches, handlers, index, jobs))]
+        tasks += [loop.create_task(move_stage(loop, executor, move, handlers)) for _ in range(jobs)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+    return sum(results[2:])
+
+
+def run_pipeline(entries, sort_batch, move, index=None, jobs=1, batch_size=_BATCH_SIZE):
+    """
+    Scan, sort and move the files concurrently
+    :param entries: an iterable of os.DirEntry, from DirectoryHandler.scan (can be a generator)
+    :param sort_batch: function sorting a list of os.DirEntry, returning the sorted handlers
+    :param move: function moving a handler (and recording the move)
+    :param index: the ClassificationIndex, if any
+    :param jobs: the number of files moved at the same time
+    :param batch_size: the number of files scanned and sorted at once
+    :return: the number of files sent to be moved
+    """
+    count = asyncio.run(run_stages(iter(entries), sort_batch, move, index, max(jobs, 1), batch_size))
+    logging.debug("[Pipeline] {} sorted files sent to the moves".format(count))
+    return count
@@ -0,0 +1,153 @@
+# Planning of the moves: every destination is claimed before any file is renamed, so that two files going to the same
+# path, or a file going to a path already taken, are resolved by a policy instead of overwritten by os.rename
+import hashlib
+import logging
+import os
+import threading
+
+from itertools import count
+from typing import Any, Dict, List, Tuple
+
+COLLISION_POLICIES = ("skip", "suffix", "hash")
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(file_path, block_size=_HASH_BLOCK_SIZE):
+    """
+    Hash the content of a file
+    :param file_path: the path of the file
+    :param block_size: the size of the blocks read
+    :return: the digest (bytes)
+    """
+    digest = hashlib.blake2b()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def same_content(file_path, other_path):
+    """
+    Whether two files have the same content, comparing their sizes before their hashes
+    :return: bool, False if one of them can't be read
+    """
+    try:
+        if os.path.getsize(file_path) != os.path.getsize(other_path):
+            return False
+        return file_digest(file_path) == file_digest(other_path)
+    except OSError as e:
+        logging.debug(e, exc_info=True)
+        return False
+
+
+class MovePlanner:
+    """
+    The destinations claimed by the moves of a run
+    A destination is taken if a file of the run already claimed it, or if it exists in its directory,
+    each destination directory being listed once, so checking a destination doesn't stat it
+    For a few files (e.g. the files arriving in a watched folder), each destination is checked instead of listing its directory
+    """
+
+    def __init__(self, output_directory=".", policy="suffix", list_directories=True):
+        """
+        :param output_directory: the directory the destinations are relative to
+        :param policy: what to do with a file whose destination is taken:
+                       skip (leave it in place), suffix (add " (1)", " (2)"... to its name),
+                       or hash (leave it in place if it is a duplicate of the file there, add a suffix otherwise)
+        :param list_directories: list each destination directory once, or check each destination with os.path.lexists
+        """
+        if policy not in COLLISION_POLICIES:
+            raise ValueError("Unknown collision policy '{}', use one of {}".format(policy, ", ".join(COLLISION_POLICIES)))
+        self.output_directory = output_directory
+        self.policy = policy
+        self.list_directories = list_directories
+        self.claimed = {}  # normalised destination -> origin
+        self.skipped = 0
+        self.renamed = 0
+        self.duplicates = 0
+        self._listings = {}  # directory -> names in it when the run started
+        self._lock = threading.Lock()
+
+    def existing_names(self, directory):
+        names = self._listings.get(directory)
+        if names is None:
+            try:
+                names = set(os.listdir(directory))
+            except OSError:  # Not created yet
+                names = set()
+            self._listings[directory] = names
+        return names
+
+    def is_taken(self, target):
+        key = os.path.normcase(os.path.abspath(target))
+        if key in self.claimed:
+            return True
+        if not self.list_directories:
+            return os.path.lexists(target)
+        return os.path.basename(target) in self.existing_names(os.path.dirname(target))
+
+    def claim(self, origin, target):
+        self.claimed[os.path.normcase(os.path.abspath(target))] = origin
+        return target
+
+    def is_duplicate(self, file_path, key, target):
+        """
+        Whether a file has the same content as the file that took its destination
+        That file is compared where it was when it claimed the destination, or at the destination once it was moved there,
+        as the pipeline and watch modes move the files while the next ones are planned
+        """
+        origin = self.claimed.get(key)
+        if origin is not None and same_content(file_path, origin):
+            return True
+        return (origin is None or not os.path.exists(origin)) and same_content(file_path, target)
+
+    def plan(self, handler):
+        """
+        Find where a sorted file goes, and claim it
+        :param handler: the sorted handler
+        :return: the path to move the file to, or None if it is not moved
+        """
+        target = handler.destination_path(self.output_directory)
+        if target is None or os.path.abspath(target) == os.path.abspath(handler.file_path):
+            return target  # Nothing to claim, FileHandler.move skips it
+        with self._lock:
+            if not self.is_taken(target):
+                return self.claim(handler.file_path, target)
+            key = os.path.normcase(os.path.abspath(target))
+            if self.policy == "skip":
+                logging.warning("[Move planning] {} already taken, {} not moved".format(target, handler.file_path))
+                self.skipped += 1
+                return None
+            if self.policy == "hash" and self.is_duplicate(handler.file_path, key, target):
+                logging.info("[Move planning] {} is a duplicate of {}, not moved".format(handler.file_path, target))
+                self.duplicates += 1
+                return None
+            base, extension = os.path.splitext(target)
+            for i in count(1):
+                candidate = "{} ({}){}".format(base, i, extension)
+                if not self.is_taken(candidate):
+                    logging.info("[Move planning] {} already taken, moving {} to {}".format(target, handler.file_path, candidate))
+                    self.renamed += 1
+                    return self.claim(handler.file_path, candidate)
+
+    def plan_moves(self, handlers):
+        """
+        Plan the moves of all the sorted handlers before any of them is done
+        :param handlers: the sorted handlers (can be a generator)
+        :return: list of (handler, target), grouped by destination directory
+        """
+        groups: Dict[str, List[Tuple[Any, str]]] = {}
+        for handler in handlers:
+            try:
+                target = self.plan(handler)
+            except Exception as e:
+                logging.error("[Move planning] Could not plan the move of {}".format(handler.file_name))
+                logging.error(e)
+                logging.debug(e, exc_info=True)
+                continue
+            if target is not None:
+                groups.setdefault(os.path.dirname(target), []).append((handler, target))
+        if self.skipped or self.renamed or self.duplicates:
+            logging.warning("[Move planning] Destinations taken: {} files skipped, {} renamed, {} duplicates left in place".format(
+                self.skipped, self.renamed, self.duplicates))
+        return [move for group in groups.values() for move in group]
@@ -0,0 +1,124 @@
+# Profiling of the conditions, shown with sort --profile: the calls, time and pass ratio of every condition of every
+# operation, and a cheaper order for the conditions of each operation
+# The profiled conditions are copies of the compiled ones, the operations are untouched when profiling is off
+import time
+
+import rich
+from rich.table import Table
+
+from criteriaSorter.modules.fileops import Condition, Operation
+
+
+class ProfiledCondition(Condition):
+    """A condition counting its calls, its passes and the time spent in it"""
+    __slots__ = ("calls", "passes", "seconds")
+
+    def __init__(self, name, function, args=()):
+        super().__init__(name, function, args)
+        self.calls = 0
+        self.passes = 0
+        self.seconds = 0.0
+
+    def __call__(self, handler):
+        start = time.perf_counter()
+        try:
+            result = self.function(handler, *self.args)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.calls += 1
+        if result:
+            self.passes += 1
+        return result
+
+    @property
+    def cost(self):
+        """The mean time of a call, in seconds"""
+        return self.seconds / self.calls if self.calls else 0.0
+
+    @property
+    def pass_ratio(self):
+        return self.passes / self.calls if self.calls else 1.0
+
+    def __str__(self):
+        return self.name + "".join("," + str(arg) for arg in self.args)
+
+
+class ProfiledOperation(Operation):
+    """An operation counting how often it is tried and matched, and the time spent in its conditions"""
+    __slots__ = ("evaluations", "matched", "seconds")
+
+    def __init__(self, name, conditions, destination):
+        super().__init__(name, conditions, destination)
+        self.evaluations = 0
+        self.matched = 0
+        self.seconds = 0.0
+
+    def matches(self, handler):
+        start = time.perf_counter()
+        try:
+            result = super().matches(handler)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.evaluations += 1
+        if result:
+            self.matched += 1
+        return result
+
+
+def profile_operations(operation_list):
+    """
+    Copy the compiled operations into profiled ones
+    :param operation_list: the list of compiled operations
+    :return: list of ProfiledOperation, evaluated exactly like the operations
+    """
+    return [ProfiledOperation(operation.name, [ProfiledCondition(condition.name, condition.function, condition.args)
+                                               for condition in operation.conditions], operation.destination)
+            for operation in operation_list]
+
+
+def rank(condition):
+    """
+    The rank of a condition in a chain of conditions that all need to pass: its cost over the chance it stops the chain
+    Ordering by increasing rank minimizes the expected cost of the chain, for conditions independent of each other
+    :param condition: a ProfiledCondition
+    :return: the rank (float, infinite for a condition that always passes)
+    """
+    if not condition.calls:
+        return float("inf")
+    fail_ratio = 1 - condition.pass_ratio
+    return condition.cost / fail_ratio if fail_ratio else float("inf")
+
+
+def suggest_order(operation):
+    """
+    Suggest an order for the conditions of an operation, cheap and selective conditions first
+    The order of the operations is kept (the first match wins), only the conditions inside an operation are reordered,
+    which doesn't change which files match as long as the conditions have no side effects
+    :param operation: a ProfiledOperation
+    :return: the conditions in the suggested order (the current order is kept for ties and conditions never called)
+    """
+    return sorted(operation.conditions, key=rank)
+
+
+def report_profile(operation_list):
+    """
+    Print the profile of the operations, and the conditions worth reordering
+    :param operation_list: the list of ProfiledOperation, after a sort
+    :return: None
+    """
+    table = Table(title="Conditions")
+    for column in ("operation", "condition", "calls", "pass %", "seconds", "µs/call"):
+        table.add_column(column, justify="left" if column in ("operation", "condition") else "right")
+    for operation in operation_list:
+        table.add_row(operation.name, "[b]{} matched / {} tried[/b]".format(operation.matched, operation.evaluations), "", "",
+                      "{:.4f}".format(operation.seconds), "")
+        for condition in operation.conditions:
+            table.add_row("", str(condition), str(condition.calls), "{:.1f}".format(100 * condition.pass_ratio),
+                          "{:.4f}".format(condition.seconds), "{:.2f}".format(condition.cost * 1e6))
+    rich.print(table)
+
+    for operation in operation_list:
+        suggested = suggest_order(operation)
+        if list(suggested) != list(operation.conditions):
+            rich.print("Suggested order for {}:".format(operation.name))
+            rich.print("  conditions : |\n" + "".join("    {}\n".format(condition) for condition in suggested))
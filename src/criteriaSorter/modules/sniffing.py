@@ -0,0 +1,79 @@
+# Detection of the file type from the first bytes of the file (magic numbers), for files with a wrong or no extension
+import logging
+
+HEADER_SIZE = 512
+
+# (offset, magic, type), checked in order
+_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image"),  # jpg
+    (0, b"\x89PNG\r\n\x1a\n", "image"),  # png
+    (0, b"GIF87a", "image"),  # gif
+    (0, b"GIF89a", "image"),
+    (0, b"II*\x00", "image"),  # tiff
+    (0, b"MM\x00*", "image"),
+    (0, b"BM", "image"),  # bmp, checked with its header size below
+    (0, b"\x1aE\xdf\xa3", "video"),  # mkv
+    (0, b"FLV\x01", "video"),  # flv
+    (0, b"\x00\x00\x01\xba", "video"),  # mpg
+    (0, b"\x00\x00\x01\xb3", "video"),
+    (0, b"0&\xb2u\x8ef\xcf\x11", "video"),  # wmv (and wma, an asf container)
+    (0, b"ID3", "music"),  # mp3
+    (0, b"OggS", "music"),  # ogg
+    (0, b"fLaC", "music"),  # flac
+    (0, b"%PDF", "document"),  # pdf
+    (0, b"{\\rtf", "document"),  # rtf
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "document"),  # doc, xls, ppt
+]
+
+_RIFF_TYPES = {b"AVI ": "video", b"WAVE": "music"}
+_AIFF_TYPES = {b"AIFF": "music", b"AIFC": "music"}
+_FTYP_MUSIC_BRANDS = (b"M4A ", b"M4B ", b"M4P ")
+_ZIP_DOCUMENT_MARKERS = (b"[Content_Types].xml", b"word/", b"xl/", b"ppt/", b"mimetypeapplication/vnd.oasis.opendocument")
+
+
+def read_header(file_path, size=HEADER_SIZE):
+    """
+    Read the first bytes of a file, in a single unbuffered read
+    :param file_path: the path of the file
+    :param size: the number of bytes to read
+    :return: the bytes read
+    """
+    with open(file_path, "rb", buffering=0) as f:
+        return f.read(size)
+
+
+def guess_type_from_header(header):
+    """
+    Guess the type of a file from its first bytes
+    :param header: the first bytes of the file
+    :return: the type (image, video, music, document) or None if unknown
+    """
+    if header[4:8] == b"ftyp":  # mp4, mov, m4v, 3gp, m4a
+        return "music" if header[8:12] in _FTYP_MUSIC_BRANDS else "video"
+    if header[:4] == b"RIFF":
+        return _RIFF_TYPES.get(header[8:12])
+    if header[:4] == b"FORM":
+        return _AIFF_TYPES.get(header[8:12])
+    if header[:4] == b"PK\x03\x04":  # Office and OpenDocument files are zip files
+        return "document" if any(marker in header for marker in _ZIP_DOCUMENT_MARKERS) else None
+    if len(header) > 1 and header[0] == 0xff and header[1] & 0xf6 in (0xf0, 0xf2):
+        return "music"  # mp3 or aac frame sync
+    for offset, magic, file_type in _SIGNATURES:
+        if header.startswith(magic, offset):
+            if magic == b"BM" and header[14:15] not in (b"\x0c", b"(", b"@", b"l", b"|"):
+                continue  # Too short a magic to be trusted without the size of the bitmap header
+            return file_type
+    return None
+
+
+def sniff_type(file_path):
+    """
+    Guess the type of a file from its content
+    :param file_path: the path of the file
+    :return: the type (image, video, music, document) or None if unknown or unreadable
+    """
+    try:
+        return guess_type_from_header(read_header(file_path))
+    except OSError as e:
+        logging.debug("Could not sniff {} : {}".format(file_path, e))
+        return None
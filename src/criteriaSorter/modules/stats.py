@@ -0,0 +1,191 @@
+# Statistics of a sort, shown with --stats: the time spent in each phase, counters of the files and syscalls,
+# the files matched by each operation and the errors. Nothing is collected without --stats
+import json
+import logging
+import re
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+import rich
+from rich.table import Table
+
+_ERROR_TAG = re.compile(r"\[([^\]]+)\]")
+
+
+class ErrorCounter(logging.Handler):
+    """
+    Count the errors logged during a run, by the [tag] their message starts with
+    The details logged after an error (the exception itself) are not counted again
+    """
+
+    def __init__(self, errors):
+        super().__init__(level=logging.ERROR)
+        self.errors = errors
+
+    def emit(self, record):
+        if not isinstance(record.msg, str):
+            return
+        match = _ERROR_TAG.match(record.msg)
+        self.errors[match.group(1) if match else "other"] += 1
+
+
+class RunStats:
+    """
+    Timings and counters of a sort
+    The phases are streamed into each other, so the time of a phase excludes the time of the phases it pulls from,
+    however deep the chain: every second is counted in a single phase
+    """
+
+    def __init__(self):
+        self.phases = {}  # name -> seconds
+        self.counters: Counter[str] = Counter()
+        self.matches: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self._started = time.perf_counter()
+        self._counted = 0.0  # The seconds counted in all the phases so far
+        self._error_counter = ErrorCounter(self.errors)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        logging.getLogger().addHandler(self._error_counter)
+        return self
+
+    def __exit__(self, *args):
+        logging.getLogger().removeHandler(self._error_counter)
+        self.phases["total"] = time.perf_counter() - self._started
+        return False
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase done at once, without the time of the streamed phases pulled from during it
+        :param name: the name of the phase
+        """
+        self.phases.setdefault(name, 0.0)
+        counted_before = self._counted
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._count(name, time.perf_counter() - start - (self._counted - counted_before))
+
+    def _count(self, name, seconds):
+        self.phases[name] += seconds
+        self._counted += seconds
+
+    def counted(self, function, counter):
+        """
+        Count the calls of a function returning something, from any thread
+        :param function: the function
+        :param counter: the name of the counter
+        :return: the function counting its calls
+        """
+        def call(*args, **kwargs):
+            result = function(*args, **kwargs)
+            if result:
+                with self._lock:
+                    self.counters[counter] += 1
+            return result
+        return call
+
+    def timed(self, name, iterable, counter=None):
+        """
+        Time a streamed phase, without the time of the streamed phases its iterable pulls from
+        :param name: the name of the phase
+        :param iterable: the items of the phase (can be a generator)
+        :param counter: the counter of the items, if any
+        :return: generator of the same items
+        """
+        self.phases.setdefault(name, 0.0)  # Listed in the order the phases are chained, not the order they start
+        return self._timed(name, iter(iterable), counter)
+
+    def _timed(self, name, iterator, counter):
+        clock = time.perf_counter
+        while True:
+            counted_before = self._counted
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._count(name, clock() - start - (self._counted - counted_before))
+                return
+            self._count(name, clock() - start - (self._counted - counted_before))
+            if counter is not None:
+                self.counters[counter] += 1
+            yield item
+
+    def count_matches(self, handlers, operation_list, default_destination=None):
+        """
+        Count the files matched by each operation, from the destination they were given
+        :param handlers: the sorted handlers (can be a generator)
+        :param operation_list: the compiled operations, operations sharing a destination are counted as the first one
+        :param default_destination: the default destination of the files
+        :return: generator of the same handlers
+        """
+        names = {None: "no match"}
+        if default_destination is not None:
+            names[default_destination] = "default destination"
+        for operation in reversed(operation_list):
+            names[operation.destination] = operation.name
+        for handler in handlers:
+            self.matches[names.get(handler.future_name, "other")] += 1
+            if handler.stat_cached:
+                self.counters["stat"] += 1
+            yield handler
+
+    def count_moves(self, moves, dry_run=False):
+        """
+        Count the moves done
+        :param moves: the moves, as (origin, destination) (can be a generator)
+        :param dry_run: whether the moves were only logged
+        :return: generator of the same moves
+        """
+        counter = "dry run moves" if dry_run else "rename"
+        for move in moves:
+            self.counters[counter] += 1
+            yield move
+
+    def count_directories(self, on_create):
+        """
+        Count the directories created
+        :param on_create: the callback of the DestinationDirectories, if any
+        :return: the callback counting the directories
+        """
+        def counted(directories):
+            with self._lock:
+                self.counters["mkdir"] += len(directories)
+            if on_create is not None:
+                on_create(directories)
+        return counted
+
+    def as_dict(self):
+        return {"phases": self.phases, "counters": dict(self.counters), "matches": dict(self.matches), "errors": dict(self.errors)}
+
+    def report(self, output_format="table"):
+        """
+        Print the statistics
+        :param output_format: "table" for rich tables, "json" for a JSON document on the standard output
+        :return: None
+        """
+        if output_format == "json":
+            print(json.dumps(self.as_dict(), indent=2, sort_keys=True))
+            return
+        total = self.phases.get("total") or 1
+        table = Table(title="Phases")
+        table.add_column("phase")
+        table.add_column("seconds", justify="right")
+        table.add_column("%", justify="right")
+        for name, seconds in self.phases.items():
+            table.add_row(name, "{:.3f}".format(seconds), "{:.1f}".format(100 * seconds / total))
+        rich.print(table)
+        for title, counter in (("Counters", self.counters), ("Matches", self.matches), ("Errors", self.errors)):
+            if counter:
+                table = Table(title=title)
+                table.add_column("name")
+                table.add_column("count", justify="right")
+                for name, count in counter.most_common():
+                    table.add_row(name, str(count))
+                rich.print(table)
@@ -0,0 +1,148 @@
+# Moves across filesystems: os.rename fails with EXDEV when the destination is on another mount, the file is then
+# copied by the kernel (copy_file_range, or sendfile), synced to the disk, and only then removed from its origin
+import errno
+import logging
+import os
+import threading
+
+_COPY_CHUNK = 1 << 30
+_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.EPERM,
+                errno.ENOTSOCK)  # The sendfile of macOS and the BSDs only writes to sockets
+
+
+def copy_content(source_fd, destination_fd):
+    """
+    Copy the content of a file in the kernel when possible: copy_file_range, then sendfile, then read and write
+    :param source_fd: the file descriptor of the file to copy, at its start
+    :param destination_fd: the file descriptor of the copy, at its start
+    :return: the number of bytes copied
+    """
+    copied = 0
+    copy_file_range = getattr(os, "copy_file_range", None)  # Linux, Python 3.8+
+    if copy_file_range is not None:
+        try:
+            while True:
+                count = copy_file_range(source_fd, destination_fd, _COPY_CHUNK)
+                if not count:
+                    return copied
+                copied += count
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED or copied:
+                raise
+    sendfile = getattr(os, "sendfile", None)
+    if sendfile is not None:
+        try:
+            while True:
+                count = sendfile(destination_fd, source_fd, copied, _COPY_CHUNK)
+                if not count:
+                    return copied
+                copied += count
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED or copied:
+                raise
+    while True:
+        block = os.read(source_fd, 1 << 20)
+        if not block:
+            return copied
+        view = memoryview(block)
+        while view:
+            view = view[os.write(destination_fd, view):]
+        copied += len(block)
+
+
+def sync_directory(directory):
+    """Sync a directory, so the entries created in it survive a crash"""
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:  # Not possible on every platform
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def copy_and_unlink(source, destination, fsync=True):
+    """
+    Move a file to another filesystem: copy it with its mode and timestamps, sync the copy, then remove the origin
+    The copy never replaces an existing file, and is removed if anything fails, so the origin is never lost
+    :param source: the path of the file
+    :param destination: the path to move it to
+    :param fsync: sync the copy and its directory before removing the origin
+    :return: None
+    """
+    source_fd = os.open(source, os.O_RDONLY)
+    try:
+        stat_result = os.fstat(source_fd)
+        destination_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            copy_content(source_fd, destination_fd)
+            os.chmod(destination_fd if os.chmod in os.supports_fd else destination, stat_result.st_mode & 0o7777)
+            os.utime(destination_fd if os.utime in os.supports_fd else destination, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+            if fsync:
+                os.fsync(destination_fd)
+        except BaseException:
+            os.close(destination_fd)
+            os.unlink(destination)
+            raise
+        os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+    if fsync:
+        sync_directory(os.path.dirname(destination))
+    try:
+        os.unlink(source)
+    except OSError:
+        os.unlink(destination)  # Keep a single copy, where the file was
+        raise
+
+
+class Mover:
+    """
+    Move files with os.rename, or by copying them when the destination is on another filesystem
+    Whether a source and a destination directory are on the same device is checked once per pair of directories,
+    and at most copy_jobs copies run at the same time, whatever the number of threads moving the files
+    """
+
+    def __init__(self, copy_jobs=2, fsync=True):
+        self.fsync = fsync
+        self.copied = 0
+        self._devices = {}  # directory -> st_dev
+        self._cross_device = set()  # (source device, destination device) known to need a copy
+        self._copies = threading.BoundedSemaphore(max(copy_jobs, 1))
+        self._lock = threading.Lock()
+
+    def device(self, directory):
+        """The device of a directory, or None if it can't be found (os.rename then reports the error)"""
+        device = self._devices.get(directory)
+        if device is None:
+            try:
+                device = self._devices[directory] = os.stat(directory or ".").st_dev
+            except OSError:
+                return None
+        return device
+
+    def __call__(self, source, destination):
+        """
+        Move a file
+        :param source: the path of the file
+        :param destination: the path to move it to, in an existing directory
+        :return: None
+        """
+        devices = (self.device(os.path.dirname(source)), self.device(os.path.dirname(destination)))
+        if None in devices or devices not in self._cross_device:  # Bind mounts of a device can't rename into each other either
+            try:
+                os.rename(source, destination)
+                return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                logging.info("{} and {} are on different filesystems, the files will be copied".format(source, destination))
+                if None not in devices:
+                    self._cross_device.add(devices)
+        with self._copies:
+            copy_and_unlink(source, destination, self.fsync)
+        with self._lock:
+            self.copied += 1
@@ -0,0 +1,280 @@
+# Watch mode: the new files of a folder are sorted as they arrive, instead of rescanning the whole folder periodically
+# Linux inotify is used through ctypes when available, with a polling fallback elsewhere
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+from criteriaSorter.modules.fileops import DirectoryHandler
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len, followed by the name
+_READ_SIZE = 64 * 1024
+
+_TICK = 0.1  # Seconds between two checks of the files still being written
+_IDLE_TIMEOUT = 1.0  # Seconds between two checks of the stop event when nothing happens
+
+
+def parse_events(data):
+    """
+    Parse the events read from an inotify file descriptor
+    :param data: the bytes read
+    :return: generator of (wd, mask, name)
+    """
+    offset = 0
+    while offset + _EVENT.size <= len(data):
+        wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+        offset += _EVENT.size
+        name = data[offset:offset + length].split(b"\0", 1)[0]
+        offset += length
+        yield wd, mask, os.fsdecode(name)
+
+
+class InotifyWatcher:
+    """
+    The files created, written or moved into a folder (and its subfolders if recursive), from Linux inotify
+    """
+
+    def __init__(self, folder, recursive=False, exclude=()):
+        """
+        :param folder: the folder to watch
+        :param recursive: also watch the subfolders, including the ones created later
+        :param exclude: absolute paths of the folders not to watch
+        :raises OSError: if inotify is not available
+        """
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.folder = folder
+        self.recursive = recursive
+        self.exclude = exclude
+        self._directories = {}  # wd -> directory
+        self._found = []
+        self.add_directory(folder)
+
+    def add_directory(self, directory):
+        """Watch a directory, and its subdirectories if recursive"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            logging.warning("Could not watch {} : {}".format(directory, os.strerror(error)))
+            return
+        self._directories[wd] = directory
+        if self.recursive:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and os.path.abspath(entry.path) not in self.exclude:
+                        self.add_directory(entry.path)
+
+    def add_created_directory(self, directory):
+        """Watch a directory created after the start, and report the files written in it before it was watched"""
+        self.add_directory(directory)
+        for entry in DirectoryHandler(directory).scan(recursive=True, exclude=self.exclude):
+            self._found.append(entry.path)
+
+    def read(self, timeout):
+        """
+        Wait for events
+        :param timeout: the maximum time to wait, in seconds
+        :return: list of the paths of the files created or changed
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                data = b""
+            for wd, mask, name in parse_events(data):
+                if mask & IN_Q_OVERFLOW:
+                    logging.warning("Too many events at once, rescanning {}".format(self.folder))
+                    self._found.extend(entry.path for entry in DirectoryHandler(self.folder).scan(self.recursive, self.exclude))
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF):
+                    self._directories.pop(wd, None)
+                    continue
+                directory = self._directories.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and os.path.abspath(path) not in self.exclude:
+                        self.add_created_directory(path)
+                else:
+                    self._found.append(path)
+        found, self._found = self._found, []
+        return found
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PollingWatcher:
+    """
+    The files created or changed in a folder, found by rescanning it every interval seconds
+    """
+
+    def __init__(self, folder, recursive=False, exclude=(), interval=1.0):
+        """
+        :param folder: the folder to watch
+        :param recursive: also watch the subfolders
+        :param exclude: absolute paths of the folders not to watch
+        :param interval: the time between two scans, in seconds
+        """
+        self.directory_handler = DirectoryHandler(folder)
+        self.recursive = recursive
+        self.exclude = exclude
+        self.interval = interval
+        self._next_scan = time.monotonic()
+        self._snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for entry in self.directory_handler.scan(self.recursive, self.exclude):
+            try:
+                stat_result = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (stat_result.st_size, stat_result.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        """
+        Wait for the next scan
+        :param timeout: the maximum time to wait, in seconds
+        :return: list of the paths of the files created or changed since the last scan
+        """
+        wait = self._next_scan + self.interval - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self._next_scan = time.monotonic()
+        snapshot = self.scan()
+        found = [path for path, signature in snapshot.items() if self._snapshot.get(path) != signature]
+        self._snapshot = snapshot
+        return found
+
+    def close(self):
+        self._snapshot = {}
+
+
+class Debouncer:
+    """
+    The files still being written: a file is ready once its size and mtime haven't changed for settle seconds
+    """
+
+    def __init__(self, settle=0.5):
+        self.settle = settle
+        self._pending = {}  # path -> (size, mtime_ns, time the signature was first seen)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, path):
+        if path not in self._pending:
+            self._pending[path] = (None, None, time.monotonic())
+
+    def ready(self):
+        """
+        Check the pending files
+        :return: list of the paths of the files that stopped changing
+        """
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                del self._pending[path]  # Moved away or deleted before it settled
+                continue
+            if (stat_result.st_size, stat_result.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (stat_result.st_size, stat_result.st_mtime_ns, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                ready.append(path)
+        return ready
+
+
+def is_watched(path, folder, exclude=()):
+    """
+    Whether a file is in a watched folder, recursively
+    :param path: the path of the file
+    :param folder: the watched folder
+    :param exclude: absolute paths of the folders not watched
+    :return: bool
+    """
+    path = os.path.abspath(path)
+    for directory, inside in [(folder, True)] + [(excluded, False) for excluded in exclude]:
+        if path.startswith(os.path.join(os.path.abspath(directory), "")) != inside:
+            return False
+    return True
+
+
+def open_watcher(folder, recursive=False, exclude=(), polling=False, interval=1.0):
+    """
+    Watch a folder with inotify, or by polling if inotify is not available (or polling is asked)
+    :param folder: the folder to watch
+    :param recursive: also watch the subfolders
+    :param exclude: absolute paths of the folders not to watch
+    :param polling: always poll
+    :param interval: the time between two scans when polling, in seconds
+    :return: InotifyWatcher or PollingWatcher
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(folder, recursive, exclude)
+        except (OSError, TypeError, AttributeError) as e:
+            logging.info("inotify not available ({}), polling {} every {}s".format(e, folder, interval))
+    return PollingWatcher(folder, recursive, exclude, interval)
+
+
+def watch(folder, on_files, recursive=False, exclude=(), settle=0.5, polling=False, interval=1.0, stop=None, existing=False):
+    """
+    Call on_files with the files arriving in a folder, once they are completely written
+    :param folder: the folder to watch
+    :param on_files: function called with a list of file paths
+    :param recursive: also watch the subfolders
+    :param exclude: absolute paths of the folders not to watch
+    :param settle: the time a file must stay unchanged before it is sorted, in seconds
+    :param polling: always poll instead of using inotify
+    :param interval: the time between two scans when polling, in seconds
+    :param stop: a threading.Event stopping the watch, or None to watch until interrupted
+    :param existing: first call on_files with the files already in the folder, listed once the folder is watched
+                     so that no file arriving in the meantime is missed
+    :return: None
+    """
+    watcher = open_watcher(folder, recursive, exclude, polling, interval)
+    debouncer = Debouncer(settle)
+    logging.info("Watching {}".format(folder))
+    try:
+        if existing:
+            on_files([entry.path for entry in DirectoryHandler(folder).scan(recursive=recursive, exclude=exclude)])
+        while stop is None or not stop.is_set():
+            for path in watcher.read(_TICK if debouncer else _IDLE_TIMEOUT):
+                debouncer.add(path)
+            ready = debouncer.ready()
+            if ready:
+                on_files(ready)
+    finally:
+        watcher.close()
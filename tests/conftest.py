@@ -0,0 +1,33 @@
+#  Fixtures shared by all the tests
+import pytest
+
+_SAMPLE_FILES = ["Foo - bar.jpg", "film.mp4", "notes.txt", "stays.unknown"]  # Artists/Foo, vids, others and no match with config.yaml
+
+
+@pytest.fixture(autouse=True)
+def config_cache_directory(tmp_path_factory, monkeypatch):
+    """The configs parsed by the tests are cached in a temporary directory, not in the cache of the user"""
+    cache_directory = str(tmp_path_factory.mktemp("config_cache"))
+    monkeypatch.setenv("CRITERIASORTER_CACHE_DIR", cache_directory)
+    return cache_directory
+
+
+@pytest.fixture
+def make_tree(tmp_path):
+    """
+    Create files to sort: make_tree(files, root="inbox")
+    files is a list of paths like "sub/song.mp3", each file holding its path, or a dict of path -> content (str or bytes),
+    by default a file for each sorting of config.yaml; root is relative to tmp_path. The root is returned, created even if empty
+    """
+    def make(files=_SAMPLE_FILES, root="inbox"):
+        root = tmp_path / root
+        root.mkdir(parents=True, exist_ok=True)
+        for name, content in files.items() if isinstance(files, dict) else ((name, name) for name in files):
+            path = root.joinpath(*name.split("/"))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes):
+                path.write_bytes(content)
+            else:
+                path.write_text(content)
+        return root
+    return make
@@ -0,0 +1,88 @@
+#  Test file for batch.py
+import os
+import pytest
+from criteriaSorter.modules import batch, criteriaSorter, fileops
+
+_OPERATIONS = {
+    "operation_order": "big_images\nartists\nvideos\ndocuments\nsmall\n",
+    "big_images": {"conditions": "is_image\nis_bigger_than,20\n", "destination": "big/{obj.name}"},
+    "artists": {"conditions": "has_artist\nis_picture\n", "destination": "Artists/{obj.artist}/{obj.name}"},
+    "videos": {"conditions": "is_video\n", "destination": "vids/{obj.name}"},
+    "documents": {"conditions": "is_type,document\nis_smaller_than_mb,1\n", "destination": "docs/{obj.name}"},
+    "small": {"conditions": "is_smaller_than,5\nis_unknown\n", "destination": "small/{obj.name}"},
+}
+
+_FILES = {
+    "Foo - big.jpg": 30, "Foo - small.JPG": 10, "plain.png": 10, "film.mp4": 1, "Bar - clip.mkv": 1,
+    "notes.txt": 3, "tiny.bin": 2, "large.bin": 50, "song.mp3": 4,
+}
+_CONTENTS = {name: b"x" * size for name, size in _FILES.items()}
+
+
+class FailingHandler(fileops.ArtistHandler):
+    __slots__ = ()
+
+    def is_video(self):
+        if self.name == "Bar - clip.mkv":
+            raise OSError("Cannot read " + self.name)
+        return super().is_video()
+
+
+def make_table(make_tree, Handler):
+    entries = sorted(os.scandir(make_tree(_CONTENTS)), key=lambda entry: entry.name)
+    return entries, batch.FileTable.from_entries(entries, Handler)
+
+
+@pytest.mark.parametrize("Handler, default", [
+    (fileops.FileHandler, None), (fileops.ArtistHandler, None), (fileops.ArtistHandler, "others/{obj.name}"), (FailingHandler, None),
+])
+def test_classify(make_tree, Handler, default):
+    operations = dict(_OPERATIONS)
+    if Handler is fileops.FileHandler:  # has_artist is an ArtistHandler condition
+        operations["operation_order"] = operations["operation_order"].replace("artists\n", "")
+    operation_list = criteriaSorter.create_operation_list(operations, Handler)
+    entries, table = make_table(make_tree, Handler)
+
+    handlers = criteriaSorter.generate_handlers(entries, Handler)
+    expected = [(h.file_path, h.future_name) for h in criteriaSorter.sort_handlers(handlers, operation_list, default)]
+    assert batch.classify(table, operation_list, default) == expected
+    assert len(expected) == len(_FILES) - (Handler is FailingHandler)
+    if Handler is not FailingHandler:
+        assert table._handlers == {}  # Every condition was evaluated on the columns
+
+
+def test_FileTable_stat_error(make_tree, caplog, monkeypatch):
+    entries, table = make_table(make_tree, fileops.FileHandler)
+    inbox = os.path.dirname(entries[0].path)
+    os.remove(os.path.join(inbox, "tiny.bin"))
+    os.remove(os.path.join(inbox, "film.mp4"))  # Classified as a video without its size
+    stated, real_stat = [], os.stat
+    monkeypatch.setattr(os, "stat", lambda path, *args, **kwargs: stated.append(os.path.basename(path)) or real_stat(path, *args, **kwargs))
+    table = batch.FileTable([entry.path for entry in entries], fileops.ArtistHandler)
+    operation_list = criteriaSorter.create_operation_list(_OPERATIONS, fileops.ArtistHandler)
+    results = dict(batch.classify(table, operation_list))
+    monkeypatch.undo()
+    assert os.path.join(inbox, "tiny.bin") not in results
+    assert "Could not sort tiny.bin" in caplog.text
+    assert results[os.path.join(inbox, "film.mp4")] == "vids/{obj.name}"
+    assert results[os.path.join(inbox, "large.bin")] is None
+    assert sorted(stated) == ["Foo - big.jpg", "Foo - small.JPG", "large.bin", "notes.txt", "plain.png", "song.mp3", "tiny.bin"]
+    assert table.mtimes([0])[0] > 0
+
+
+def test_sort_in_batches(make_tree):
+    entries, table = make_table(make_tree, fileops.ArtistHandler)
+    operation_list = criteriaSorter.create_operation_list(_OPERATIONS, fileops.ArtistHandler)
+    assert list(batch.sort_in_batches(iter(entries), fileops.ArtistHandler, operation_list, batch_size=4)) == \
+        batch.classify(table, operation_list)
+
+
+@pytest.mark.parametrize("engine", ["handlers", "batch"])
+def test_action_sort_engine(tmp_path, make_tree, engine):
+    inbox, output = make_tree(_CONTENTS), tmp_path / "sorted"
+    criteriaSorter.action_sort(criteriaSorter.parse_args(["sort", str(inbox), "-o", str(output), "--engine", engine]))
+    assert sorted(path.name for path in inbox.iterdir()) == ["large.bin", "plain.png", "tiny.bin"]
+    assert (output / "Artists" / "Foo" / "Foo - big.jpg").is_file()
+    assert (output / "vids" / "film.mp4").is_file()
+    assert (output / "audios" / "song.mp3").is_file()
+    assert (output / "others" / "notes.txt").is_file()
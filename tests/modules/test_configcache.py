@@ -0,0 +1,75 @@
+#  Test file for configcache.py
+import os
+import pytest
+import yaml
+from criteriaSorter.modules import configcache, criteriaSorter
+
+_CONFIG = """
+general:
+  default_operations: sort
+operations:
+  sort:
+    operation_order: |
+      images
+    images:
+      conditions : |
+        is_image
+      destination : images/{obj.name}
+"""
+
+
+def write_config(path, content=_CONFIG, age=60):
+    path.write_text(content)
+    mtime = path.stat().st_mtime - age
+    os.utime(str(path), (mtime, mtime))
+    return str(path)
+
+
+def test_load_config_cached(tmp_path, monkeypatch):
+    config_file, cache_directory = write_config(tmp_path / "config.yaml"), str(tmp_path / "cache")
+    config = criteriaSorter.load_config(config_file, cache_directory)
+    assert config["operations"]["sort"]["images"]["destination"] == "images/{obj.name}"
+    assert len(os.listdir(cache_directory)) == 1
+
+    monkeypatch.setattr(yaml, "load", lambda *args, **kwargs: pytest.fail("The config was parsed again"))
+    assert criteriaSorter.load_config(config_file, cache_directory) == config
+    monkeypatch.undo()
+
+    write_config(tmp_path / "config.yaml", _CONFIG.replace("images/", "pictures/"))
+    config = criteriaSorter.load_config(config_file, cache_directory)
+    assert config["operations"]["sort"]["images"]["destination"] == "pictures/{obj.name}"
+
+
+@pytest.mark.parametrize("content, age", [
+    (_CONFIG, 0),  # Changed too recently to be cached
+    (_CONFIG + "date: 2023-01-01\n", 60),  # A date can't be cached
+])
+def test_load_config_not_cached(tmp_path, content, age):
+    config_file, cache_directory = write_config(tmp_path / "config.yaml", content, age), str(tmp_path / "cache")
+    assert criteriaSorter.load_config(config_file, cache_directory) == yaml.safe_load(content)
+    assert not os.path.exists(cache_directory) or os.listdir(cache_directory) == []
+
+
+def test_read_config_cache_invalid(tmp_path):
+    config_file, cache_directory = write_config(tmp_path / "config.yaml"), str(tmp_path / "cache")
+    key = configcache.config_key(config_file)
+    configcache.write_config_cache(key, {"general": {}}, cache_directory)
+    assert configcache.read_config_cache(key, cache_directory) == {"general": {}}
+    assert configcache.read_config_cache((key[0], key[1] + 1, key[2], key[3]), cache_directory) is None
+    with open(configcache.cache_path(key, cache_directory), "wb") as f:
+        f.write(b"\x00corrupt")
+    assert configcache.read_config_cache(key, cache_directory) is None
+    assert configcache.read_config_cache(key, None) is None
+
+
+@pytest.mark.parametrize("environment, expected", [
+    ({"CRITERIASORTER_CACHE_DIR": "/tmp/cache"}, "/tmp/cache"),
+    ({"CRITERIASORTER_CACHE_DIR": ""}, None),
+    ({"XDG_CACHE_HOME": "/tmp/xdg"}, os.path.join("/tmp/xdg", "criteriaSorter")),
+])
+def test_default_cache_directory(monkeypatch, environment, expected):
+    for name in ("CRITERIASORTER_CACHE_DIR", "XDG_CACHE_HOME"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+    assert configcache.default_cache_directory() == expected
@@ -1,11 +1,17 @@
 # Test file for the criteriaSorter module
+import ast
 import io
+import json
 import os
 import logging
 import importlib
 import pytest
-from criteriaSorter.modules import criteriaSorter
+from criteriaSorter.modules import criteriaSorter, fileops
 import tempfile
+import random
+import subprocess
+import sys
+import time
 
 
 _ARGS_LIST = [
@@ -38,9 +44,9 @@ path/to/file2/. : path/to/destination2
 path/to/file3/ : path/to/destination3/.
 """
 
-_GOOD_RESULT = """[MOVED] path/to/destination1 to path/to/file1
+_GOOD_RESULT = """[MOVED] path/to/destination3/. to path/to/file3/
 [MOVED] path/to/destination2 to path/to/file2/.
-[MOVED] path/to/destination3/. to path/to/file3/
+[MOVED] path/to/destination1 to path/to/file1
 """
 
 
@@ -90,8 +96,102 @@ def test_config_log(vlevel, login, logout, caplog):
     importlib.reload(logging)
 
 
-def test_action_sort():
-    pass
+def test_lazy_rich_handler():
+    handler = criteriaSorter.LazyRichHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    assert handler.handler is None  # rich is not needed until something is logged
+    handler.handle(logging.LogRecord("test", logging.ERROR, __file__, 1, "first error", (), None))
+    assert type(handler.handler).__name__ == "RichHandler"
+    assert handler.handler.formatter is handler.formatter
+
+
+@pytest.mark.parametrize("recursive, expected", [
+    (False, ["Artists/Foo/Foo - bar.jpg", "vids/film.mp4", "others/notes.txt"]),
+    (True, ["Artists/Foo/Foo - bar.jpg", "vids/film.mp4", "others/notes.txt", "audios/song.mp3", "others/deep.pdf"]),
+])
+def test_action_sort(tmp_path, make_tree, recursive, expected):
+    source, output = make_tree(["Foo - bar.jpg", "film.mp4", "notes.txt", "stays.unknown", "sub/song.mp3", "sub/deeper/deep.pdf"]), tmp_path / "sorted"
+    args = ["sort", str(source), "-o", str(output)] + (["-r"] if recursive else [])
+    criteriaSorter.action_sort(criteriaSorter.parse_args(args))
+
+    for file in expected:
+        assert output.joinpath(*file.split("/")).is_file()
+    assert (source / "stays.unknown").is_file()
+    assert (source / "sub" / "song.mp3").is_file() is not recursive
+    cancel_files = list(output.glob("cancel_*.txt"))
+    assert len(cancel_files) == 1
+    records = [json.loads(line) for line in cancel_files[0].read_text().splitlines()]
+    assert len([record for record in records if "origin" in record]) == len(expected)
+
+
+@pytest.mark.parametrize("handler_settings", [{}, {"artist_normalise": True}])
+def test_sort_in_processes(tmp_path, make_tree, handler_settings):
+    make_tree(["Foo - bar.jpg", "film.mp4", "notes.txt", "stays.unknown", "song.mp3", "Bar - baz.png", "a.pdf", "foo - qux.jpg", "FOO - quux.jpg"],
+              tmp_path)
+    config = criteriaSorter.load_config("config.yaml")
+    operation_list = criteriaSorter.create_operation_list(criteriaSorter.load_operations("default_operations", config), fileops.ArtistHandler)
+    file_paths = sorted(str(path) for path in tmp_path.iterdir())
+
+    try:
+        fileops.ArtistHandler.configure(**handler_settings)
+        handlers = criteriaSorter.generate_handlers_from_paths(file_paths, fileops.ArtistHandler)
+        serial = [(h.file_path, h.future_name, h.destination_path("out")) for h in criteriaSorter.sort_handlers(handlers, operation_list, None)
+                  if h.future_name]
+        fileops.ArtistHandler.configure(**handler_settings)
+        handlers = list(criteriaSorter.sort_in_processes(iter(file_paths), fileops.ArtistHandler, operation_list, None, workers=2, chunk_size=2,
+                                                         handler_settings=handler_settings))
+    finally:
+        fileops.ArtistHandler.configure()
+    assert [(h.file_path, h.future_name, h.destination_path("out")) for h in handlers] == serial
+    assert len(serial) == 8
+    artists = {os.path.basename(os.path.dirname(destination)) for _, _, destination in serial if "Artists" in destination}
+    if handler_settings:
+        assert artists == {"Bar", "FOO"}  # The first spelling of the run, whatever the worker sorting the files
+        assert not any(isinstance(handler, fileops.SortedFile) for handler in handlers)
+    else:
+        assert artists == {"Bar", "FOO", "Foo", "foo"}
+        assert all(isinstance(handler, fileops.SortedFile) for handler in handlers)  # Not classified again in this process
+
+
+_SORT_AND_LIST_MODULES = """
+import sys
+from criteriaSorter.modules import criteriaSorter
+criteriaSorter.action_sort(criteriaSorter.parse_args(sys.argv[1:]))
+print(sorted(sys.modules))
+"""
+
+
+def test_sort_imports(tmp_path, make_tree):
+    make_tree()
+    args = ["--cancel_file", "cancel.txt", "sort", str(tmp_path / "inbox"), "-o", str(tmp_path / "sorted")]
+    result = subprocess.run([sys.executable, "-c", _SORT_AND_LIST_MODULES] + args, stdout=subprocess.PIPE, universal_newlines=True,
+                            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)), check=True)
+    modules = set(ast.literal_eval(result.stdout.splitlines()[-1]))
+    assert (tmp_path / "sorted" / "vids" / "film.mp4").is_file()
+    assert not modules & {"asyncio", "rich", "sqlite3", "criteriaSorter.modules.batch", "criteriaSorter.modules.dedupe",
+                          "criteriaSorter.modules.pipeline", "criteriaSorter.modules.profiling"}  # Only imported by the options using them
+
+
+class FakeMoveHandler:
+    def __init__(self, index):
+        self.file_name = "file{}".format(index)
+
+    def move(self, destination=".", dry_run=False, directories=None):
+        time.sleep(random.random() / 1000)
+        if self.file_name == "file3":
+            raise OSError("Cannot move " + self.file_name)
+        directories.get_lock(destination)
+        return self.file_name, os.path.join(destination, self.file_name)
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_execute_moves(jobs, caplog):
+    args = criteriaSorter.parse_args(["sort", ".", "-j", str(jobs)])
+    assert args.jobs == jobs
+    with caplog.at_level(logging.ERROR):
+        moves = criteriaSorter.execute_moves((FakeMoveHandler(i) for i in range(200)), args, "out")
+    assert moves == [("file{}".format(i), os.path.join("out", "file{}".format(i))) for i in range(200) if i != 3]
+    assert "Could not move file3" in caplog.text
 
 
 def move(path, dest):
@@ -205,3 +305,16 @@ def test_load_config_error():
         criteriaSorter.load_operations("default_operation", conf)
 
     cldl(good_conf, bad_conf)
+
+
+def test_create_operation_list(caplog):
+    config = criteriaSorter.load_config("config.yaml")
+    operations_config = criteriaSorter.load_operations("default_operations", config)
+    operation_list = criteriaSorter.create_operation_list(operations_config, fileops.ArtistHandler)
+    assert [operation.name for operation in operation_list] == ["operation1", "operation2", "operation3", "operation4"]
+
+    operations_config = dict(operations_config, operation2={"conditions": "is_vidoe\n", "destination": "vids/{obj.name}"})
+    with pytest.raises(SystemExit):
+        with caplog.at_level(logging.CRITICAL):
+            criteriaSorter.create_operation_list(operations_config, fileops.ArtistHandler)
+    assert "is_vidoe" in caplog.text
@@ -0,0 +1,56 @@
+#  Test file for dedupe.py
+import os
+import pytest
+import yaml
+from criteriaSorter.modules import criteriaSorter, dedupe, fileops, planner
+
+_FILES = {
+    "a.mp4": b"x" * 100,
+    "b.mp4": b"x" * 100,  # Duplicate of a.mp4
+    "c.mp4": b"x" * 99 + b"y",  # Same size and first block as a.mp4
+    "d.mp4": b"x" * 48 + b"y" + b"x" * 51,  # Same first and last blocks as a.mp4
+    "e.jpg": b"small",
+    "f.jpg": b"small",  # Duplicate of e.jpg, read at once
+    "g.txt": b"",
+    "h.txt": b"",  # Empty files are not compared
+    "i.txt": b"unique size",
+}
+
+
+def make_handlers(make_tree):
+    inbox = make_tree(_FILES)
+    return [fileops.FileHandler(str(inbox / name)) for name in sorted(_FILES, reverse=True)]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_mark(make_tree, jobs):
+    finder = dedupe.DuplicateFinder(jobs=jobs, block_size=16)
+    handlers = finder.mark(make_handlers(make_tree))
+    assert [handler.name for handler in handlers] == sorted(_FILES, reverse=True)
+    duplicates = {handler.name: os.path.basename(handler.duplicate_of) for handler in handlers if handler.is_duplicate()}
+    assert duplicates == {"b.mp4": "a.mp4", "f.jpg": "e.jpg"}
+    assert (finder.partially_hashed, finder.fully_hashed, finder.duplicates) == (6, 3, 2)
+
+
+def test_digests(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(os.urandom(300))
+    assert dedupe.full_digest(str(path)) == planner.file_digest(str(path))
+    assert dedupe.partial_digest(str(path), 300, block_size=200) == planner.file_digest(str(path))
+    assert dedupe.partial_digest(str(path), 300, block_size=100) != planner.file_digest(str(path))
+    (tmp_path / "empty").write_bytes(b"")
+    assert dedupe.full_digest(str(tmp_path / "empty")) == planner.file_digest(str(tmp_path / "empty"))
+
+
+def test_sort_duplicates(tmp_path, make_tree):
+    with open("config.yaml") as f:
+        config = yaml.safe_load(f)
+    config["operations"]["sort_junk_folder"]["duplicate_destination"] = {"destination": "duplicates/{obj.name}"}
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config))
+    inbox, output = make_tree({"film.mp4": b"film", "film copy.mp4": b"film", "other.mp4": b"othr"}), tmp_path / "sorted"
+
+    args = criteriaSorter.parse_args(["--config", str(config_path), "--cancel_file", "cancel.txt", "sort", str(inbox), "-o", str(output)])
+    criteriaSorter.action_sort(args)
+    assert sorted(path.name for path in (output / "vids").iterdir()) == ["film copy.mp4", "other.mp4"]
+    assert sorted(path.name for path in (output / "duplicates").iterdir()) == ["film.mp4"]
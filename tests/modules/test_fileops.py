@@ -1,10 +1,12 @@
 #  Test file for fileops.py
+import gc
 import logging
 from criteriaSorter.modules import fileops
 import pathlib
 import os
 import pytest
 import io
+import weakref
 import yaml
 
 
@@ -24,6 +26,8 @@ _LIST_BASE_FILE_PATH = [
     (_BASE_PATH / "TestFile.mp4", "video", "is_video"),
     (_BASE_PATH / "TestFile.mpg", "video", "is_video"),
     (_BASE_PATH / "TestFile.unknown_type", None, "is_unknown"),
+    (_BASE_PATH / "TestFile.JPG", "image", "is_image"),
+    (_BASE_PATH / "TestFile.Mp4", "video", "is_video"),
 ]
 _TEST_ARTIST_FILE_PATH = [
     (_BASE_PATH / "TestArtist  -    Testpicture.jpg", "TestArtist", "Testpicture", 'Artists/{obj.artist}/{obj.name}'),
@@ -59,7 +63,19 @@ _FALSE_CONFIG = """
 """
 
 
+_REAL_STAT = os.stat
+
+
 class MockOS:
+    stat_calls = []
+
+    @staticmethod
+    def stat_file(path, *args, **kwargs):
+        if not str(path).startswith(str(_BASE_PATH)):
+            return _REAL_STAT(path, *args, **kwargs)
+        MockOS.stat_calls.append(path)
+        return os.stat_result((0o100644, 1, 1, 1, 0, 0, MockOS.getsize(path), 10, 20, 30))
+
     @staticmethod
     def getsize(path):
         if pathlib.Path(path) == _BASE_PATH / 'a':
@@ -74,6 +90,27 @@ class MockOS:
         else:
             return ['a', 'b', 'c']
 
+    class DirEntry:
+        def __init__(self, dir_path, name):
+            self.name = name
+            self.path = MockOS.join(dir_path, name)
+
+        def is_file(self):
+            return MockOS.isfile(self.path)
+
+        def is_dir(self, follow_symlinks=True):
+            return MockOS.isdir(self.path)
+
+    class scandir:
+        def __init__(self, path):
+            self.entries = [MockOS.DirEntry(path, name) for name in MockOS.listdir(path)]
+
+        def __enter__(self):
+            return iter(self.entries)
+
+        def __exit__(self, *args):
+            return False
+
     @staticmethod
     def isdir(path):
         if pathlib.Path(path) == _BASE_PATH / 'a':
@@ -183,6 +220,7 @@ def handler(monkeypatch):
     # Using a mock function to test return value
     handler = fileops.DirectoryHandler("/Test/Path")
     monkeypatch.setattr(os, 'listdir', MockOS.listdir)
+    monkeypatch.setattr(os, 'scandir', MockOS.scandir)
     monkeypatch.setattr(os.path, 'isdir', MockOS.isdir)
     monkeypatch.setattr(os.path, 'isfile', MockOS.isfile)
     monkeypatch.setattr(os.path, 'getsize', MockOS.getsize)
@@ -194,6 +232,7 @@ def handler(monkeypatch):
 @pytest.fixture
 def f_handler(monkeypatch):
     # Regular invocation
+    monkeypatch.setattr(os, 'stat', MockOS.stat_file)
     monkeypatch.setattr(os.path, 'getsize', MockOS.getsize)
     monkeypatch.setattr(os.path, 'isfile', MockOS.isfile)
     monkeypatch.setattr(os.path, 'stat', MockOS.stat)
@@ -205,6 +244,7 @@ def f_handler(monkeypatch):
 
 @pytest.fixture
 def a_handler(monkeypatch):
+    monkeypatch.setattr(os, 'stat', MockOS.stat_file)
     monkeypatch.setattr(os.path, 'getsize', MockOS.getsize)
     monkeypatch.setattr(os.path, 'isfile', MockOS.isfile)
     monkeypatch.setattr(os.path, 'stat', MockOS.stat)
@@ -226,6 +266,10 @@ def test_DirectoryHandler(handler):
     assert handler.get_full_list_with_size() == [("a", (1024 * 1024) * 2), ("b", (1024 * 1024) * 1), ("c", (1024 * 1024) * 1)]
     assert handler.get_file_list() == [_BASE_PATH / "b", _BASE_PATH / "c"]
     assert handler.get_directory_list() == ["a"]
+    assert [entry.path for entry in handler.scan()] == [_BASE_PATH / "b", _BASE_PATH / "c"]
+    assert [entry.path for entry in handler.scan(recursive=True)] == [_BASE_PATH / "b", _BASE_PATH / "c",
+                                                                      _BASE_PATH / "a" / "b", _BASE_PATH / "a" / "c"]
+    assert [entry.path for entry in handler.scan(recursive=True, exclude={str(_BASE_PATH / "a")})] == [_BASE_PATH / "b", _BASE_PATH / "c"]
 
 
 @pytest.mark.parametrize("path, expected, method", _LIST_BASE_FILE_PATH)
@@ -252,6 +296,29 @@ def test_FileHandler(f_handler, path, expected, method):
                                          "is_smaller_than_mb,1000"]) is True
 
 
+def test_FileHandler_stat(f_handler):
+    MockOS.stat_calls.clear()
+    handler = fileops.FileHandler(str(_BASE_PATH / "a"))
+    assert MockOS.stat_calls == []
+    assert handler.fills_all_conditions(["is_bigger_than,10", "is_bigger_than_mb,1", "is_smaller_than,100000000", "is_smaller_than_mb,1000"])
+    assert handler.get_file_size() == 2 * (1024 * 1024)
+    assert (handler.get_mtime(), handler.get_ctime(), handler.get_mode()) == (20, 30, 0o100644)
+    assert len(MockOS.stat_calls) == 1
+    handler.refresh_stat()
+    assert len(MockOS.stat_calls) == 2
+
+    entry = MockOS.DirEntry(str(_BASE_PATH), "b")
+    entry.stat = lambda path=entry.path: MockOS.stat_file(path)
+    handler = fileops.FileHandler(str(entry.path), entry=entry)
+    entry_reference = weakref.ref(entry)
+    del entry
+    gc.collect()
+    assert entry_reference() is None  # Only its stat is kept, on Windows
+    assert handler.get_file_size() == 1024 * 1024
+    assert handler.get_file_size_in_mb() == 1
+    assert len(MockOS.stat_calls) == 3
+
+
 @pytest.mark.parametrize("path, artist, picture, return_pathlike", _TEST_ARTIST_FILE_PATH)
 def test_ArtistHandler(caplog, a_handler, path, artist, picture, return_pathlike):
     handler = fileops.ArtistHandler(str(path))
@@ -315,3 +382,169 @@ def test_ArtistHandler_exception_3(caplog, a_handler):
     with caplog.at_level(logging.INFO):
         assert handler.move("__nonexistent__", dry_run=False)
         assert "Creating directory" in caplog.text
+
+
+@pytest.mark.parametrize("path, artist, picture, return_pathlike", _TEST_ARTIST_FILE_PATH)
+def test_Operation_compiled_sort(a_handler, path, artist, picture, return_pathlike):
+    YAML_FALSE_CONFIG = yaml.load(io.StringIO(_FALSE_CONFIG), Loader=yaml.FullLoader)
+    operations = [fileops.Operation.compile(name, YAML_FALSE_CONFIG[name], fileops.ArtistHandler) for name in YAML_FALSE_CONFIG]
+    assert [c.name for c in operations[0].conditions] == ["has_artist", "is_image"]
+
+    handler = fileops.ArtistHandler(str(path))
+    assert handler.sort(operations, default=SUPERNONE) == return_pathlike
+
+
+def test_Condition_compile():
+    condition = fileops.Condition.compile("is_bigger_than_mb, 10", fileops.FileHandler)
+    assert condition.function is fileops.FileHandler.is_bigger_than_mb
+    assert condition.args == (10,)
+    with pytest.raises(ValueError):
+        fileops.Condition.compile("is_not_a_condition", fileops.FileHandler)
+    with pytest.raises(ValueError):
+        fileops.Condition.compile("has_artist", fileops.FileHandler)
+    with pytest.raises(ValueError):
+        fileops.Operation.compile("operation", {"conditions": "is_image\n"}, fileops.FileHandler)
+
+
+@pytest.mark.parametrize("condition_str", [
+    "is_bigger_than_mb", "is_bigger_than_mb,ten", "is_bigger_than,1,2", "is_image,3", "is_type",  # Wrong arguments
+    "move", "refresh_stat", "configure,always", "sort",  # Not predicates
+])
+def test_Condition_compile_invalid(condition_str):
+    with pytest.raises(ValueError):
+        fileops.Condition.compile(condition_str, fileops.ArtistHandler)
+
+
+@pytest.mark.parametrize("dry_run", [True, False])
+def test_DestinationDirectories(caplog, monkeypatch, dry_run):
+    calls = []
+    monkeypatch.setattr(os.path, 'exists', lambda path: calls.append(("exists", path)) and False)
+    monkeypatch.setattr(os, 'makedirs', lambda path: calls.append(("makedirs", path)))
+    monkeypatch.setattr(os, 'rename', MockOS.rename)
+
+    directories = fileops.DestinationDirectories()
+    with caplog.at_level(logging.INFO):
+        for name in ["a.mp4", "b.mp4", "c.mp4"]:
+            handler = fileops.FileHandler(str(_BASE_PATH / name))
+            handler.future_name = "vids/{obj.name}"
+            assert handler.move("out", dry_run=dry_run, directories=directories)
+    destination_dir = os.path.join("out", "vids")
+    assert destination_dir in directories
+    assert calls == [("exists", destination_dir)] + ([] if dry_run else [("makedirs", destination_dir)])
+    assert caplog.text.count("Creating directory") == 1
+
+
+def test_register_types(f_handler, monkeypatch):
+    monkeypatch.setattr(fileops, "TYPE_BY_EXTENTION", dict(fileops.TYPE_BY_EXTENTION))
+    monkeypatch.setattr(fileops, "EXTENTION_BY_TYPE", {k: list(v) for k, v in fileops.EXTENTION_BY_TYPE.items()})
+    fileops.register_types({"archive": ["zip", ".RAR"], "video": ["txt"]})
+    assert fileops.EXTENTION_BY_TYPE["archive"] == ["zip", "rar"]
+    assert "txt" not in fileops.EXTENTION_BY_TYPE["document"]
+
+    handler = fileops.FileHandler(str(_BASE_PATH / "TestFile.Rar"))
+    assert handler.type == "archive"
+    assert handler.is_type("archive") and not handler.is_unknown()
+    assert fileops.Condition.compile("is_type,archive", fileops.FileHandler)(handler)
+    assert fileops.FileHandler(str(_BASE_PATH / "TestFile.txt")).is_video()
+
+
+def test_ArtistMatcher(monkeypatch):
+    matcher = fileops.ArtistMatcher(fileops._guess_artist_regex)
+    assert matcher.match("Testpicture by TestArtist.jpg") == ("TestArtist", "Testpicture")
+    assert matcher.match("TestArtist - Testpicture.jpg") == ("TestArtist", "Testpicture")
+    assert matcher.match("Testpicture.jpg") is None
+    assert fileops.ArtistMatcher.cached(["(?P<artist>x)(?P<file_name>y)"]) is fileops.ArtistMatcher.cached(["(?P<artist>x)(?P<file_name>y)"])
+
+    tried = []
+    matcher.patterns = [(lambda name, match=match: tried.append(literal) or match(name), literal) for match, literal in matcher.patterns]
+    assert matcher.match("no artist here.jpg") is None
+    assert tried == []
+    assert matcher.match("a-b.jpg") == ("a", "b")
+    assert tried == ["-"]
+
+    with pytest.raises(ValueError):
+        fileops.ArtistMatcher([r"(?P<artist>.+)\.jpg"])
+
+
+def test_ArtistHandler_configure(a_handler, monkeypatch):
+    monkeypatch.setattr(fileops.ArtistHandler, "matcher", fileops.ArtistHandler.matcher)
+    fileops.ArtistHandler.configure(artist_regex=[{"regex": r"\[(?P<artist>[^\]]+)\]\s*(?P<file_name>[^.]+)\..*", "requires": "["}])
+    handler = fileops.ArtistHandler(str(_BASE_PATH / "[Someone] a picture - by me.jpg"))
+    assert (handler.artist, handler.file_name) == ("Someone", "a picture - by me")
+    handler = fileops.ArtistHandler(str(_BASE_PATH / "TestArtist - Testpicture.jpg"))
+    assert (handler.artist, handler.file_name) == ("TestArtist", "Testpicture")
+
+    with pytest.raises(ValueError):
+        fileops.ArtistHandler.configure(artist_regex=["(?P<artist>[unclosed"])
+    with pytest.raises(ValueError):
+        fileops.ArtistHandler.configure(sniff="sometimes")
+
+
+def test_ArtistRegistry():
+    registry = fileops.ArtistRegistry()
+    assert [registry.resolve(name) for name in ["Foo", "foo ", "FOO", " Foo_Bar", "foo bar", "Foo-Bar!", "Bar"]] == \
+        ["Foo", "Foo", "Foo", "Foo_Bar", "Foo_Bar", "Foo_Bar", "Bar"]
+    assert len(registry) == 3
+    assert registry.resolve("Foo Barr") == "Foo Barr"
+    assert registry.resolve.cache_info().hits == 0
+    assert registry.resolve("FOO") == "Foo"
+    assert registry.resolve.cache_info().hits == 1
+
+    registry = fileops.ArtistRegistry(fuzzy=0.9)
+    assert [registry.resolve(name) for name in ["Foo Bar", "foo barr", "Fo Bar", "Zoo Bar"]] == ["Foo Bar", "Foo Bar", "Foo Bar", "Zoo Bar"]
+    with pytest.raises(ValueError):
+        fileops.ArtistRegistry(fuzzy=2)
+
+
+def test_ArtistHandler_registry(a_handler, monkeypatch):
+    monkeypatch.setattr(fileops.ArtistHandler, "registry", None)
+    fileops.ArtistHandler.configure(artist_normalise=True)
+    artists = [fileops.ArtistHandler(str(_BASE_PATH / name)).artist for name in ["Foo - a.jpg", "FOO  - b.jpg", "c by foo.jpg", "d.jpg"]]
+    assert artists == ["Foo", "Foo", "Foo", None]
+    fileops.ArtistHandler.configure()
+    assert fileops.ArtistHandler.registry is None
+
+
+@pytest.mark.parametrize("Handler", [fileops.FileHandler, fileops.ArtistHandler])
+def test_FileHandler_slots(a_handler, Handler):
+    handler = Handler(str(_BASE_PATH / "Foo - Bar.Baz.JPG"))
+    assert not hasattr(handler, "__dict__")
+    assert handler.name == "Foo - Bar.Baz.JPG"
+    assert pathlib.Path(handler.dir_path) == _BASE_PATH
+    assert (handler.base_name, handler.extension, handler.type) == ("Foo - Bar.Baz", ".JPG", "image")
+    assert handler.file_name == ("Bar" if Handler is fileops.ArtistHandler else handler.name)
+    handler.file_name = "other"
+    assert (handler.file_name, handler.name) == ("other", "Foo - Bar.Baz.JPG")
+    with pytest.raises(AttributeError):
+        handler.new_attribute = True
+
+
+def test_DestinationTemplate(a_handler):
+    template = fileops.DestinationTemplate.compile("Artists/{obj.artist}/{obj.name}", fileops.ArtistHandler)
+    assert template == "Artists/{obj.artist}/{obj.name}"
+    handler = fileops.ArtistHandler(str(_BASE_PATH / "Foo - Bar.jpg"))
+    assert template.render(handler) == "Artists/Foo/Foo - Bar.jpg"
+    assert fileops.DestinationTemplate.compile("{obj.extension!r:>8}/{obj.base_name}", fileops.FileHandler).render(handler) == \
+        "  '.jpg'/Foo - Bar"
+    handler.artist = "AC/DC"
+    assert template.render(handler) == "Artists/AC_DC/Foo - Bar.jpg"
+    handler.artist = ".."
+    assert template.render(handler) == "Artists/_/Foo - Bar.jpg"
+
+
+@pytest.mark.parametrize("template", ["Artists/{obj.artist}/{obj.name}", "{name}", "{0}", "{obj.nope}", "{obj.name[0]}",
+                                      "../{obj.name}", "/tmp/{obj.name}", "a/../../{obj.name}", "{obj.name", "", None])
+def test_DestinationTemplate_errors(template):
+    with pytest.raises(ValueError):
+        fileops.DestinationTemplate.compile(template, fileops.FileHandler)
+
+
+def test_FileHandler_move_template(a_handler):
+    handler = fileops.ArtistHandler(str(_BASE_PATH / "Foo - Bar.jpg"))
+    handler.future_name = "Artists/{obj.artist}/{obj.name}"  # Set outside of the operations, compiled on the first move
+    assert handler.move(destination="out", dry_run=True) == (handler.file_path, os.path.join("out", "Artists", "Foo", "Foo - Bar.jpg"))
+    assert fileops.DestinationTemplate.cached(handler.future_name, fileops.ArtistHandler) is \
+        fileops.DestinationTemplate.cached(handler.future_name, fileops.ArtistHandler)
+    handler.future_name = "{obj.nope}"
+    with pytest.raises(ValueError):
+        handler.move(destination="out", dry_run=True)
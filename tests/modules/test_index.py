@@ -0,0 +1,52 @@
+#  Test file for index.py
+import os
+from criteriaSorter.modules import index, criteriaSorter
+
+
+def test_config_hash():
+    assert index.config_hash({"a": 1, "b": [1, 2]}, "ops") == index.config_hash({"b": [1, 2], "a": 1}, "ops")
+    assert index.config_hash({"a": 1}, "ops") != index.config_hash({"a": 2}, "ops")
+    assert index.config_hash({"a": 1}, "ops") != index.config_hash({"a": 1}, "other_ops")
+
+
+def test_ClassificationIndex(tmp_path, make_tree):
+    index_path = str(tmp_path / index.DEFAULT_INDEX_FILE)
+    make_tree(["a.unknown", "b.unknown", "c.unknown"], tmp_path)
+    entries = sorted(os.scandir(tmp_path), key=lambda entry: entry.name)
+
+    with index.ClassificationIndex(index_path, "hash") as class_index:
+        assert [entry.name for entry in class_index.filter_unchanged(entries)] == [entry.name for entry in entries]
+        for entry in entries[:2]:
+            class_index.record(entry.path, entry.stat())
+
+    (tmp_path / "b.unknown").write_text("changed, and bigger")
+    entries = [entry for entry in os.scandir(tmp_path)]
+    with index.ClassificationIndex(index_path, "hash") as class_index:
+        assert sorted(entry.name for entry in class_index.filter_unchanged(entries)) == ["b.unknown", "c.unknown"]
+        assert class_index.skipped == 1
+
+    with index.ClassificationIndex(index_path, "other hash", read_only=True) as class_index:
+        assert len(list(class_index.filter_unchanged(entries))) == 3
+    with index.ClassificationIndex(index_path, "hash", read_only=True) as class_index:
+        assert len(list(class_index.filter_unchanged(entries))) == 2
+    with index.ClassificationIndex(index_path, "other hash") as class_index:
+        assert len(list(class_index.filter_unchanged(entries))) == 3
+    with index.ClassificationIndex(index_path, "hash") as class_index:
+        assert len(list(class_index.filter_unchanged(entries))) == 3
+
+
+def test_action_sort_index(tmp_path, make_tree, monkeypatch):
+    inbox, output = make_tree(["film.mp4", "stays.unknown", "also.stays"]), tmp_path / "sorted"
+    args = criteriaSorter.parse_args(["sort", str(inbox), "-o", str(output), "--index"])
+    criteriaSorter.action_sort(args)
+    assert (output / "vids" / "film.mp4").is_file()
+    assert (output / index.DEFAULT_INDEX_FILE).is_file()
+
+    (inbox / "new.mp4").write_text("new")
+    sorted_files = []
+    sort = criteriaSorter.sort_handlers
+    monkeypatch.setattr(criteriaSorter, "sort_handlers",
+                        lambda handlers, *args: sort((sorted_files.append(h.name) or h for h in handlers), *args))
+    criteriaSorter.action_sort(args)
+    assert (output / "vids" / "new.mp4").is_file()
+    assert sorted_files == ["new.mp4"]
@@ -0,0 +1,119 @@
+#  Test file for journal.py
+import json
+import os
+import pytest
+from criteriaSorter.modules import journal, criteriaSorter
+
+
+def test_CancelJournal(tmp_path, monkeypatch):
+    syncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: syncs.append(fd) or fsync(fd))
+    path = tmp_path / "out" / "cancel.txt"
+
+    with journal.CancelJournal(str(path), flush_every=2, fsync_every=4, flush_interval=3600) as cancel_journal:
+        assert not path.exists()
+        cancel_journal.write("a", "dest/a")
+        assert path.read_text() == ""
+        cancel_journal.write("b", "dest/b")
+        assert path.read_text() == '{"origin": "a", "destination": "dest/a"}\n{"origin": "b", "destination": "dest/b"}\n'
+        cancel_journal.write_all([("c", "dest/c"), ("d", "dest/d"), ("e", "dest/e")])
+        assert len(syncs) == 1
+        assert path.read_text().count("\n") == 4
+    assert len(syncs) == 2
+    assert cancel_journal.count == 5
+    assert journal.parse_record(path.read_text().splitlines()[-1]) == {"origin": "e", "destination": "dest/e"}
+
+
+def test_CancelJournal_disabled(tmp_path):
+    with journal.CancelJournal(str(tmp_path / "cancel.txt"), enabled=False) as cancel_journal:
+        cancel_journal.write("a", "dest/a")
+    assert not (tmp_path / "cancel.txt").exists()
+
+
+def test_write_cancel_file(tmp_path):
+    criteriaSorter.write_cancel_file([], str(tmp_path / "empty.txt"), 0, False)
+    assert not (tmp_path / "empty.txt").exists()
+    criteriaSorter.write_cancel_file([], str(tmp_path / "empty.txt"), 4, True)
+    assert (tmp_path / "empty.txt").read_text() == ""
+    criteriaSorter.write_cancel_file([("a", "b")], str(tmp_path / "cancel.txt"), 0, False)
+    assert (tmp_path / "cancel.txt").read_text() == '{"origin": "a", "destination": "b"}\n'
+
+
+def test_parse_record():
+    assert journal.parse_record('{"origin": "a : b", "destination": "c"}\n') == {"origin": "a : b", "destination": "c"}
+    assert journal.parse_record('{"mkdir": "out/vids"}') == {"mkdir": "out/vids"}
+    assert journal.parse_record("path/a : path/b\n") == {"origin": "path/a", "destination": "path/b"}
+    for line in ["junk", '{"origin": "a"}', "a : b : c", "{not json"]:
+        with pytest.raises(ValueError):
+            journal.parse_record(line)
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 1 << 16])
+def test_read_lines_reversed(tmp_path, block_size):
+    (tmp_path / "lines").write_text("first\nsecond é\n\nlast\n", encoding="utf-8")
+    assert list(journal.read_lines_reversed(str(tmp_path / "lines"), block_size)) == ["", "last", "", "second é", "first"]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_sort_and_cancel(tmp_path, make_tree, jobs):
+    names = ["film{}.mp4".format(i) for i in range(50)] + ["Foo - bar.jpg", "notes : draft.txt", "stays.unknown"]
+    inbox, output = make_tree(names), tmp_path / "sorted"
+    (output / "vids").mkdir(parents=True)
+
+    args = criteriaSorter.parse_args(["--cancel_file", "cancel.txt", "sort", str(inbox), "-o", str(output), "-j", str(jobs)])
+    criteriaSorter.action_sort(args)
+    assert sorted(path.name for path in inbox.iterdir()) == ["stays.unknown"]
+    records = [json.loads(line) for line in (output / "cancel.txt").read_text().splitlines()]
+    created = {str(output / "Artists"), str(output / "Artists" / "Foo"), str(output / "others")}
+    assert {record["mkdir"] for record in records if "mkdir" in record} == created
+
+    args = criteriaSorter.parse_args(["--cancel_file", str(output / "cancel.txt"), "cancel", "-j", str(jobs)])
+    criteriaSorter.action_cancel(args)
+    assert sorted(path.name for path in inbox.iterdir()) == sorted(names)
+    assert sorted(path.name for path in output.iterdir()) == ["cancel.txt", "vids"]
+    assert not (output / "cancel.txt.progress").exists()
+
+
+def test_replay_resume(tmp_path):
+    path = tmp_path / "cancel.txt"
+    path.write_text("".join(json.dumps({"origin": "o{}".format(i), "destination": "d{}".format(i)}) + "\n" for i in range(10)))
+    undone = []
+
+    def undo(record):
+        if record["origin"] == "o4":
+            raise KeyboardInterrupt
+        undone.append(record["origin"])
+
+    with pytest.raises(KeyboardInterrupt):
+        journal.replay(str(path), checkpoint_every=2, undo=undo)
+    assert undone == ["o9", "o8", "o7", "o6", "o5"]
+    assert (tmp_path / "cancel.txt.progress").read_text() == "5"
+
+    undone.clear()
+    assert journal.replay(str(path), undo=lambda record: undone.append(record["origin"])) == 0
+    assert undone == ["o4", "o3", "o2", "o1", "o0"]
+    assert not (tmp_path / "cancel.txt.progress").exists()
+
+
+def test_replay_resume_directories(tmp_path, make_tree):
+    inbox, output = make_tree([]), make_tree(["A/A", "B/B", "C/C"], "sorted")
+    records = []
+    for name in ("A", "B", "C"):
+        records += [{"mkdir": str(output / name)}, {"origin": str(inbox / name), "destination": str(output / name / name)}]
+    path = tmp_path / "cancel.txt"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    def undo(record):
+        if record["origin"] == str(inbox / "B"):
+            os.rename(record["destination"], str(inbox / "B"))  # Undone past the checkpoint, then interrupted
+            raise KeyboardInterrupt
+        os.rename(record["destination"], record["origin"])
+
+    with pytest.raises(KeyboardInterrupt):
+        journal.replay(str(path), checkpoint_every=2, undo=undo)
+    assert (tmp_path / "cancel.txt.progress").read_text() == "2"  # The move and mkdir of C
+
+    assert journal.replay(str(path), jobs=4) == 0
+    assert sorted(child.name for child in inbox.iterdir()) == ["A", "B", "C"]
+    assert not output.exists() or list(output.iterdir()) == []
@@ -0,0 +1,85 @@
+#  Test file for pipeline.py
+import json
+import os
+import threading
+import pytest
+from criteriaSorter.modules import criteriaSorter, pipeline
+
+
+class FakeHandler:
+    def __init__(self, file_path, future_name):
+        self.file_path = file_path
+        self.future_name = future_name
+
+
+def sort_batch(batch):
+    return [FakeHandler(path, None if path.endswith(".keep") else "moved") for path in batch]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_run_pipeline(jobs):
+    events, moved, lock = [], [], threading.Lock()
+
+    def scan():
+        for i in range(200):
+            with lock:
+                events.append("scan")
+            yield "file{}{}".format(i, ".keep" if i % 10 == 0 else "")
+
+    def move(handler):
+        with lock:
+            events.append("move")
+            moved.append(handler.file_path)
+
+    assert pipeline.run_pipeline(scan(), sort_batch, move, jobs=jobs, batch_size=8) == 180
+    assert sorted(moved) == sorted("file{}".format(i) for i in range(200) if i % 10)
+    assert events.index("move") < len(events) - 1 - events[::-1].index("scan")  # Moves start before the end of the scan
+
+
+def test_run_pipeline_error():
+    def move(handler):
+        raise KeyboardInterrupt()
+
+    def scan():
+        yield from ("file{}".format(i) for i in range(100))
+        raise AssertionError("The scan should have been stopped")
+
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run_pipeline(scan(), sort_batch, move, batch_size=4)
+
+
+def test_run_pipeline_scan_error():
+    def scan():
+        yield "file0"
+        raise OSError("Unreadable directory")
+
+    moved = []
+    with pytest.raises(OSError):
+        pipeline.run_pipeline(scan(), sort_batch, lambda handler: moved.append(handler), batch_size=1)
+
+
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_action_sort_pipeline(tmp_path, make_tree, jobs):
+    inbox, output = make_tree(["Foo - bar.jpg", "film.mp4", "notes.txt", "stays.unknown", "sub/song.mp3"]), tmp_path / "sorted"
+    args = ["sort", str(inbox), "-o", str(output), "-r", "--engine", "pipeline", "-j", jobs, "--index"]
+    criteriaSorter.action_sort(criteriaSorter.parse_args(args))
+
+    for path in ["Artists/Foo/Foo - bar.jpg", "vids/film.mp4", "others/notes.txt", "audios/song.mp3"]:
+        assert output.joinpath(*path.split("/")).is_file()
+    assert (inbox / "stays.unknown").is_file()
+    records = [json.loads(line) for cancel_file in output.glob("cancel_*.txt") for line in cancel_file.read_text().splitlines()]
+    assert len([record for record in records if "origin" in record]) == 4
+    assert os.path.exists(output / ".criteriaSorter.index")
+
+
+@pytest.mark.parametrize("engine", ["pipeline", "handlers", "batch"])
+def test_action_sort_in_place(make_tree, engine):
+    inbox = make_tree(["notes{}.txt".format(i) for i in range(300)])
+    (inbox / "cancel.txt").write_text("")  # The cancel file of the run, in the sorted folder
+    args = ["--cancel_file", "cancel.txt", "sort", str(inbox), "-o", str(inbox), "--engine", engine]
+    criteriaSorter.action_sort(criteriaSorter.parse_args(args))
+
+    assert len(list((inbox / "others").iterdir())) == 300
+    records = [json.loads(line) for line in (inbox / "cancel.txt").read_text().splitlines()]
+    assert len(records) == 301  # The moves and the directory created
+    assert all(record.get("origin") != str(inbox / "cancel.txt") for record in records)
@@ -0,0 +1,85 @@
+#  Test file for planner.py
+import os
+import pytest
+from criteriaSorter.modules import criteriaSorter, fileops, planner
+
+
+def make_handlers(make_tree, files, destination="others/{obj.name}"):
+    inbox = make_tree(files)
+    handlers = []
+    for name in files:
+        handler = fileops.FileHandler(str(inbox.joinpath(*name.split("/"))))
+        handler.future_name = fileops.DestinationTemplate.cached(destination, fileops.FileHandler)
+        handlers.append(handler)
+    return handlers
+
+
+_FILES = {"a/cover.jpg": "first", "b/cover.jpg": "second", "c/cover.jpg": "first", "other.jpg": "x", "kept.txt": "kept"}
+
+
+@pytest.mark.parametrize("list_directories", [True, False])
+@pytest.mark.parametrize("policy, expected", [
+    ("suffix", ["cover (1).jpg", "cover (2).jpg", "cover (3).jpg", "other.jpg"]),
+    ("skip", ["other.jpg"]),
+    ("hash", ["cover (1).jpg", "other.jpg"]),  # a/cover.jpg and c/cover.jpg are duplicates of the one already there
+])
+def test_plan_moves(tmp_path, make_tree, monkeypatch, policy, expected, list_directories):
+    output = tmp_path / "sorted"
+    (output / "others").mkdir(parents=True)
+    (output / "others" / "cover.jpg").write_text("first")
+    handlers = make_handlers(make_tree, _FILES)
+    handlers[-1].future_name = None
+    if not list_directories:
+        monkeypatch.setattr(os, "listdir", lambda path: pytest.fail("{} was listed".format(path)))
+    move_planner = planner.MovePlanner(str(output), policy, list_directories)
+    plan = move_planner.plan_moves(handlers)
+    assert sorted(os.path.basename(target) for handler, target in plan) == expected
+    assert all(os.path.dirname(target) == str(output / "others") for handler, target in plan)
+    assert (move_planner.skipped, move_planner.duplicates) == {"suffix": (0, 0), "skip": (3, 0), "hash": (0, 2)}[policy]
+
+
+def test_plan_moves_between_sources(tmp_path, make_tree):
+    handlers = make_handlers(make_tree, {"a/cover.jpg": "same", "b/cover.jpg": "same", "c/cover.jpg": "other"})
+    plan = planner.MovePlanner(str(tmp_path / "sorted"), "hash").plan_moves(handlers)
+    assert [(handler.file_path, os.path.basename(target)) for handler, target in plan] == \
+        [(handlers[0].file_path, "cover.jpg"), (handlers[2].file_path, "cover (1).jpg")]
+
+
+def test_plan_moves_grouped(tmp_path, make_tree):
+    handlers = make_handlers(make_tree, ["a.jpg", "b.mp4", "c.jpg", "d.mp4"], destination="{obj.extension}/{obj.name}")
+    plan = planner.MovePlanner(str(tmp_path / "sorted")).plan_moves(handlers)
+    assert [os.path.basename(target) for handler, target in plan] == ["a.jpg", "c.jpg", "b.mp4", "d.mp4"]
+
+
+def test_MovePlanner_policy():
+    with pytest.raises(ValueError):
+        planner.MovePlanner(".", "overwrite")
+
+
+def test_same_content(tmp_path):
+    (tmp_path / "a").write_bytes(b"x" * 3000000)
+    (tmp_path / "b").write_bytes(b"x" * 3000000)
+    (tmp_path / "c").write_bytes(b"x" * 2999999 + b"y")
+    assert planner.same_content(str(tmp_path / "a"), str(tmp_path / "b"))
+    assert not planner.same_content(str(tmp_path / "a"), str(tmp_path / "c"))
+    assert not planner.same_content(str(tmp_path / "a"), str(tmp_path / "missing"))
+
+
+@pytest.mark.parametrize("engine", ["handlers", "pipeline"])
+def test_action_sort_collisions(tmp_path, make_tree, engine):
+    inbox, output = make_tree(["a/notes.txt", "b/notes.txt", "notes.txt"]), tmp_path / "sorted"
+    make_tree({"others/notes.txt": "already there"}, output)
+    criteriaSorter.action_sort(criteriaSorter.parse_args(["sort", str(inbox), "-o", str(output), "-r", "--engine", engine]))
+
+    assert (output / "others" / "notes.txt").read_text() == "already there"
+    assert sorted(path.read_text() for path in (output / "others").iterdir()) == ["a/notes.txt", "already there", "b/notes.txt", "notes.txt"]
+
+
+@pytest.mark.parametrize("engine", ["handlers", "pipeline"])
+def test_action_sort_duplicates(tmp_path, make_tree, engine):
+    inbox, output = make_tree({"a/notes.txt": "same content", "b/notes.txt": "same content"}), tmp_path / "sorted"
+    args = criteriaSorter.parse_args(["sort", str(inbox), "-o", str(output), "-r", "--on-collision", "hash", "--engine", engine])
+    criteriaSorter.action_sort(args)
+
+    assert [path.name for path in (output / "others").iterdir()] == ["notes.txt"]
+    assert len([path for path in inbox.rglob("notes.txt")]) == 1  # The duplicate is left in place, even once the first one moved
@@ -0,0 +1,74 @@
+#  Test file for profiling.py
+import time
+from criteriaSorter.modules import criteriaSorter, fileops, profiling
+
+
+class SlowHandler(fileops.FileHandler):
+    __slots__ = ()
+
+    def is_slow_and_lenient(self):
+        time.sleep(0.002)
+        return not self.name.startswith("z")
+
+
+_OPERATIONS = {
+    "operation_order": "pictures\nsmall\n",
+    "pictures": {"conditions": "is_slow_and_lenient\nis_image\n", "destination": "pictures/{obj.name}"},
+    "small": {"conditions": "is_smaller_than,100\n", "destination": "small/{obj.name}"},
+}
+
+_FILES = ["a.jpg", "b.txt", "c.mp4", "d.png", "z.jpg"]
+
+
+def make_handlers(root):
+    return list(criteriaSorter.generate_handlers_from_paths(sorted(str(path) for path in root.iterdir()), SlowHandler))
+
+
+def test_profile_operations(make_tree):
+    operation_list = criteriaSorter.create_operation_list(_OPERATIONS, SlowHandler)
+    profiled = profiling.profile_operations(operation_list)
+    handlers = make_handlers(make_tree(_FILES))
+    expected = [handler.sort(operation_list) for handler in handlers]
+    assert [handler.sort(profiled) for handler in handlers] == expected
+    assert not any(isinstance(operation, profiling.ProfiledOperation) for operation in operation_list)  # The operations are copied
+
+    pictures, small = profiled
+    assert (pictures.evaluations, pictures.matched, small.evaluations, small.matched) == (5, 2, 3, 3)
+    slow, image = pictures.conditions
+    assert (slow.calls, slow.passes, image.calls, image.passes) == (5, 4, 4, 2)
+    assert slow.cost > image.cost
+    assert str(small.conditions[0]) == "is_smaller_than,100"
+
+
+def test_suggest_order(make_tree):
+    inbox = make_tree(_FILES)
+    profiled = profiling.profile_operations(criteriaSorter.create_operation_list(_OPERATIONS, SlowHandler))
+    for handler in make_handlers(inbox):
+        handler.sort(profiled)
+    pictures, small = profiled
+    assert [condition.name for condition in profiling.suggest_order(pictures)] == ["is_image", "is_slow_and_lenient"]
+    assert profiling.suggest_order(small) == list(small.conditions)
+    reordered = fileops.Operation("pictures", profiling.suggest_order(pictures), pictures.destination)
+    assert [handler.sort([reordered, small]) for handler in make_handlers(inbox)] == \
+        [handler.sort(profiled) for handler in make_handlers(inbox)]
+
+
+def test_rank():
+    never_called = profiling.ProfiledCondition("is_image", fileops.FileHandler.is_image)
+    always_passes = profiling.ProfiledCondition("is_image", fileops.FileHandler.is_image)
+    always_passes.calls, always_passes.passes, always_passes.seconds = 10, 10, 0.001
+    selective = profiling.ProfiledCondition("is_image", fileops.FileHandler.is_image)
+    selective.calls, selective.passes, selective.seconds = 10, 1, 0.01
+    assert profiling.rank(never_called) == profiling.rank(always_passes) == float("inf")
+    assert profiling.rank(selective) < profiling.rank(always_passes)
+
+
+def test_action_sort_profile(tmp_path, make_tree, capsys, caplog):
+    inbox = make_tree(["Foo - bar.jpg", "film.mp4", "notes.txt"])
+    args = criteriaSorter.parse_args(["sort", str(inbox), "-o", str(tmp_path / "sorted"), "--profile", "--engine", "batch"])
+    criteriaSorter.action_sort(args)
+    assert args.engine == "handlers"
+    assert "sorted one handler at a time" in caplog.text
+    output = capsys.readouterr().out
+    assert "has_artist" in output and "1 matched / 3 tried" in output
+    assert (tmp_path / "sorted" / "vids" / "film.mp4").is_file()
@@ -0,0 +1,63 @@
+#  Test file for sniffing.py
+import pytest
+from criteriaSorter.modules import sniffing, fileops
+
+_HEADERS = [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00", "image"),
+    (b"GIF89a\x01\x00", "image"),
+    (b"BM6\x00\x00\x00\x00\x00\x00\x006\x00\x00\x00(\x00\x00\x00", "image"),
+    (b"BMW is not a bitmap", None),
+    (b"\x00\x00\x00\x18ftypmp42", "video"),
+    (b"\x00\x00\x00\x20ftypM4A \x00", "music"),
+    (b"RIFF\x00\x00\x00\x00AVI LIST", "video"),
+    (b"RIFF\x00\x00\x00\x00WAVEfmt ", "music"),
+    (b"\x1aE\xdf\xa3\x01\x00", "video"),
+    (b"ID3\x03\x00", "music"),
+    (b"\xff\xfb\x90\x00", "music"),
+    (b"fLaC\x00\x00", "music"),
+    (b"%PDF-1.7\n", "document"),
+    (b"PK\x03\x04\x14\x00\x06\x00[Content_Types].xml", "document"),
+    (b"PK\x03\x04\x14\x00\x00\x00archive.bin", None),
+    (b"just some text", None),
+    (b"", None),
+]
+
+
+@pytest.mark.parametrize("header, expected", _HEADERS)
+def test_guess_type_from_header(header, expected):
+    assert sniffing.guess_type_from_header(header) == expected
+
+
+def test_sniff_type(tmp_path):
+    (tmp_path / "picture").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 2000)
+    assert sniffing.read_header(str(tmp_path / "picture")) == b"\x89PNG\r\n\x1a\n" + b"\x00" * (sniffing.HEADER_SIZE - 8)
+    assert sniffing.sniff_type(str(tmp_path / "picture")) == "image"
+    assert sniffing.sniff_type(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.parametrize("sniff, name, expected, reads", [
+    (None, "picture", None, 0),
+    (None, "picture.pdf", "document", 0),
+    ("unknown", "picture", "image", 1),
+    ("unknown", "picture.pdf", "document", 0),
+    ("always", "picture.pdf", "image", 1),
+    ("always", "notes.txt", "document", 1),
+])
+def test_FileHandler_sniff(tmp_path, monkeypatch, sniff, name, expected, reads):
+    (tmp_path / name).write_bytes(b"\x89PNG\r\n\x1a\n" if name != "notes.txt" else b"notes")
+    read_header = sniffing.read_header
+    calls = []
+    monkeypatch.setattr(sniffing, "read_header", lambda path: calls.append(path) or read_header(path))
+    monkeypatch.setattr(fileops.FileHandler, "sniff", None)
+
+    fileops.FileHandler.configure(sniff=sniff)
+    handler = fileops.FileHandler(str(tmp_path / name))
+    assert calls == []
+    assert handler.type == expected
+    assert handler.is_unknown() is (expected is None)
+    assert handler.is_image() is (expected == "image")
+    assert len(calls) == reads
+
+    with pytest.raises(ValueError):
+        fileops.FileHandler.configure(sniff="sometimes")
@@ -0,0 +1,97 @@
+#  Test file for stats.py
+import json
+import logging
+import time
+import pytest
+from criteriaSorter.modules import criteriaSorter, fileops, stats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()  # The phases are timed exactly, the sleeps of the OS are too coarse on some platforms
+    monkeypatch.setattr(time, "perf_counter", fake_clock.perf_counter)
+    return fake_clock
+
+
+def slow(items, delay, clock):
+    for item in items:
+        clock.sleep(delay)
+        yield item
+
+
+def test_timed(clock):
+    run_stats = stats.RunStats()
+    inner = run_stats.timed("inner", slow(range(5), 0.01, clock), counter="items")
+    outer = run_stats.timed("outer", slow(inner, 0.002, clock))
+    assert list(outer) == list(range(5))
+    assert list(run_stats.phases) == ["inner", "outer"]
+    assert run_stats.phases["inner"] == pytest.approx(0.05)
+    assert run_stats.phases["outer"] == pytest.approx(0.01)  # Without the time of the inner phase
+    assert run_stats.counters["items"] == 5
+
+
+def test_timed_chain(clock):
+    run_stats = stats.RunStats()
+    chained = run_stats.timed("first", slow(range(5), 0.01, clock))
+    for name in ("second", "third"):
+        chained = run_stats.timed(name, slow(chained, 0, clock))
+    with run_stats.phase("last"):
+        assert list(chained) == list(range(5))
+    assert run_stats.phases["first"] == pytest.approx(0.05)
+    assert all(run_stats.phases[name] == pytest.approx(0) for name in ("second", "third", "last"))  # The time of the first phase is counted once
+
+
+def test_errors():
+    with stats.RunStats() as run_stats:
+        logging.error("[File sorting] Could not sort a.jpg")
+        logging.error(OSError("Details of the error"))
+        logging.error("[File moving] Could not move b.jpg")
+        logging.error("Something else")
+        logging.warning("[File sorting] Not an error")
+    logging.error("[File sorting] After the run")
+    assert run_stats.errors == {"File sorting": 1, "File moving": 1, "other": 1}
+    assert "total" in run_stats.phases
+
+
+def test_count_matches(tmp_path, make_tree):
+    operation_list = criteriaSorter.create_operation_list({
+        "operation_order": "images\nvideos\nalso_images\n",
+        "images": {"conditions": "is_image\n", "destination": "images/{obj.name}"},
+        "videos": {"conditions": "is_video\nis_bigger_than,0\n", "destination": "videos/{obj.name}"},
+        "also_images": {"conditions": "is_image\n", "destination": "images/{obj.name}"},
+    }, fileops.FileHandler)
+    make_tree(["a.jpg", "b.png", "c.mp4", "d.txt"], tmp_path)
+    handlers = criteriaSorter.generate_handlers_from_paths(sorted(str(path) for path in tmp_path.iterdir()), fileops.FileHandler)
+    run_stats = stats.RunStats()
+    sorted_handlers = criteriaSorter.sort_handlers(handlers, operation_list, "others/{obj.name}")
+    assert len(list(run_stats.count_matches(sorted_handlers, operation_list, "others/{obj.name}"))) == 4
+    assert run_stats.matches == {"images": 2, "videos": 1, "default destination": 1}
+    assert run_stats.counters["stat"] == 1  # Only the video needed its size
+
+
+@pytest.mark.parametrize("engine", ["handlers", "batch", "pipeline"])
+def test_action_sort_stats(tmp_path, make_tree, capsys, engine):
+    inbox, output = make_tree(), tmp_path / "sorted"
+    args = ["sort", str(inbox), "-o", str(output), "--engine", engine, "--stats", "json", "--index"]
+    criteriaSorter.action_sort(criteriaSorter.parse_args(args))
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["counters"]["files scanned"] == 4
+    assert report["counters"]["rename"] == 3
+    assert report["counters"]["mkdir"] == 4  # Artists, Artists/Foo, vids and others, the output was created for the index
+    assert {"config", "scan", "total"} <= set(report["phases"])
+    if engine == "handlers":
+        assert report["matches"] == {"operation1": 1, "operation2": 1, "operation4": 1, "no match": 1}
+        assert list(report["phases"]) == ["config", "handlers", "index", "moves", "plan", "scan", "sort", "total"]  # Sorted keys in JSON
+    assert report["errors"] == {}
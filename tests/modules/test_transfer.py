@@ -0,0 +1,97 @@
+#  Test file for transfer.py
+import errno
+import json
+import os
+import pytest
+from criteriaSorter.modules import criteriaSorter, transfer
+
+
+def cross_device_rename(renamed):
+    def rename(source, destination):
+        renamed.append(source)
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    return rename
+
+
+def make_file(path, content=b"content" * 1000, mode=0o640, mtime_ns=1_500_000_000_123_456_700):  # In the 100 ns ticks of NTFS
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    os.chmod(str(path), mode)
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+    return path
+
+
+@pytest.mark.parametrize("unsupported", [(), ("copy_file_range",), ("copy_file_range", "sendfile")])
+def test_copy_and_unlink(tmp_path, monkeypatch, unsupported):
+    for name in unsupported:
+        monkeypatch.delattr(os, name, raising=False)
+    source = make_file(tmp_path / "inbox" / "film.mp4")
+    destination = tmp_path / "output" / "film.mp4"
+    destination.parent.mkdir()
+    transfer.copy_and_unlink(str(source), str(destination))
+    assert not source.exists()
+    assert destination.read_bytes() == b"content" * 1000
+    stat_result = destination.stat()
+    assert stat_result.st_mtime_ns == 1_500_000_000_123_456_700
+    if os.name == "posix":  # Windows only keeps the read only flag of the mode
+        assert stat_result.st_mode & 0o777 == 0o640
+
+
+def test_copy_and_unlink_socket_only_sendfile(tmp_path, monkeypatch):
+    def sendfile(out_fd, in_fd, offset, count):
+        raise OSError(errno.ENOTSOCK, os.strerror(errno.ENOTSOCK))
+
+    monkeypatch.delattr(os, "copy_file_range", raising=False)
+    monkeypatch.setattr(os, "sendfile", sendfile, raising=False)
+    source = make_file(tmp_path / "inbox" / "film.mp4")
+    destination = tmp_path / "film.mp4"
+    transfer.copy_and_unlink(str(source), str(destination))
+    assert not source.exists()
+    assert destination.read_bytes() == b"content" * 1000
+
+
+def test_copy_and_unlink_keeps_the_origin(tmp_path):
+    source = make_file(tmp_path / "inbox" / "film.mp4")
+    destination = make_file(tmp_path / "output" / "film.mp4", b"already there")
+    with pytest.raises(FileExistsError):
+        transfer.copy_and_unlink(str(source), str(destination))
+    assert source.read_bytes() == b"content" * 1000
+    assert destination.read_bytes() == b"already there"
+
+
+def test_mover(tmp_path, monkeypatch):
+    renamed = []
+    monkeypatch.setattr(os, "rename", cross_device_rename(renamed))
+    mover = transfer.Mover(copy_jobs=1)
+    for name in ("a.mp4", "b.mp4", "c.mp4"):
+        mover(str(make_file(tmp_path / "inbox" / name)), str(tmp_path / name))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.mp4", "b.mp4", "c.mp4", "inbox"]
+    assert list((tmp_path / "inbox").iterdir()) == []
+    assert len(renamed) == 1  # The next files are copied without trying os.rename
+    assert mover.copied == 3
+
+
+def test_mover_same_device(tmp_path):
+    mover = transfer.Mover()
+    mover(str(make_file(tmp_path / "inbox" / "a.mp4")), str(tmp_path / "a.mp4"))
+    assert (tmp_path / "a.mp4").exists()
+    assert mover.copied == 0
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_sort_and_cancel_across_devices(tmp_path, make_tree, monkeypatch, jobs):
+    monkeypatch.setattr(os, "rename", cross_device_rename([]))
+    names = ["film{}.mp4".format(i) for i in range(10)]
+    inbox, output = make_tree(names), tmp_path / "sorted"
+
+    args = criteriaSorter.parse_args(["--cancel_file", "cancel.txt", "sort", str(inbox), "-o", str(output), "-j", str(jobs)])
+    criteriaSorter.action_sort(args)
+    assert list(inbox.iterdir()) == []
+    assert sorted(path.name for path in (output / "vids").iterdir()) == sorted(names)
+    records = [json.loads(line) for line in (output / "cancel.txt").read_text().splitlines()]
+    assert sorted(os.path.basename(record["origin"]) for record in records if "origin" in record) == sorted(names)
+
+    args = criteriaSorter.parse_args(["--cancel_file", str(output / "cancel.txt"), "cancel", "-j", str(jobs)])
+    criteriaSorter.action_cancel(args)
+    assert sorted(path.name for path in inbox.iterdir()) == sorted(names)
+    assert all((inbox / name).read_bytes() == name.encode() for name in names)
@@ -0,0 +1,119 @@
+#  Test file for watch.py
+import os
+import shutil
+import struct
+import threading
+import time
+import pytest
+from criteriaSorter.modules import criteriaSorter, watch
+
+
+def inotify_available(tmp_path):
+    try:
+        watch.InotifyWatcher(str(tmp_path)).close()
+        return True
+    except (OSError, TypeError, AttributeError):
+        return False
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_parse_events():
+    data = struct.pack("iIII", 1, watch.IN_CLOSE_WRITE, 0, 16) + b"a.jpg".ljust(16, b"\0")
+    data += struct.pack("iIII", 2, watch.IN_CREATE | watch.IN_ISDIR, 0, 8) + b"sub".ljust(8, b"\0")
+    data += struct.pack("iIII", 2, watch.IN_IGNORED, 0, 0)
+    assert list(watch.parse_events(data)) == [(1, watch.IN_CLOSE_WRITE, "a.jpg"), (2, watch.IN_CREATE | watch.IN_ISDIR, "sub"),
+                                              (2, watch.IN_IGNORED, "")]
+
+
+def test_Debouncer(tmp_path):
+    debouncer = watch.Debouncer(settle=0.2)
+    growing, gone = tmp_path / "growing.mp4", tmp_path / "gone.jpg"
+    growing.write_bytes(b"x")
+    gone.write_bytes(b"x")
+    debouncer.add(str(growing))
+    debouncer.add(str(gone))
+    assert debouncer.ready() == []
+    gone.unlink()
+    time.sleep(0.25)
+    growing.write_bytes(b"xx")  # Still being written
+    assert debouncer.ready() == []
+    assert len(debouncer) == 1
+    time.sleep(0.25)
+    assert debouncer.ready() == [str(growing)]
+    assert len(debouncer) == 0
+
+
+def test_PollingWatcher(tmp_path):
+    (tmp_path / "old.jpg").write_bytes(b"x")
+    (tmp_path / "sub").mkdir()
+    watcher = watch.PollingWatcher(str(tmp_path), recursive=True, interval=0.05)
+    (tmp_path / "new.jpg").write_bytes(b"x")
+    (tmp_path / "sub" / "deep.jpg").write_bytes(b"x")
+    time.sleep(0.06)
+    assert sorted(watcher.read(1.0)) == sorted([str(tmp_path / "new.jpg"), str(tmp_path / "sub" / "deep.jpg")])
+    assert watcher.read(0.2) == []
+
+
+def test_InotifyWatcher(tmp_path):
+    if not inotify_available(tmp_path):
+        pytest.skip("inotify is not available")
+    excluded = tmp_path / "excluded"
+    excluded.mkdir()
+    watcher = watch.InotifyWatcher(str(tmp_path), recursive=True, exclude={str(excluded)})
+    try:
+        found = set()
+        (tmp_path / "new.jpg").write_bytes(b"x")
+        (excluded / "ignored.jpg").write_bytes(b"x")
+        (tmp_path / "sub" / "deeper").mkdir(parents=True)
+        (tmp_path / "sub" / "deeper" / "deep.jpg").write_bytes(b"x")
+        assert wait_for(lambda: found.update(watcher.read(0.1)) or {str(tmp_path / "new.jpg"), str(tmp_path / "sub" / "deeper" / "deep.jpg")} <= found)
+        assert str(excluded / "ignored.jpg") not in found
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize("polling", [True, False])
+def test_action_watch(tmp_path, make_tree, polling):
+    if not polling and not inotify_available(tmp_path):
+        pytest.skip("inotify is not available")
+    inbox, output = make_tree({"film.mp4": "already there"}), tmp_path / "sorted"
+    args = ["watch", str(inbox), "-o", str(output), "--settle", "0.1", "--interval", "0.05"] + (["--polling"] if polling else [])
+    stop = threading.Event()
+    thread = threading.Thread(target=criteriaSorter.action_watch, args=(criteriaSorter.parse_args(args), stop))
+    thread.start()
+    try:
+        assert wait_for(lambda: (output / "vids" / "film.mp4").is_file())
+        (inbox / "Foo - bar.jpg").write_text("new")
+        (inbox / "stays.unknown").write_text("new")
+        assert wait_for(lambda: (output / "Artists" / "Foo" / "Foo - bar.jpg").is_file())
+        shutil.rmtree(str(output / "vids"))  # An output folder removed while watching is created again
+        (inbox / "clip.mp4").write_text("new")
+        assert wait_for(lambda: (output / "vids" / "clip.mp4").is_file())
+    finally:
+        stop.set()
+        thread.join()
+    assert (inbox / "stays.unknown").is_file()
+    cancel_files = list(output.glob("cancel_*.txt"))
+    assert len(cancel_files) == 1
+    assert cancel_files[0].read_text().count('"origin"') == 3
+    assert not os.path.exists(inbox / "film.mp4")
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("inbox/a.jpg", True),
+    ("inbox/sub/a.jpg", True),
+    ("inbox/sorted/a.jpg", False),  # Excluded
+    ("archive/a.jpg", False),
+    ("inbox2/a.jpg", False),
+])
+def test_is_watched(tmp_path, path, expected):
+    exclude = {str(tmp_path / "inbox" / "sorted")}
+    assert watch.is_watched(str(tmp_path / path), str(tmp_path / "inbox"), exclude) is expected